@@ -0,0 +1,117 @@
+"""Theme assets and their content fingerprinted names for mysgen."""
+from __future__ import annotations
+import os
+import json
+import logging
+from typing import Callable
+from pathlib import Path
+from os.path import join
+from distutils.errors import DistutilsFileError
+from mysgen.sinks import Sink
+from mysgen.changes import file_digest
+
+
+logger = logging.getLogger(__name__)
+
+
+ASSETS = ("js", "css")
+MANIFEST = "manifest.json"
+HASH_LENGTH = 10
+
+
+def fingerprint(name: str | Path, digest: str) -> str:
+    """
+    Insert a content hash before the suffix of a file name.
+
+    Args:
+        name: file name or path
+        digest: hex digest of the content
+
+    Returns:
+        fingerprinted posix path, e.g. css/foo.3f2a9c01be.css
+    """
+    path = Path(name)
+    return path.with_name(
+        path.stem + "." + digest[:HASH_LENGTH] + path.suffix
+    ).as_posix()
+
+
+class Assets:
+    """
+    Theme assets, the js and css directories, and their URLs.
+
+    With fingerprinting every file is copied to a name carrying a hash of its
+    content, so it can be served with far-future cache headers and only changed
+    files get new URLs. The manifest maps asset paths to their output paths, it
+    is written to the build as manifest.json and used by asset_url in templates.
+    """
+
+    def __init__(
+        self,
+        theme_path: str | Path,
+        build_path: str | Path,
+        fingerprint: bool = False,
+        digest: Callable[[Path], str] = file_digest,
+    ) -> None:
+        """
+        Initialise assets object.
+
+        Args:
+            theme_path: theme directory holding the assets
+            build_path: build directory
+            fingerprint: copy assets to content hashed names
+            digest: content hash of a file, e.g. from a stat index
+        """
+        self.theme_path = Path(theme_path)
+        self.build_path = Path(build_path)
+        self.fingerprint = fingerprint
+        self.digest = digest
+        self.manifest: dict[str, str] = {}
+        if fingerprint:
+            self.scan()
+
+    def scan(self) -> None:
+        """Hash assets and fill the manifest."""
+        self.manifest = {}
+        for asset in ASSETS:
+            for path, _, files in sorted(os.walk(self.theme_path / asset)):
+                for name in sorted(files):
+                    file = Path(path, name)
+                    key = file.relative_to(self.theme_path).as_posix()
+                    self.manifest[key] = fingerprint(key, self.digest(file))
+
+    def url(self, path: str) -> str:
+        """
+        Site URL of an asset, fingerprinted if enabled.
+
+        Args:
+            path: asset path relative to the theme, e.g. css/foo.css
+
+        Returns:
+            url string
+        """
+        return join("/", self.manifest.get(path.lstrip("/"), path.lstrip("/")))
+
+    def copy(self, sink: Sink) -> None:
+        """
+        Copy assets to the output, and the manifest if fingerprinting.
+
+        Args:
+            sink: output sink
+        """
+        if self.fingerprint:
+            for key, name in self.manifest.items():
+                sink.copy_file(self.theme_path / key, self.build_path / name)
+
+            sink.write_bytes(
+                self.build_path / MANIFEST,
+                json.dumps(self.manifest, indent=2, sort_keys=True).encode("utf-8"),
+            )
+            return
+
+        for asset in ASSETS:
+            from_asset = self.theme_path / asset
+            try:
+                sink.copy_tree(from_asset, self.build_path / asset)
+            except DistutilsFileError:
+                logger.info("File {from_path} not found.".format(from_path=from_asset))
@@ -0,0 +1,267 @@
+"""Markdown backends, Python-Markdown and markdown-it-py, for mysgen."""
+from __future__ import annotations
+import re
+import json
+import difflib
+import logging
+import markdown
+from typing import Any, Callable
+from pathlib import Path
+
+try:
+    from markdown_it import MarkdownIt
+    from markdown_it.rules_inline import StateInline
+except ImportError:  # pragma: no cover
+    MarkdownIt = None  # type: ignore
+    StateInline = Any  # type: ignore
+
+
+logger = logging.getLogger(__name__)
+
+
+MARKDOWN_BACKEND = "markdown"
+EXTENSION_PREFIX = "markdown.extensions."
+META = re.compile(r"^[ ]{0,3}(?P<key>[A-Za-z0-9_-]+):\s*(?P<value>.*)")
+META_MORE = re.compile(r"^[ ]{4,}(?P<value>.*)")
+META_BEGIN = re.compile(r"^-{3}(\s.*)?")
+META_END = re.compile(r"^(-{3}|\.{3})(\s.*)?")
+MATH = (
+    (re.compile(r"\$\$([^$]+)\$\$", re.DOTALL), 1, True),
+    (re.compile(r"\\\[(.+?)\\\]", re.DOTALL), 1, True),
+    (re.compile(r"\\begin{([a-z]+?\*?)}(.+?)\\end{\1}", re.DOTALL), 0, True),
+    (re.compile(r"\\\((.+?)\\\)", re.DOTALL), 1, False),
+)
+TAG_SPACE = re.compile(r">\s+<")
+
+
+def split_meta(source: str) -> tuple[dict[str, list[str]], str]:
+    """
+    Split the metadata header off a Markdown source, as the meta extension does.
+
+    Keys are lower case, values are lists of lines, indented lines continue the
+    previous key. The header may be fenced by --- lines and ends at a blank line.
+
+    Args:
+        source: Markdown source
+
+    Returns:
+        metadata and the remaining source
+    """
+    lines = source.split("\n")
+    meta: dict[str, list[str]] = {}
+    key = ""
+    if lines and META_BEGIN.match(lines[0]):
+        lines.pop(0)
+
+    while lines:
+        line = lines.pop(0)
+        match = META.match(line)
+        if line.strip() == "" or META_END.match(line):
+            break
+
+        if match:
+            key = match.group("key").lower().strip()
+            meta.setdefault(key, []).append(match.group("value").strip())
+            continue
+
+        more = META_MORE.match(line)
+        if more and key:
+            meta[key].append(more.group("value").strip())
+        else:
+            lines.insert(0, line)
+            break
+
+    return meta, "\n".join(lines)
+
+
+def _math(state: StateInline, silent: bool) -> bool:
+    """
+    Inline rule for $$...$$, \\[...\\], \\begin...\\end and \\(...\\) math.
+
+    Args:
+        state: inline parser state
+        silent: only validate, do not push tokens
+
+    Returns:
+        whether math starts at the current position
+    """
+    if state.src[state.pos] not in "$\\" or (
+        state.pos > 0 and state.src[state.pos - 1] == "\\"
+    ):
+        return False
+
+    for pattern, group, display in MATH:
+        match = pattern.match(state.src, state.pos)
+        if match:
+            if not silent:
+                token = state.push("math", "script", 0)
+                token.content = match.group(group)
+                token.meta = {"display": display}
+            state.pos = match.end()
+            return True
+
+    return False
+
+
+def _render_math(self: Any, tokens: list[Any], idx: int, *args: Any) -> str:
+    """
+    Render a math token as a MathJax script element, as mdx_math does.
+
+    Args:
+        self: renderer
+        tokens: tokens
+        idx: index of the math token
+        args: options and environment
+
+    Returns:
+        HTML
+    """
+    token = tokens[idx]
+    return '<script type="math/tex{mode}">{content}</script>'.format(
+        mode="; mode=display" if token.meta["display"] else "",
+        content=token.content,
+    )
+
+
+class MarkdownItConverter:
+    """
+    CommonMark converter on markdown-it-py with the Python-Markdown interface.
+
+    Python-Markdown extensions are mapped to markdown-it rules: meta to the
+    same metadata header, fenced_code to fences, which are otherwise disabled,
+    mdx_math to script elements for the same delimiters, tables and footnotes.
+    """
+
+    def __init__(self, extensions: list[Any]) -> None:
+        """
+        Initialise markdown-it converter object.
+
+        Args:
+            extensions: Python-Markdown extension names
+
+        Raises:
+            ImportError: if markdown-it-py is not installed
+            NotImplementedError: if an extension has no markdown-it mapping
+        """
+        if MarkdownIt is None:
+            raise ImportError(
+                "Package markdown-it-py not installed, install mysgen[markdown-it]."
+            )
+
+        names = [str(name).replace(EXTENSION_PREFIX, "") for name in extensions]
+        self.md = MarkdownIt("commonmark")
+        self.meta = "meta" in names
+        self.Meta: dict[str, list[str]] = {}
+        if "fenced_code" not in names:
+            self.md.disable("fence")
+
+        for name in names:
+            if name in ("meta", "fenced_code"):
+                continue
+            if name == "mdx_math":
+                self.md.inline.ruler.before("escape", "math", _math)
+                self.md.add_render_rule("math", _render_math)
+            elif name == "tables":
+                self.md.enable("table")
+            elif name == "footnotes":
+                from mdit_py_plugins.footnote import footnote_plugin
+
+                self.md.use(footnote_plugin)
+            else:
+                raise NotImplementedError(
+                    "Markdown extension {name} not supported by markdown-it.".format(
+                        name=name
+                    )
+                )
+
+    def convert(self, source: str) -> str:
+        """
+        Convert Markdown to HTML, and set Meta if the meta extension is used.
+
+        Args:
+            source: Markdown source
+
+        Returns:
+            HTML
+        """
+        if self.meta:
+            self.Meta, source = split_meta(source)
+
+        return self.md.render(source).rstrip("\n")
+
+    def reset(self) -> MarkdownItConverter:
+        """
+        Reset the converter state.
+
+        Returns:
+            the converter
+        """
+        self.Meta = {}
+        return self
+
+
+BACKENDS: dict[str, Callable[[list[Any]], Any]] = {
+    "markdown": lambda extensions: markdown.Markdown(extensions=extensions),
+    "markdown-it": MarkdownItConverter,
+}
+
+
+def converter(backend: str, extensions: list[Any]) -> Any:
+    """
+    Markdown converter of a backend.
+
+    Args:
+        backend: backend name, markdown or markdown-it
+        extensions: Python-Markdown extension names
+
+    Returns:
+        converter with convert, reset and Meta
+
+    Raises:
+        NotImplementedError: if the backend is unknown
+    """
+    if backend not in BACKENDS:
+        raise NotImplementedError(
+            "Markdown backend {backend} not implemented.".format(backend=backend)
+        )
+
+    return BACKENDS[backend](extensions)
+
+
+def compare(
+    paths: list[Path], extensions: list[Any], backends: tuple[str, str]
+) -> dict[str, str]:
+    """
+    Diff the metadata and HTML of two backends for Markdown files.
+
+    Whitespace between tags is ignored, so only differences in content and
+    structure are reported.
+
+    Args:
+        paths: Markdown files
+        extensions: Python-Markdown extension names
+        backends: names of the two backends
+
+    Returns:
+        unified diff by path, of the files that differ
+    """
+    converters = [converter(backend, extensions) for backend in backends]
+    diffs = {}
+    for path in paths:
+        source = path.read_text()
+        outputs = []
+        for md in converters:
+            html = TAG_SPACE.sub("><", md.convert(source)).strip()
+            meta = json.dumps(getattr(md, "Meta", {}), sort_keys=True)
+            outputs.append(["Meta: " + meta] + html.replace("><", ">\n<").split("\n"))
+            md.reset()
+
+        diff = "\n".join(
+            difflib.unified_diff(
+                outputs[0], outputs[1], backends[0], backends[1], lineterm=""
+            )
+        )
+        if diff:
+            diffs[path.as_posix()] = diff
+
+    return diffs
@@ -0,0 +1,123 @@
+"""Memoised rendering of fenced code and math blocks for mysgen."""
+from __future__ import annotations
+import re
+import json
+import hashlib
+import logging
+from typing import Any
+from markdown import Markdown
+
+
+logger = logging.getLogger(__name__)
+
+
+BLOCK_CACHE_SIZE = 10000
+FENCE = re.compile(
+    r"^(?P<fence>`{3,}|~{3,})[^\n]*\n(?:.*?\n)??(?P=fence)[ \t]*$",
+    re.MULTILINE | re.DOTALL,
+)
+MATH = re.compile(
+    r"(?:(?<=\n\n)|\A)(?P<math>\$\$(?:(?!\n\s*\n).)*?\$\$)[ \t]*(?=\n\s*\n|\n?\Z)",
+    re.DOTALL,
+)
+TOKEN = "mysgenblock{digest}x"
+TOKEN_HTML = re.compile(r"<p>(mysgenblock[0-9a-f]{16}x)</p>|(mysgenblock[0-9a-f]{16}x)")
+
+
+class BlockCache:
+    """
+    Render fenced code and display math blocks once.
+
+    Blocks are cut out of the source before the Markdown conversion, rendered
+    on their own, and put back into the converted HTML. The HTML of a block is
+    cached by its text, which includes its language and options, and by the
+    converter settings, so it is reused across posts and builds. The cache keeps the
+    most recently used blocks up to its size.
+    """
+
+    def __init__(
+        self,
+        cache: dict[str, Any],
+        settings: Any,
+        size: int = BLOCK_CACHE_SIZE,
+    ) -> None:
+        """
+        Initialise block cache object.
+
+        Args:
+            cache: rendered blocks of earlier builds, updated in place
+            settings: converter backend and extensions, part of the block keys
+            size: maximum number of cached blocks
+        """
+        cache["build"] = cache.get("build", 0) + 1
+        cache.setdefault("blocks", {})
+        self.cache = cache
+        self.size = size
+        self.prefix = json.dumps(settings, default=str)
+        self.rendered = 0
+
+    def convert(self, markdown: Markdown, source: str) -> str:
+        """
+        Convert Markdown with memoised blocks.
+
+        Blocks are rendered before the document, so the state of the converter,
+        like its Meta, belongs to the document afterwards.
+
+        Args:
+            markdown: Markdown converter, of any backend
+            source: Markdown source
+
+        Returns:
+            HTML
+        """
+        html_blocks: dict[str, str] = {}
+
+        def stash(match: re.Match) -> str:
+            block = match.group(0)
+            digest = hashlib.sha256((self.prefix + block).encode("utf-8")).hexdigest()
+            token = TOKEN.format(digest=digest[:16])
+            html_blocks[token] = self._render(markdown, digest, block)
+            return token
+
+        text = FENCE.sub(lambda m: "\n" + stash(m) + "\n", source)
+        text = MATH.sub(stash, text)
+        html = markdown.convert(text)
+        if not html_blocks:
+            return html
+
+        return TOKEN_HTML.sub(
+            lambda m: html_blocks.get(m.group(1) or m.group(2), m.group(0)), html
+        )
+
+    def _render(self, markdown: Markdown, digest: str, block: str) -> str:
+        """
+        Render a block, or take it from the cache.
+
+        Args:
+            markdown: Markdown converter
+            digest: block key
+            block: block source
+
+        Returns:
+            HTML of the block
+        """
+        blocks = self.cache["blocks"]
+        if digest not in blocks:
+            blocks[digest] = [markdown.convert(block), 0]
+            markdown.reset()
+            self.rendered += 1
+
+        blocks[digest][1] = self.cache["build"]
+        return blocks[digest][0]
+
+    def prune(self) -> None:
+        """Keep the most recently used blocks up to the cache size."""
+        blocks = self.cache["blocks"]
+        if len(blocks) > self.size:
+            recent = sorted(blocks, key=lambda digest: blocks[digest][1], reverse=True)
+            for digest in recent[self.size :]:
+                del blocks[digest]
+
+        logger.info(
+            "Rendered {count} code and math blocks.".format(count=self.rendered)
+        )
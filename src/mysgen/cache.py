@@ -0,0 +1,557 @@
+"""Persistent build cache for mysgen."""
+from __future__ import annotations
+import io
+import sys
+import json
+import shutil
+import hashlib
+import logging
+import tarfile
+import argparse
+import tempfile
+from typing import Any, Iterator, MutableMapping
+from pathlib import Path, PurePosixPath
+from os import makedirs, remove, replace, walk
+from jinja2.bccache import Bucket, BytecodeCache
+
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_FORMAT = 1
+MANIFEST = "cache.json"
+REFERENCES = "references"
+BLOBS = "blobs"
+TEMPLATES = "templates"
+READ_BUFFER = 1 << 16
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    """
+    Write a file through a temporary file, so it is never seen half written.
+
+    Args:
+        path: file path
+        data: file content
+    """
+    makedirs(path.parent, exist_ok=True)
+    tmp_file = path.with_name(path.name + ".tmp")
+    with open(tmp_file, "wb") as file:
+        file.write(data)
+    replace(tmp_file, path)
+
+
+class Blobs(MutableMapping):
+    """
+    Binary cache entries by content key, a file each, e.g. image thumbnails.
+
+    A None value, e.g. an image too small for a thumbnail, is an empty file.
+    Keys read or written are recorded as used, for garbage collection.
+    """
+
+    def __init__(self, path: Path, used: set[str]) -> None:
+        """
+        Initialise blobs object.
+
+        Args:
+            path: blob directory
+            used: keys used by this build, updated in place
+        """
+        self.path = path
+        self.used = used
+
+    def _file(self, key: str) -> Path:
+        """
+        File of a key.
+
+        Args:
+            key: hex digest
+
+        Returns:
+            file path, sharded by the first two characters of the key
+        """
+        return self.path / key[:2] / key
+
+    def __getitem__(self, key: str) -> bytes | None:
+        """
+        Read an entry.
+
+        Args:
+            key: hex digest
+
+        Returns:
+            entry content
+
+        Raises:
+            KeyError: if there is no entry
+        """
+        try:
+            data = self._file(key).read_bytes()
+        except FileNotFoundError:
+            raise KeyError(key)
+
+        self.used.add(key)
+        return data or None
+
+    def __setitem__(self, key: str, value: bytes | None) -> None:
+        """
+        Write an entry.
+
+        Args:
+            key: hex digest
+            value: entry content
+        """
+        _write_atomic(self._file(key), value or b"")
+        self.used.add(key)
+
+    def __delitem__(self, key: str) -> None:
+        """
+        Remove an entry.
+
+        Args:
+            key: hex digest
+
+        Raises:
+            KeyError: if there is no entry
+        """
+        try:
+            remove(self._file(key))
+        except FileNotFoundError:
+            raise KeyError(key)
+
+        self.used.discard(key)
+
+    def __contains__(self, key: object) -> bool:
+        """
+        Check for an entry.
+
+        Args:
+            key: hex digest
+
+        Returns:
+            True if the entry exists
+        """
+        return isinstance(key, str) and self._file(key).is_file()
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Iterate over keys.
+
+        Returns:
+            iterator of keys
+        """
+        return (file.name for file in self.path.glob("*/*") if file.is_file())
+
+    def __len__(self) -> int:
+        """
+        Number of entries.
+
+        Returns:
+            entry count
+        """
+        return sum(1 for _ in self)
+
+
+class TemplateCache(BytecodeCache):
+    """
+    Compiled Jinja templates in the cache directory, a file per template.
+
+    Buckets are keyed by template name and file, and checked against a hash of
+    the template source. Keys loaded or written are recorded as used.
+    """
+
+    def __init__(self, path: Path, used: set[str]) -> None:
+        """
+        Initialise template cache object.
+
+        Args:
+            path: template directory
+            used: keys used by this build, updated in place
+        """
+        self.path = path
+        self.used = used
+
+    def load_bytecode(self, bucket: Bucket) -> None:
+        """
+        Load compiled code into a bucket, if cached.
+
+        Args:
+            bucket: template bucket
+        """
+        try:
+            with open(self.path / bucket.key, "rb") as file:
+                bucket.load_bytecode(file)
+        except FileNotFoundError:
+            return
+
+        self.used.add(bucket.key)
+
+    def dump_bytecode(self, bucket: Bucket) -> None:
+        """
+        Write the compiled code of a bucket.
+
+        Args:
+            bucket: template bucket
+        """
+        _write_atomic(self.path / bucket.key, bucket.bytecode_to_string())
+        self.used.add(bucket.key)
+
+
+class Cache:
+    """
+    Build cache, a directory of JSON documents.
+
+    Each document is loaded on first use and written back by save. Without a path
+    the cache only lives in memory, so every build starts cold.
+
+    Binary entries, compiled templates and image thumbnails, are kept in the
+    templates and blobs directories, keyed by content. The entries a build used
+    are saved in the references document, anything else is garbage. The whole
+    cache can be exported to a versioned archive and imported again, e.g. to
+    carry it between CI runners.
+    """
+
+    def __init__(self, path: str | Path | None = None) -> None:
+        """
+        Initialise cache object.
+
+        Args:
+            path: cache directory, None for an in-memory cache
+        """
+        self.path = Path(path) if path else None
+        self.documents: dict[str, dict[str, Any]] = {}
+        self.used: dict[str, set[str]] = {BLOBS: set(), TEMPLATES: set()}
+
+    def load(self, name: str) -> dict[str, Any]:
+        """
+        Load a cache document.
+
+        Args:
+            name: document name
+
+        Returns:
+            document, changes to it are kept by save
+        """
+        if name not in self.documents:
+            document: dict[str, Any] = {}
+            if self.path is not None:
+                try:
+                    with open(self.path / (name + ".json"), "r") as file:
+                        document = json.load(file)
+                except (FileNotFoundError, json.JSONDecodeError):
+                    document = {}
+
+            self.documents[name] = document
+
+        return self.documents[name]
+
+    def blobs(self) -> Blobs | None:
+        """
+        Binary entries, if the cache has a directory.
+
+        Returns:
+            blobs, None for an in-memory cache
+        """
+        if self.path is None:
+            return None
+
+        return Blobs(self.path / BLOBS, self.used[BLOBS])
+
+    def templates(self) -> TemplateCache | None:
+        """
+        Jinja bytecode cache, if the cache has a directory.
+
+        Returns:
+            template cache, None for an in-memory cache
+        """
+        if self.path is None:
+            return None
+
+        return TemplateCache(self.path / TEMPLATES, self.used[TEMPLATES])
+
+    def save(self) -> None:
+        """Write loaded documents, and the references, to the cache directory."""
+        if self.path is None:
+            return
+
+        self.documents[REFERENCES] = {
+            kind: sorted(keys) for kind, keys in self.used.items()
+        }
+
+        makedirs(self.path, exist_ok=True)
+        for name, document in self.documents.items():
+            tmp_file = self.path / (name + ".json.tmp")
+            with open(tmp_file, "w") as file:
+                json.dump(document, file, separators=(",", ":"))
+            replace(tmp_file, self.path / (name + ".json"))
+
+    def files(self) -> dict[str, bool]:
+        """
+        Files of the cache directory.
+
+        Returns:
+            referenced flag by relative posix path
+        """
+        files: dict[str, bool] = {}
+        if self.path is None or not self.path.is_dir():
+            return files
+
+        references = self.load(REFERENCES)
+        referenced = {kind: set(references.get(kind, [])) for kind in self.used}
+        for root, _, names in walk(self.path):
+            for name in names:
+                file = Path(root, name).relative_to(self.path)
+                kind = file.parts[0]
+                if len(file.parts) == 1:
+                    files[file.as_posix()] = name.endswith(".json")
+                elif kind in referenced:
+                    files[file.as_posix()] = name in referenced[kind]
+                else:
+                    files[file.as_posix()] = False
+
+        return files
+
+    def _directory(self) -> Path:
+        """
+        Cache directory, for the operations which need one.
+
+        Returns:
+            cache directory
+
+        Raises:
+            ValueError: if the cache is disabled
+        """
+        if self.path is None:
+            raise ValueError("The cache is disabled, it has no directory.")
+
+        return self.path
+
+    def gc(self) -> int:
+        """
+        Remove entries not referenced by the last build, and stray files.
+
+        Returns:
+            number of removed files
+
+        Raises:
+            ValueError: if the cache is disabled
+        """
+        path = self._directory()
+        removed = 0
+        for name, referenced in self.files().items():
+            if not referenced:
+                remove(path / name)
+                removed += 1
+
+        logger.info("Removed {count} cache files.".format(count=removed))
+        return removed
+
+    def export_archive(self, archive: str | Path) -> int:
+        """
+        Export the referenced cache files to a versioned tar.gz archive.
+
+        The archive starts with a manifest of the cache format, the Python
+        version, compiled templates depend on it, and a hash of every file.
+
+        Args:
+            archive: archive file
+
+        Returns:
+            number of exported files
+
+        Raises:
+            ValueError: if the cache is disabled or a cache document is not valid
+                JSON
+        """
+        path = self._directory()
+        files = {}
+        for name, referenced in sorted(self.files().items()):
+            if not referenced:
+                continue
+
+            data = (path / name).read_bytes()
+            if name.endswith(".json") and "/" not in name:
+                try:
+                    json.loads(data)
+                except json.JSONDecodeError:
+                    raise ValueError(
+                        "Cache document {name} is not valid JSON.".format(name=name)
+                    )
+            files[name] = hashlib.sha256(data).hexdigest()
+
+        manifest = {
+            "format": CACHE_FORMAT,
+            "python": "{0}.{1}".format(*sys.version_info),
+            "files": files,
+        }
+        makedirs(Path(archive).parent, exist_ok=True)
+        with tarfile.open(archive, "w:gz") as tar:
+            self._add(tar, MANIFEST, io.BytesIO(json.dumps(manifest).encode("utf-8")))
+            for name in files:
+                with open(path / name, "rb") as file:
+                    self._add(tar, name, file)
+
+        logger.info(
+            "Exported {count} cache files to {archive}.".format(
+                count=len(files), archive=archive
+            )
+        )
+        return len(files)
+
+    @staticmethod
+    def _add(tar: tarfile.TarFile, name: str, file: Any) -> None:
+        """
+        Add a file to an archive, without owner or time, so archives are stable.
+
+        Args:
+            tar: archive
+            name: name in the archive
+            file: binary file object
+        """
+        file.seek(0, 2)
+        info = tarfile.TarInfo(name)
+        info.size = file.tell()
+        file.seek(0)
+        tar.addfile(info, file)
+
+    def import_archive(self, archive: str | Path) -> int:
+        """
+        Replace the cache directory by a cache archive, after validating it.
+
+        Every file is checked against the manifest before the cache directory is
+        replaced. Compiled templates of another Python version are left out.
+
+        Args:
+            archive: archive file
+
+        Returns:
+            number of imported files
+
+        Raises:
+            ValueError: if the cache is disabled or the archive is not a valid
+                cache archive
+        """
+        path = self._directory()
+        makedirs(path.parent, exist_ok=True)
+        staging = Path(tempfile.mkdtemp(prefix=path.name, dir=path.parent))
+        try:
+            count = self._extract(archive, staging)
+            if path.exists():
+                shutil.rmtree(path)
+            replace(staging, path)
+        finally:
+            if staging.exists():
+                shutil.rmtree(staging)
+
+        self.documents = {}
+        logger.info(
+            "Imported {count} cache files from {archive}.".format(
+                count=count, archive=archive
+            )
+        )
+        return count
+
+    @staticmethod
+    def _extract(archive: str | Path, path: Path) -> int:
+        """
+        Extract and validate a cache archive.
+
+        Args:
+            archive: archive file
+            path: directory to extract to
+
+        Returns:
+            number of extracted files
+
+        Raises:
+            ValueError: if the archive is not a valid cache archive
+        """
+        with tarfile.open(archive, "r:*") as tar:
+            members = tar.getmembers()
+            if not members or members[0].name != MANIFEST:
+                raise ValueError(
+                    "{archive} is not a cache archive.".format(archive=archive)
+                )
+
+            manifest = json.load(tar.extractfile(members[0]))  # type: ignore
+            if manifest.get("format") != CACHE_FORMAT:
+                raise ValueError(
+                    "Cache archive format {found} not supported, expected "
+                    "{format}.".format(
+                        found=manifest.get("format"), format=CACHE_FORMAT
+                    )
+                )
+
+            python = "{0}.{1}".format(*sys.version_info)
+            files = manifest["files"]
+            seen = set()
+            for member in members[1:]:
+                name = PurePosixPath(member.name)
+                if (
+                    not member.isfile()
+                    or name.is_absolute()
+                    or ".." in name.parts
+                    or member.name not in files
+                ):
+                    raise ValueError(
+                        "Unexpected cache archive entry {name}.".format(
+                            name=member.name
+                        )
+                    )
+
+                data = tar.extractfile(member).read()  # type: ignore
+                if hashlib.sha256(data).hexdigest() != files[member.name]:
+                    raise ValueError(
+                        "Cache archive entry {name} is corrupt.".format(
+                            name=member.name
+                        )
+                    )
+
+                seen.add(member.name)
+                if name.parts[0] == TEMPLATES and manifest.get("python") != python:
+                    continue
+                _write_atomic(path / name, data)
+
+            missing = set(files) - seen
+            if missing:
+                raise ValueError(
+                    "Cache archive entries {names} missing.".format(
+                        names=", ".join(sorted(missing))
+                    )
+                )
+
+        return len(seen)
+
+
+def main(argv: list[str] | None = None) -> None:
+    """
+    Cache commands, export, import and gc of a cache directory.
+
+    Args:
+        argv: command line arguments
+    """
+    parser = argparse.ArgumentParser(prog="python -m mysgen.cache")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for command, help_text in [
+        ("export", "export a cache directory to an archive"),
+        ("import", "replace a cache directory by an archive"),
+    ]:
+        subparser = commands.add_parser(command, help=help_text)
+        subparser.add_argument("cache_path")
+        subparser.add_argument("archive")
+    subparser = commands.add_parser("gc", help="remove unreferenced cache entries")
+    subparser.add_argument("cache_path")
+    args = parser.parse_args(argv)
+
+    cache = Cache(args.cache_path)
+    if args.command == "export":
+        cache.export_archive(args.archive)
+    elif args.command == "import":
+        cache.import_archive(args.archive)
+    else:
+        cache.gc()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
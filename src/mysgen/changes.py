@@ -0,0 +1,149 @@
+"""Stat index of source files, to find changes without hashing, for mysgen."""
+from __future__ import annotations
+import os
+import time
+import hashlib
+import logging
+from typing import Any, Iterable
+from pathlib import Path
+
+
+logger = logging.getLogger(__name__)
+
+
+READ_BUFFER = 1 << 16
+
+
+def file_digest(path: str | Path) -> str:
+    """
+    Hash a file in chunks.
+
+    Args:
+        path: file path
+
+    Returns:
+        sha256 hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(READ_BUFFER), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class StatIndex:
+    """
+    Content hashes of source files, trusted while their stat is unchanged.
+
+    Like the git index, every file is recorded with its size, mtime and inode
+    and the sha256 of its content, and only hashed again when one of them
+    changed. The index time is taken when the build starts. A file modified
+    after it is racily clean, its stat may not show a later change in the same
+    clock tick, so it is always hashed. Changed means the content differs from
+    the last build that looked at the file, or the file is new.
+    """
+
+    def __init__(self, document: dict[str, Any]) -> None:
+        """
+        Initialise stat index object.
+
+        Args:
+            document: index of the last build, updated in place by save
+        """
+        self.document = document
+        self.previous: dict[str, list[Any]] = document.get("files", {})
+        self.written: int = document.get("written", 0)
+        self.files: dict[str, list[Any]] = {}
+        self.hashed = 0
+        self.start = time.time_ns()
+
+    def digest(self, path: str | Path) -> str:
+        """
+        Content hash of a file, from the index while its stat is unchanged.
+
+        Args:
+            path: file path
+
+        Returns:
+            sha256 hex digest
+        """
+        key = Path(path).as_posix()
+        if key in self.files:
+            return self.files[key][3]
+
+        stat = os.stat(path)
+        entry: list[Any] = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        previous = self.previous.get(key)
+        if previous and previous[:3] == entry and stat.st_mtime_ns < self.written:
+            digest = previous[3]
+        else:
+            digest = file_digest(path)
+            self.hashed += 1
+
+        self.files[key] = entry + [digest]
+        return digest
+
+    def changed(self, path: str | Path) -> bool:
+        """
+        Check if a file changed since the last build.
+
+        Args:
+            path: file path
+
+        Returns:
+            True if the content changed or the file is new
+        """
+        digest = self.digest(path)
+        previous = self.previous.get(Path(path).as_posix())
+        return previous is None or previous[3] != digest
+
+    def scan(self, roots: Iterable[str | Path]) -> tuple[list[str], list[str]]:
+        """
+        Find the files changed and removed under directories since the last build.
+
+        Args:
+            roots: directories to scan
+
+        Returns:
+            changed and removed file paths
+        """
+        changed = []
+        seen = set()
+        prefixes = []
+        for root in roots:
+            prefixes.append(Path(root).as_posix().rstrip("/") + "/")
+            for path, _, names in os.walk(root):
+                for name in sorted(names):
+                    file = Path(path, name)
+                    seen.add(file.as_posix())
+                    if self.changed(file):
+                        changed.append(file.as_posix())
+
+        removed = [
+            key
+            for key in self.previous
+            if key not in seen and key.startswith(tuple(prefixes))
+        ]
+        logger.info(
+            "{changed} files changed and {removed} removed, {hashed} hashed.".format(
+                changed=len(changed), removed=len(removed), hashed=self.hashed
+            )
+        )
+        return sorted(changed), sorted(removed)
+
+    def save(self) -> None:
+        """
+        Record the files of this build in the index document.
+
+        Files not looked at keep their entry while they exist, unless racily
+        clean, so they are hashed again when used.
+        """
+        files = {
+            key: entry
+            for key, entry in self.previous.items()
+            if key not in self.files and entry[1] < self.written and os.path.isfile(key)
+        }
+        files.update(self.files)
+        self.document["files"] = files
+        self.document["written"] = self.start
@@ -0,0 +1,171 @@
+"""Precompressed output variants for mysgen."""
+from __future__ import annotations
+import gzip
+import hashlib
+import logging
+from typing import Any, Callable
+from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
+from mysgen.sinks import Sink
+
+try:
+    import brotli  # type: ignore
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+
+COMPRESSIBLE = {".html", ".css", ".js", ".json", ".xml", ".svg", ".txt"}
+FORMATS = ("gz", "br")
+MAX_PENDING = 64
+
+
+def compress(data: bytes, formats: tuple[str, ...]) -> dict[str, bytes]:
+    """
+    Compress data at maximum compression levels.
+
+    The gzip header has no timestamp, so equal content compresses to equal bytes.
+
+    Args:
+        data: data to compress
+        formats: gz and or br
+
+    Returns:
+        compressed data per format
+    """
+    variants = {}
+    if "gz" in formats:
+        variants["gz"] = gzip.compress(data, compresslevel=9, mtime=0)
+    if "br" in formats:
+        variants["br"] = brotli.compress(data, quality=11)
+
+    return variants
+
+
+class Precompressor:
+    """
+    Write .gz and .br siblings of compressible outputs.
+
+    Listens to a sink and compresses outputs on a worker pool as they are written.
+    An output whose content hash is unchanged since the last build and whose
+    siblings exist is skipped, so the cost is paid once per change. At most
+    max_pending outputs wait for compression, further writes wait for the
+    oldest, so memory does not grow with the size of the site.
+    """
+
+    def __init__(
+        self,
+        sink: Sink,
+        hashes: dict[str, str],
+        formats: list[str] | tuple[str, ...] = FORMATS,
+        workers: int | None = None,
+        max_pending: int = MAX_PENDING,
+    ) -> None:
+        """
+        Initialise precompressor object.
+
+        Args:
+            sink: output sink to listen to and write to
+            hashes: source hashes of the last build, updated in place
+            formats: formats to write, gz and or br
+            workers: number of worker threads, None for the default
+            max_pending: number of outputs waiting for compression at most
+        """
+        self.sink = sink
+        self.hashes = hashes
+        self.formats = tuple(fmt for fmt in formats if fmt in FORMATS)
+        if "br" in self.formats and brotli is None:
+            logger.info("Package brotli not installed, skipping .br outputs.")
+            self.formats = tuple(fmt for fmt in self.formats if fmt != "br")
+
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.pending: list[tuple[Path, str, Future[dict[str, bytes]]]] = []
+        self.written = 0
+        self.max_pending = max_pending
+        sink.listeners.append(self.add)
+
+    def add(self, path: Path, read: Callable[[], bytes], digest: str = "") -> None:
+        """
+        Queue an output for compression, unless unchanged or already queued.
+
+        Args:
+            path: output path
+            read: function returning the output content
+            digest: sha256 hex digest of the content, empty if unknown
+        """
+        if path.suffix not in COMPRESSIBLE or not self.formats:
+            return
+
+        data = None
+        if not digest:
+            data = read()
+            digest = hashlib.sha256(data).hexdigest()
+
+        key = self.sink.relative(path)
+        if self.hashes.get(key) == digest and all(
+            self.sink.exists(self._sibling(path, fmt)) for fmt in self.formats
+        ):
+            return
+
+        if any(item[:2] == (path, digest) for item in self.pending):
+            return
+
+        if data is None:
+            data = read()
+
+        future = self.pool.submit(compress, data, self.formats)
+        self.pending.append((path, digest, future))
+        self._write(block=False)
+        while len(self.pending) > self.max_pending:
+            self.pending[0][2].result()
+            self._write(block=False)
+
+    def finish(self) -> dict[str, Any]:
+        """
+        Wait for queued outputs and write the remaining siblings.
+
+        Returns:
+            statistics
+        """
+        self.sink.listeners.remove(self.add)
+        self._write(block=True)
+        self.pool.shutdown()
+        logger.info("Precompressed {count} outputs.".format(count=self.written))
+        return {"written": self.written}
+
+    def _write(self, block: bool) -> None:
+        """
+        Write siblings of compressed outputs.
+
+        Args:
+            block: wait for outputs still being compressed
+        """
+        pending = []
+        for path, digest, future in self.pending:
+            if not block and not future.done():
+                pending.append((path, digest, future))
+                continue
+
+            for fmt, data in future.result().items():
+                self.sink.write_bytes(self._sibling(path, fmt), data)
+
+            self.hashes[self.sink.relative(path)] = digest
+            self.written += 1
+
+        self.pending = pending
+
+    @staticmethod
+    def _sibling(path: Path, fmt: str) -> Path:
+        """
+        Path of a compressed sibling.
+
+        Args:
+            path: output path
+            fmt: compression format
+
+        Returns:
+            sibling path
+        """
+        return path.with_name(path.name + "." + fmt)
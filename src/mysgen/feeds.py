@@ -0,0 +1,335 @@
+"""Atom and RSS feeds and sitemaps for mysgen."""
+from __future__ import annotations
+import json
+import hashlib
+import logging
+from typing import Any, Callable
+from pathlib import Path
+from datetime import datetime
+from xml.sax.saxutils import escape, quoteattr
+from mysgen.sinks import Sink
+
+
+logger = logging.getLogger(__name__)
+
+
+FEEDS = {"atom": "feed.xml", "rss": "rss.xml"}
+FEED_SIZE = 20
+SITEMAP = "sitemap.xml"
+SITEMAP_LIMIT = 50000
+INDEX = "index.html"
+XML_HEADER = '<?xml version="1.0" encoding="utf-8"?>\n'
+
+
+def _atom_date(date: datetime | str) -> str:
+    """
+    Atom, RFC 3339, date.
+
+    Args:
+        date: date
+
+    Returns:
+        date string in UTC
+    """
+    if isinstance(date, datetime):
+        return date.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    return str(date) + "T00:00:00Z"
+
+
+def _rss_date(date: datetime | str) -> str:
+    """
+    RSS, RFC 822, date.
+
+    Args:
+        date: date
+
+    Returns:
+        date string in UTC
+    """
+    if not isinstance(date, datetime):
+        date = datetime.strptime(str(date), "%Y-%m-%d")
+
+    return date.strftime("%a, %d %b %Y %H:%M:%S +0000")
+
+
+def atom_entry(entry: dict[str, Any]) -> str:
+    """
+    Atom entry element.
+
+    Args:
+        entry: title, link, date and content
+
+    Returns:
+        XML fragment
+    """
+    return (
+        "<entry><title>{title}</title><link href={link}/><id>{link_text}</id>"
+        '<updated>{date}</updated><content type="html">{content}</content>'
+        "</entry>\n"
+    ).format(
+        title=escape(entry["title"]),
+        link=quoteattr(entry["link"]),
+        link_text=escape(entry["link"]),
+        date=_atom_date(entry["date"]),
+        content=escape(entry["content"]),
+    )
+
+
+def rss_item(entry: dict[str, Any]) -> str:
+    """
+    RSS item element.
+
+    Args:
+        entry: title, link, date and content
+
+    Returns:
+        XML fragment
+    """
+    return (
+        "<item><title>{title}</title><link>{link}</link>"
+        '<guid isPermaLink="true">{link}</guid><pubDate>{date}</pubDate>'
+        "<description>{content}</description></item>\n"
+    ).format(
+        title=escape(entry["title"]),
+        link=escape(entry["link"]),
+        date=_rss_date(entry["date"]),
+        content=escape(entry["content"]),
+    )
+
+
+ENTRIES: dict[str, Callable[[dict[str, Any]], str]] = {
+    "atom": atom_entry,
+    "rss": rss_item,
+}
+
+
+class Feeds:
+    """
+    Atom and RSS feeds of the newest posts.
+
+    The XML fragment of every entry is cached by a hash of what it is rendered
+    from, so a build only serialises new or changed posts. Entries not used by
+    a build are dropped from the cache.
+    """
+
+    def __init__(self, cache: dict[str, str], base: dict[str, Any]) -> None:
+        """
+        Initialise feeds object.
+
+        Args:
+            cache: entry fragments by hash, updated in place
+            base: base variables, for sitename, siteurl and author
+        """
+        self.cache = cache
+        self.used: dict[str, str] = {}
+        self.siteurl = base.get("siteurl", "").rstrip("/")
+        self.sitename = base.get("sitename", "")
+        self.author = base.get("author") or self.sitename
+
+    def entry(self, kind: str, entry: dict[str, Any]) -> str:
+        """
+        Cached XML fragment of an entry.
+
+        Args:
+            kind: atom or rss
+            entry: title, link, date and content
+
+        Returns:
+            XML fragment
+        """
+        key = hashlib.sha256(
+            json.dumps([kind, entry], default=str, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        if key not in self.cache:
+            self.cache[key] = ENTRIES[kind](entry)
+
+        self.used[key] = self.cache[key]
+        return self.cache[key]
+
+    def write(
+        self,
+        sink: Sink,
+        build_path: str | Path,
+        posts: list[tuple[str, dict[str, Any]]],
+        kinds: list[str],
+        size: int = FEED_SIZE,
+    ) -> None:
+        """
+        Write feeds.
+
+        Args:
+            sink: output sink
+            build_path: build directory
+            posts: url and entry, title, date and content, of posts, newest first
+            kinds: feeds to write, atom and or rss
+            size: number of entries per feed
+        """
+        entries = [
+            {**entry, "link": self.siteurl + path} for path, entry in posts[:size]
+        ]
+        updated = entries[0]["date"] if entries else "1970-01-01"
+        for kind in kinds:
+            body = "".join(self.entry(kind, entry) for entry in entries)
+            if kind == "atom":
+                xml = (
+                    '<feed xmlns="http://www.w3.org/2005/Atom">\n'
+                    "<title>{title}</title><link href={link}/>"
+                    '<link rel="self" href={self_link}/><id>{id}</id>'
+                    "<author><name>{author}</name></author>"
+                    "<updated>{updated}</updated>\n{body}</feed>\n"
+                ).format(
+                    title=escape(self.sitename),
+                    author=escape(self.author),
+                    link=quoteattr(self.siteurl + "/"),
+                    self_link=quoteattr(self.siteurl + "/" + FEEDS[kind]),
+                    id=escape(self.siteurl + "/"),
+                    updated=_atom_date(updated),
+                    body=body,
+                )
+            else:
+                xml = (
+                    '<rss version="2.0"><channel>\n'
+                    "<title>{title}</title><link>{link}</link>"
+                    "<description>{title}</description>\n{body}</channel></rss>\n"
+                ).format(
+                    title=escape(self.sitename),
+                    link=escape(self.siteurl + "/"),
+                    body=body,
+                )
+
+            sink.write_bytes(
+                Path(build_path, FEEDS[kind]), (XML_HEADER + xml).encode("utf-8")
+            )
+
+    def prune(self) -> None:
+        """Keep only entries used by this build."""
+        self.cache.clear()
+        self.cache.update(self.used)
+
+
+class Sitemap:
+    """
+    Sitemap of the pages written by a build.
+
+    Listens to a sink for written index.html pages. The lastmod of a URL is the
+    build date on which its content hash last changed, so unchanged pages keep
+    their date. Above 50000 URLs the sitemap is split into sitemap-<n>.xml
+    files listed by a sitemap index in sitemap.xml.
+    """
+
+    def __init__(
+        self,
+        sink: Sink,
+        cache: dict[str, list[str]],
+        siteurl: str,
+        date: str,
+        limit: int = SITEMAP_LIMIT,
+    ) -> None:
+        """
+        Initialise sitemap object.
+
+        Args:
+            sink: output sink to listen to and write to
+            cache: content hash and lastmod by url, updated in place
+            siteurl: site URL
+            date: build date, lastmod of changed pages
+            limit: URLs per sitemap file
+        """
+        self.sink = sink
+        self.cache = cache
+        self.siteurl = siteurl.rstrip("/")
+        self.date = date
+        self.limit = limit
+        self.pages: dict[str, str] = {}
+        sink.listeners.append(self.add)
+
+    def add(self, path: Path, read: Callable[[], bytes], digest: str = "") -> None:
+        """
+        Record a written page.
+
+        Args:
+            path: output path
+            read: function returning the output content
+            digest: sha256 hex digest of the content, empty if unknown
+        """
+        if path.name != INDEX:
+            return
+
+        if not digest:
+            digest = hashlib.sha256(read()).hexdigest()
+
+        parent = Path(self.sink.relative(path)).parent.as_posix()
+        self.pages["/" if parent == "." else "/" + parent] = digest
+
+    def finish(self) -> int:
+        """
+        Stop listening and write the sitemap.
+
+        Returns:
+            number of sitemap files written
+        """
+        self.sink.listeners.remove(self.add)
+        lastmod = {}
+        for url, digest in sorted(self.pages.items()):
+            if url in self.cache and self.cache[url][0] == digest:
+                lastmod[url] = self.cache[url][1]
+            else:
+                lastmod[url] = self.date
+            self.cache[url] = [digest, lastmod[url]]
+
+        for url in set(self.cache) - set(self.pages):
+            del self.cache[url]
+
+        urls = list(lastmod.items())
+        shards = [urls[i : i + self.limit] for i in range(0, len(urls), self.limit)]
+        root = self.sink.root
+        if len(shards) <= 1:
+            self._write(root / SITEMAP, urls)
+            return 1
+
+        index = []
+        for number, shard in enumerate(shards, 1):
+            name = "sitemap-{number}.xml".format(number=number)
+            self._write(root / name, shard)
+            index.append(
+                "<sitemap><loc>{loc}</loc><lastmod>{lastmod}</lastmod></sitemap>\n".format(
+                    loc=escape(self.siteurl + "/" + name),
+                    lastmod=max(date for _, date in shard),
+                )
+            )
+
+        self.sink.write_bytes(
+            root / SITEMAP,
+            (
+                XML_HEADER
+                + '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+                + "".join(index)
+                + "</sitemapindex>\n"
+            ).encode("utf-8"),
+        )
+        return len(shards) + 1
+
+    def _write(self, path: Path, urls: list[tuple[str, str]]) -> None:
+        """
+        Write a sitemap file.
+
+        Args:
+            path: output path
+            urls: url and lastmod
+        """
+        body = "".join(
+            "<url><loc>{loc}</loc><lastmod>{lastmod}</lastmod></url>\n".format(
+                loc=escape(self.siteurl + url), lastmod=lastmod
+            )
+            for url, lastmod in urls
+        )
+        self.sink.write_bytes(
+            path,
+            (
+                XML_HEADER
+                + '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+                + body
+                + "</urlset>\n"
+            ).encode("utf-8"),
+        )
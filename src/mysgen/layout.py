@@ -0,0 +1,103 @@
+"""Nested source layouts, item discovery and output paths, for mysgen."""
+from __future__ import annotations
+import os
+from typing import Any, Iterator
+from pathlib import Path
+from datetime import datetime
+
+
+def walk(root: str | Path) -> Iterator[os.DirEntry]:
+    """
+    Walk the files under a directory with one os.scandir call per directory.
+
+    Entries are visited in sorted order, files of a directory before its
+    subdirectories, so discovery does not depend on the file system. Hidden
+    entries are skipped, as by glob, and symbolic links to directories are not
+    followed.
+
+    Args:
+        root: directory to walk
+
+    Yields:
+        directory entries of the files
+    """
+    stack = [os.fspath(root)]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as scan:
+                entries = sorted(scan, key=lambda entry: entry.name)
+        except FileNotFoundError:
+            continue
+
+        directories = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                directories.append(entry.path)
+            elif entry.is_file():
+                yield entry
+
+        stack.extend(reversed(directories))
+
+
+def find_sources(root: str | Path, suffix: str = ".md") -> list[Path]:
+    """
+    Find source files under a directory and its subdirectories.
+
+    Args:
+        root: directory to search
+        suffix: file suffix
+
+    Returns:
+        source file paths, in walk order
+    """
+    return [Path(entry.path) for entry in walk(root) if entry.name.endswith(suffix)]
+
+
+def output_path(template: str | None, item_type: str, source: Path, meta: Any) -> Path:
+    """
+    Output path of an item, relative to the build path.
+
+    Without a template the output mirrors the source layout. The template fields
+    are type, dir, the subdirectory of the source within the item type
+    directory, name, the source file name without suffix, slug, the slug or
+    the name, and year, month and day of the item date. Empty segments are
+    dropped, so a flat source fills dir with nothing.
+
+    Args:
+        template: output path template, such as posts/{year}/{slug}
+        item_type: type of item, posts or pages
+        source: source path relative to the src path, without suffix
+        meta: metadata of the item
+
+    Returns:
+        output path
+
+    Raises:
+        ValueError: if the template uses an unknown field
+    """
+    if not template:
+        return source
+
+    date = meta["date"]
+    dated = isinstance(date, datetime)
+    fields = {
+        "type": item_type,
+        "dir": Path(*source.parts[1:-1]).as_posix() if len(source.parts) > 2 else "",
+        "name": source.name,
+        "slug": meta["slug"] or source.name,
+        "year": "{date:%Y}".format(date=date) if dated else "",
+        "month": "{date:%m}".format(date=date) if dated else "",
+        "day": "{date:%d}".format(date=date) if dated else "",
+    }
+    try:
+        path = template.format(**fields)
+    except KeyError as error:
+        raise ValueError(
+            "Unknown field {field} in output path {template}.".format(
+                field=error, template=template
+            )
+        ) from error
+
+    return Path(*[part for part in path.split("/") if part])
@@ -0,0 +1,342 @@
+"""Minification of HTML, CSS and JS outputs for mysgen."""
+from __future__ import annotations
+import re
+import hashlib
+import logging
+from typing import Any, Callable, MutableMapping
+from mysgen.sinks import Sink
+
+
+logger = logging.getLogger(__name__)
+
+
+KINDS = {"html": (".html", ".htm"), "css": (".css",), "js": (".js",)}
+
+HTML_PRESERVE = re.compile(
+    r"(<(pre|textarea|script|style)\b[^>]*>.*?</\2\s*>)", re.IGNORECASE | re.DOTALL
+)
+HTML_COMMENT = re.compile(r"<!--(?!\[if|<!|>).*?-->", re.DOTALL)
+HTML_STYLE = re.compile(
+    r"(<style\b[^>]*>)(.*?)(</style\s*>)", re.IGNORECASE | re.DOTALL
+)
+HTML_SCRIPT = re.compile(
+    r"(<script(?![^>]*\btype=(?![\"']?(?:text/javascript|module)))[^>]*>)"
+    r"(.*?)(</script\s*>)",
+    re.IGNORECASE | re.DOTALL,
+)
+WHITESPACE = re.compile(r"\s+")
+
+CSS_TOKENS = re.compile(
+    r"""("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*!.*?\*/)|(/\*.*?\*/)|(\s+)""",
+    re.DOTALL,
+)
+CSS_PUNCTUATION = set("{};,>")
+
+JS_TOKENS = re.compile(
+    r"""("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)"""
+    r"""|(/\*!.*?\*/)|(/\*.*?\*/|//[^\n]*)|(\s+)|(/)""",
+    re.DOTALL,
+)
+JS_REGEX = re.compile(r"/(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[a-z]*")
+JS_PUNCTUATION = set("{}()[];,:=<>&|!?*%^~")
+JS_REGEX_AFTER = set("(,=:[!&|?{};+-*%<>~^")
+JS_REGEX_KEYWORDS = ("return", "typeof", "case", "do", "else", "in", "of", "void")
+JS_NEWLINE_AFTER = set("{([;,")
+JS_NEWLINE_BEFORE = set("})]")
+JS_WORD = re.compile(r"[A-Za-z_$][\w$]*$")
+
+
+def _collapse(match: re.Match) -> str:
+    """
+    Collapse a run of whitespace.
+
+    Args:
+        match: whitespace match
+
+    Returns:
+        a newline if the run had one, otherwise a space
+    """
+    return "\n" if "\n" in match.group(0) else " "
+
+
+def minify_html(text: str) -> str:
+    """
+    Minify HTML.
+
+    Comments are removed and runs of whitespace are collapsed to one space, or
+    one newline if they span lines, which browsers render the same. The content
+    of pre and textarea elements and of scripts of other types, like math/tex,
+    is kept as is. Style elements are minified as CSS and JavaScript elements as
+    JS.
+
+    Args:
+        text: HTML
+
+    Returns:
+        minified HTML
+    """
+    parts = HTML_PRESERVE.split(text)
+    minified = []
+    for i in range(0, len(parts), 3):
+        minified.append(WHITESPACE.sub(_collapse, HTML_COMMENT.sub("", parts[i])))
+        if i + 1 < len(parts):
+            block = parts[i + 1]
+            tag = parts[i + 2].lower()
+            if tag == "style":
+                block = HTML_STYLE.sub(
+                    lambda m: m.group(1) + minify_css(m.group(2)) + m.group(3), block
+                )
+            elif tag == "script":
+                block = HTML_SCRIPT.sub(
+                    lambda m: m.group(1) + minify_js(m.group(2)) + m.group(3), block
+                )
+            minified.append(block)
+
+    return "".join(minified).strip() + "\n"
+
+
+def minify_css(text: str) -> str:
+    """
+    Minify CSS.
+
+    Comments are removed, except /*! ones, whitespace is collapsed and removed
+    around braces, semicolons, commas and child selectors and after colons. A
+    space before a colon is kept, it separates a descendant pseudo-class
+    selector. Strings are kept.
+
+    Args:
+        text: CSS
+
+    Returns:
+        minified CSS
+    """
+    pieces = []
+    code = []
+    position = 0
+    for match in CSS_TOKENS.finditer(text):
+        code.append(text[position : match.start()])
+        position = match.end()
+        string, license, _, _ = match.groups()
+        if string or license:
+            pieces.append(_tighten("".join(code)))
+            pieces.append(match.group(0))
+            code = []
+        else:
+            code.append(" ")
+
+    code.append(text[position:])
+    pieces.append(_tighten("".join(code)))
+    return "".join(pieces).strip()
+
+
+def _tighten(code: str) -> str:
+    """
+    Remove whitespace next to CSS punctuation and last semicolons in blocks.
+
+    Args:
+        code: CSS without strings or comments
+
+    Returns:
+        tightened CSS
+    """
+    code = WHITESPACE.sub(" ", code)
+    out = []
+    for i, char in enumerate(code):
+        if char == " " and (
+            (i > 0 and code[i - 1] in CSS_PUNCTUATION | {":"})
+            or (i + 1 < len(code) and code[i + 1] in CSS_PUNCTUATION)
+        ):
+            continue
+        out.append(char)
+
+    return "".join(out).replace(";}", "}")
+
+
+def minify_js(text: str) -> str:
+    """
+    Minify JS.
+
+    Comments are removed, except /*! ones, indentation and blank lines are
+    dropped and whitespace around punctuation is removed. Line breaks are kept
+    where automatic semicolon insertion could depend on them. Strings, template
+    literals and regular expression literals are kept.
+
+    Args:
+        text: JS
+
+    Returns:
+        minified JS
+    """
+    out: list[str] = []
+    pending = ""
+
+    def emit(code: str) -> None:
+        nonlocal pending
+        if not code:
+            return
+
+        if pending and out:
+            before, after = out[-1][-1], code[0]
+            if pending == " ":
+                skip = before in JS_PUNCTUATION or after in JS_PUNCTUATION
+            else:
+                skip = before in JS_NEWLINE_AFTER or after in JS_NEWLINE_BEFORE
+            if not skip:
+                out.append(pending)
+
+        pending = ""
+        out.append(code)
+
+    position = 0
+    while position < len(text):
+        match = JS_TOKENS.search(text, position)
+        if match is None:
+            emit(text[position:])
+            break
+
+        emit(text[position : match.start()])
+        string, license, comment, space, slash = match.groups()
+        position = match.end()
+        if string or license:
+            emit(match.group(0))
+        elif comment or space:
+            blank = comment or space
+            if "\n" in blank or blank.startswith("//"):
+                pending = "\n"
+            elif not pending:
+                pending = " "
+        elif slash:
+            regex = JS_REGEX.match(text, match.start())
+            if regex and _regex_allowed(out[-1] if out else ""):
+                emit(regex.group(0))
+                position = regex.end()
+            else:
+                emit("/")
+
+    return "".join(out)
+
+
+def _regex_allowed(code: str) -> bool:
+    """
+    Check if a slash after code starts a regular expression literal.
+
+    Args:
+        code: last code emitted before the slash, whitespace is never emitted
+            last, and a word is never split over two pieces
+
+    Returns:
+        True if a regular expression can start here
+    """
+    code = code.rstrip()
+    if not code or code[-1] in JS_REGEX_AFTER:
+        return True
+
+    word = JS_WORD.search(code)
+    return word is not None and word.group(0) in JS_REGEX_KEYWORDS
+
+
+MINIFIERS: dict[str, Callable[[str], str]] = {
+    "html": minify_html,
+    "css": minify_css,
+    "js": minify_js,
+}
+
+
+class Minifier:
+    """
+    Minify outputs on their way into a sink.
+
+    Registers sink filters for the chosen kinds. Results are kept as blobs by
+    input hash, so an unchanged page or asset is not minified again, and the
+    cache document only lists the input hashes used by a build, with the hash
+    of their result. Byte savings are counted per kind.
+    """
+
+    def __init__(
+        self,
+        sink: Sink,
+        cache: dict[str, str],
+        kinds: list[str] | tuple[str, ...] = tuple(KINDS),
+        blobs: MutableMapping[str, bytes | None] | None = None,
+    ) -> None:
+        """
+        Initialise minifier object.
+
+        Args:
+            sink: output sink to filter
+            cache: hashes of minified outputs by input hash, updated in place
+            kinds: kinds to minify, html, css and or js
+            blobs: minified outputs by input hash, None for no caching
+        """
+        self.sink = sink
+        self.cache = cache
+        self.blobs = blobs
+        self.used: dict[str, str] = {}
+        self.stats = {kind: {"in": 0, "out": 0} for kind in kinds if kind in KINDS}
+        for kind in self.stats:
+            for suffix in KINDS[kind]:
+                sink.filters[suffix] = self._filter(kind)
+
+    def _filter(self, kind: str) -> Callable[[bytes], bytes]:
+        """
+        Sink filter of a kind.
+
+        Args:
+            kind: html, css or js
+
+        Returns:
+            function minifying output content
+        """
+        return lambda data: self.minify(kind, data)
+
+    def minify(self, kind: str, data: bytes) -> bytes:
+        """
+        Minify output content, using the cached result if there is one.
+
+        Content that is not UTF-8 is left as is.
+
+        Args:
+            kind: html, css or js
+            data: output content
+
+        Returns:
+            minified content
+        """
+        key = hashlib.sha256(kind.encode("utf-8") + b"\0" + data).hexdigest()
+        minified = None
+        if self.blobs is not None and key in self.cache:
+            try:
+                minified = self.blobs[key] or b""
+            except KeyError:
+                pass
+
+        if minified is None:
+            try:
+                minified = MINIFIERS[kind](data.decode("utf-8")).encode("utf-8")
+            except UnicodeDecodeError:
+                return data
+
+            if self.blobs is not None:
+                self.blobs[key] = minified
+
+        self.used[key] = hashlib.sha256(minified).hexdigest()
+        self.stats[kind]["in"] += len(data)
+        self.stats[kind]["out"] += len(minified)
+        return minified
+
+    def finish(self) -> dict[str, Any]:
+        """
+        Remove the sink filters, keep used cache entries and report savings.
+
+        Returns:
+            bytes in and out per kind and bytes saved in total
+        """
+        for kind in self.stats:
+            for suffix in KINDS[kind]:
+                self.sink.filters.pop(suffix, None)
+
+        self.cache.clear()
+        self.cache.update(self.used)
+        saved = sum(stats["in"] - stats["out"] for stats in self.stats.values())
+        logger.info("Minification saved {saved} bytes.".format(saved=saved))
+        return {**self.stats, "saved": saved}
@@ -2,22 +2,41 @@
 from __future__ import annotations
 import os
 import json
+import time
 import boto3
-import shutil
 import hashlib
 import logging
-import markdown
+import re
 import pillow_avif  # type: ignore # noqa: F401
 from PIL import Image
-from typing import Any
-from datetime import datetime
+from io import BytesIO
+from mysgen.cache import Cache
+from mysgen.sinks import Sink, FileSystemSink, ArchiveSink
+from mysgen.compress import FORMATS, Precompressor
+from mysgen.minify import KINDS, Minifier
+from mysgen.assets import HASH_LENGTH, Assets, fingerprint
+from mysgen.search import PREFIX_LENGTH, SearchIndex
+from mysgen.related import RelatedPosts
+from mysgen.feeds import FEED_SIZE, Feeds, Sitemap
+from mysgen.blocks import BLOCK_CACHE_SIZE, BlockCache
+from mysgen.backends import BACKENDS, MARKDOWN_BACKEND, compare, converter
+from mysgen.shards import merge, read_manifests, shard_of, shard_path, write_manifest
+from mysgen.shared import SharedCaches
+from mysgen.schedule import PRIORITY_POSTS, critical_items
+from mysgen.stream import ContentStore
+from mysgen.changes import StatIndex, file_digest
+from mysgen.layout import find_sources, output_path
+from mysgen.previews import PREVIEW_POINTS, PREVIEW_SUFFIX, preview, previewable
+from typing import Any, Callable, Iterable, Iterator, Mapping, MutableMapping
+from datetime import datetime, timezone
 from os import scandir, makedirs
 from pathlib import Path
-from os.path import join, isfile
-from distutils.dir_util import copy_tree
+from functools import partial
+from os.path import join, isdir
 from distutils.errors import DistutilsFileError
-from collections import defaultdict, OrderedDict
-from jinja2 import Environment, FileSystemLoader, Template
+from collections import OrderedDict
+from markupsafe import Markup
+from jinja2 import Environment, FileSystemLoader, Template, meta as jinja_meta
 
 
 logging.basicConfig(level=logging.INFO)
@@ -28,16 +47,607 @@ logger = logging.getLogger(__name__)
 CONFIG_FILE = "config.json"
 TEMPLATES = "templates"
 INDEX = "index.html"
-TODAY = datetime.now()
+PAYLOAD = "fragment"
+PAYLOAD_BLOCK = "ajax_content"
+DATE_FORMAT = "%Y-%m-%d"
+META_FIELDS = (
+    "title",
+    "date",
+    "author",
+    "category",
+    "tags",
+    "type",
+    "url",
+    "slug",
+    "status",
+    "image",
+    "data",
+    "path",
+    "thumbnail_size",
+    "thumbnails",
+    "image_paths",
+    "related",
+    "previews",
+)
+ITEM_PATHS = ("src_path", "build_path", "from_path", "to_path")
+TAXONOMIES = {"tags": "tags", "categories": "category"}
+LISTING_GLOBALS = ("tags", "categories", "taxonomies", "all_posts")
+FRAGMENT_MAX_AGE = 30
+PAGE_SEGMENT = "page"
+UNRENDERED_SETTINGS = ("build_date", "build_path", "cache_path")
+
+_interned_paths: dict[Path, Path] = {}
+
+
+def intern_path(path: Any) -> Path:
+    """
+    Return a shared path object equal to path.
+
+    Every item refers to the same src and build directories, interning them keeps
+    one path object per directory instead of one per item.
+
+    Args:
+        path: path like object
+
+    Returns:
+        interned path object
+    """
+    path = Path(path)
+    return _interned_paths.setdefault(path, path)
+
+
+class Meta(MutableMapping):
+    """
+    Item metadata.
+
+    Known fields live in slots, any other key lives in a small extra dictionary.
+    Missing keys read as an empty string, like the defaultdict this replaces, so
+    templates keep using meta["date"] or meta.date. Unlike a defaultdict with a
+    lambda factory, instances can be pickled and sent to worker processes.
+    """
+
+    __slots__ = META_FIELDS + ("extra",)
+
+    title: str
+    date: datetime
+    author: str
+    category: str
+    tags: list[str]
+    type: str
+    url: str
+    slug: str
+    status: str
+    image: str | bool
+    data: str | bool
+    path: Path
+    thumbnail_size: list[int]
+    thumbnails: list[Path]
+    image_paths: list[str]
+    extra: dict[str, Any]
+
+    def __init__(self, items: Mapping[str, Any] | None = None) -> None:
+        """
+        Initialise meta object.
+
+        Args:
+            items: initial metadata
+        """
+        self.extra = {}
+        if items is not None:
+            for key, value in items.items():
+                self[key] = value
+
+    def __getitem__(self, key: str) -> Any:
+        """
+        Get metadata value, empty string if missing.
+
+        Args:
+            key: metadata key
+
+        Returns:
+            metadata value
+        """
+        if key in META_FIELDS:
+            return getattr(self, key, "")
+
+        return self.extra.get(key, "")
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Get metadata value, default if not set, like dict and defaultdict get.
+
+        Args:
+            key: metadata key
+            default: value if not set
+
+        Returns:
+            metadata value
+        """
+        return self[key] if key in self else default
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        """
+        Set metadata value.
+
+        Args:
+            key: metadata key
+            value: metadata value
+        """
+        if key in META_FIELDS:
+            setattr(self, key, value)
+        else:
+            self.extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        """
+        Delete metadata value.
+
+        Args:
+            key: metadata key
+
+        Raises:
+            KeyError
+        """
+        if key not in self:
+            raise KeyError(key)
+
+        if key in META_FIELDS:
+            delattr(self, key)
+        else:
+            del self.extra[key]
+
+    def __contains__(self, key: object) -> bool:
+        """
+        Check if a metadata key is set.
+
+        Args:
+            key: metadata key
+
+        Returns:
+            True if set
+        """
+        if key in META_FIELDS:
+            return hasattr(self, key)  # type: ignore
+
+        return key in self.extra
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Iterate over a snapshot of set keys, safe to assign while iterating.
+
+        Returns:
+            key iterator
+        """
+        keys = [key for key in META_FIELDS if hasattr(self, key)]
+        return iter(keys + list(self.extra))
+
+    def __len__(self) -> int:
+        """
+        Count set keys.
+
+        Returns:
+            number of keys
+        """
+        return sum(hasattr(self, key) for key in META_FIELDS) + len(self.extra)
+
+    def __eq__(self, other: object) -> bool:
+        """
+        Compare with another mapping.
+
+        Args:
+            other: object to compare with
+
+        Returns:
+            True if equal
+        """
+        if not isinstance(other, Mapping):
+            return NotImplemented
+
+        return dict(self.items()) == dict(other.items())
+
+    __hash__ = None  # type: ignore
+
+    def fingerprint(self) -> str:
+        """
+        Hash metadata, changes whenever anything rendered from it may change.
+
+        Returns:
+            hex digest
+        """
+        items = sorted(self.items(), key=lambda item: item[0])
+        data = json.dumps(items, default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def __repr__(self) -> str:
+        """
+        Represent meta object.
+
+        Returns:
+            representation string
+        """
+        return "Meta({items})".format(items=dict(self.items()))
+
+
+def slugify(text: str) -> str:
+    """
+    Turn text into a URL path segment.
+
+    Args:
+        text: text to slugify
+
+    Returns:
+        slug
+    """
+    return re.sub(r"[^\w]+", "-", text.strip().lower()).strip("-")
+
+
+def today() -> str:
+    """
+    Date of the build.
+
+    The SOURCE_DATE_EPOCH environment variable, seconds since the epoch, sets it
+    for reproducible builds. Otherwise it is the current date, taken when called
+    rather than when mysgen is imported.
+
+    Returns:
+        date string
+    """
+    epoch = os.getenv("SOURCE_DATE_EPOCH")
+    if epoch:
+        return datetime.fromtimestamp(int(epoch), tz=timezone.utc).strftime(DATE_FORMAT)
+
+    return datetime.now().strftime(DATE_FORMAT)
+
+
+def uses_variable(env: Environment, name: str, variable: str) -> bool:
+    """
+    Check if a template, or a template it extends or includes, uses a variable.
+
+    Args:
+        env: Jinja environment
+        name: template name
+        variable: variable name
+
+    Returns:
+        True if the variable is used
+    """
+    seen = set()
+    names = [name]
+    while names:
+        name = names.pop()
+        if name in seen:
+            continue
+
+        seen.add(name)
+        source = env.loader.get_source(env, name)[0]  # type: ignore
+        ast = env.parse(source)
+        if variable in jinja_meta.find_undeclared_variables(ast):
+            return True
+
+        names.extend(
+            ref for ref in jinja_meta.find_referenced_templates(ast) if ref is not None
+        )
+
+    return False
+
+
+def url(path: Path) -> str:
+    """
+    Absolute site URL of a build path.
+
+    Args:
+        path: path relative to the build path
+
+    Returns:
+        url string
+    """
+    return join("/", path.as_posix()) if str(path) != "." else "/"
+
+
+def fragment_url(link: str, kind: str = "html") -> str:
+    """
+    Site URL of the fragment payload of a page.
+
+    Args:
+        link: page link, as in menuitems
+        kind: payload kind, html or json
+
+    Returns:
+        url string
+    """
+    return url(Path(link, PAYLOAD + "." + kind))
+
+
+def pages_key(pages: Mapping[str, Any]) -> str:
+    """
+    Hash the names, titles and content of pages, as listing pages show them.
+
+    Args:
+        pages: pages by name
+
+    Returns:
+        hex digest
+    """
+    key = hashlib.sha256()
+    for name, page in pages.items():
+        key.update(json.dumps([name, page.meta["title"]]).encode("utf-8"))
+        key.update(hashlib.sha256(page.content.encode("utf-8")).digest())
+
+    return key.hexdigest()
+
+
+def paginate(
+    path: Path, articles: list[Meta], per_page: int, segment: str = PAGE_SEGMENT
+) -> list[tuple[Path, list[Meta], dict[str, Any]]]:
+    """
+    Split articles, sorted newest first, into listing pages.
+
+    Pages are filled from the oldest article. Older pages keep both content and
+    URL when a post is added, only the newest page at path changes, until it is
+    full and a new one is started. Older pages go to path/segment/<n>.
+
+    Args:
+        path: path of the newest page
+        articles: articles sorted newest first
+        per_page: articles per page, zero or less for a single page
+        segment: path segment of the older pages
+
+    Returns:
+        list of page path, page articles and paginator, newest page first
+    """
+    if per_page <= 0 or len(articles) <= per_page:
+        chunks = [articles]
+    else:
+        oldest_first = articles[::-1]
+        chunks = [
+            oldest_first[i : i + per_page][::-1]
+            for i in range(0, len(oldest_first), per_page)
+        ][::-1]
+
+    count = len(chunks)
+    paths = [path] + [path / segment / str(count - i) for i in range(1, count)]
+    pages = []
+    for i, chunk in enumerate(chunks):
+        paginator = {
+            "number": i + 1,
+            "count": count,
+            "url": url(paths[i]),
+            "newer": url(paths[i - 1]) if i > 0 else "",
+            "older": url(paths[i + 1]) if i < count - 1 else "",
+        }
+        pages.append((paths[i], chunk, paginator))
+
+    return pages
+
+
+class Taxonomy:
+    """Inverted index from taxonomy terms to published posts."""
+
+    __slots__ = ("name", "terms")
+
+    def __init__(self, name: str) -> None:
+        """
+        Initialise taxonomy object.
+
+        Args:
+            name: taxonomy name, such as tags
+        """
+        self.name = name
+        self.terms: dict[str, list[Meta]] = {}
+
+    def add(self, term: str, meta: Meta) -> None:
+        """
+        Add post to a term.
+
+        Args:
+            term: taxonomy term
+            meta: post metadata
+        """
+        self.terms.setdefault(term, []).append(meta)
+
+    def sort(self) -> None:
+        """Sort terms by name and their posts by date, newest first."""
+        self.terms = {
+            term: sorted(posts, key=lambda x: x["date"], reverse=True)
+            for term, posts in sorted(self.terms.items())
+        }
+
+    def posts(self, term: str) -> list[Meta]:
+        """
+        Get posts of a term.
+
+        Args:
+            term: taxonomy term
+
+        Returns:
+            posts sorted newest first
+        """
+        return self.terms.get(term, [])
+
+    def counts(self) -> dict[str, int]:
+        """
+        Count posts per term.
+
+        Returns:
+            term counts
+        """
+        return {term: len(posts) for term, posts in self.terms.items()}
+
+
+class Placeholders:
+    """
+    Placeholder substitution in one pass over the content.
+
+    Fixed tokens, like {{post_url}}, map to value names and parameterised
+    tokens, {{name:argument}}, to functions of their argument, like
+    {{asset:css/foo.css}}. All of them are compiled into one regular
+    expression, so adding placeholders does not add passes over the content.
+    Unknown tokens are left as they are.
+    """
+
+    def __init__(
+        self,
+        tokens: Mapping[str, str],
+        functions: Mapping[str, Callable[[str], str | None]] | None = None,
+    ) -> None:
+        """
+        Initialise placeholders object.
+
+        Args:
+            tokens: value name by token
+            functions: function of the argument by name
+        """
+        self.tokens = {token: name for token, name in tokens.items() if token}
+        self.functions = dict(functions or {})
+        alternatives = [
+            re.escape(token) for token in sorted(self.tokens, key=len, reverse=True)
+        ]
+        if self.functions:
+            names = "|".join(re.escape(name) for name in sorted(self.functions))
+            alternatives.append(
+                r"\{\{(?P<function>" + names + r"):(?P<argument>[^{}]*)\}\}"
+            )
+        self.pattern = re.compile("|".join(alternatives)) if alternatives else None
+
+    def substitute(self, text: str, values: Mapping[str, str]) -> tuple[str, set[str]]:
+        """
+        Substitute placeholders in text.
+
+        Args:
+            text: text
+            values: value by name, for fixed tokens
+
+        Returns:
+            substituted text and the names of substituted placeholders
+        """
+        used: set[str] = set()
+        if self.pattern is None:
+            return text, used
+
+        def replace(match: re.Match) -> str:
+            function = match.group("function") if self.functions else None
+            if function:
+                value = self.functions[function](match.group("argument"))
+                name = function
+            else:
+                name = self.tokens[match.group(0)]
+                value = values.get(name)
+            if value is None:
+                logger.info("Placeholder {token} not resolved.".format(token=match[0]))
+                return match.group(0)
+
+            used.add(name)
+            return value
+
+        return self.pattern.sub(replace, text), used
+
+    def stream(
+        self, load: Callable[[], str], values: Mapping[str, str]
+    ) -> Callable[[], str]:
+        """
+        Substitute placeholders in streamed content, whenever it is loaded.
+
+        Args:
+            load: function loading the content
+            values: value by name, for fixed tokens
+
+        Returns:
+            function loading the substituted content
+        """
+        return partial(self._load, load, dict(values))
+
+    def _load(self, load: Callable[[], str], values: Mapping[str, str]) -> str:
+        """
+        Load content and substitute placeholders.
+
+        Args:
+            load: function loading the content
+            values: value by name, for fixed tokens
+
+        Returns:
+            substituted content
+        """
+        return self.substitute(load(), values)[0]
+
+
+class FragmentCache:
+    """
+    Rendered template fragments, cached by template source and context.
+
+    Exposed to templates as fragment, e.g. fragment("archive_kernel.html",
+    article=article). Fragments not used for FRAGMENT_MAX_AGE builds are dropped.
+    """
+
+    __slots__ = ("env", "document", "sources")
+
+    def __init__(self, env: Environment, document: dict[str, Any]) -> None:
+        """
+        Initialise fragment cache object.
+
+        Args:
+            env: Jinja environment
+            document: cache document holding the fragments
+        """
+        self.env = env
+        self.document = document
+        self.document["build"] = self.document.get("build", 0) + 1
+        self.document.setdefault("fragments", {})
+        self.sources: dict[str, str] = {}
+
+    def __call__(self, name: str, **context: Any) -> Markup:
+        """
+        Render a template fragment, or reuse it if rendered before.
+
+        Args:
+            name: template name
+            context: template variables
+
+        Returns:
+            rendered fragment
+        """
+        if name not in self.sources:
+            source = self.env.loader.get_source(self.env, name)[0]  # type: ignore
+            self.sources[name] = hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+        values = [
+            (key, value.fingerprint() if isinstance(value, Meta) else value)
+            for key, value in sorted(context.items())
+        ]
+        data = json.dumps([self.sources[name], values], default=str)
+        key = hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+        fragments = self.document["fragments"]
+        if key not in fragments:
+            fragments[key] = [self.env.get_template(name).render(**context), 0]
+
+        fragments[key][1] = self.document["build"]
+        return Markup(fragments[key][0])
+
+    def prune(self) -> None:
+        """Drop fragments not used in the last FRAGMENT_MAX_AGE builds."""
+        oldest = self.document["build"] - FRAGMENT_MAX_AGE
+        self.document["fragments"] = {
+            key: value
+            for key, value in self.document["fragments"].items()
+            if value[1] > oldest
+        }
 
 
 class Item:
-    """Item base class."""
+    """
+    Item base class.
+
+    The content is either a string or, when streamed, a function loading it,
+    so it is only in memory while it is used. Dated items have the build date
+    in their content.
+    """
+
+    __slots__ = ("meta", "_content", "dated") + ITEM_PATHS
 
     def __init__(
         self,
-        meta: defaultdict[str, Any],
-        content: str,
+        meta: Meta,
+        content: str | Callable[[], str],
         src_path: Path,
         build_path: Path,
     ) -> None:
@@ -46,16 +656,83 @@ class Item:
 
         Args:
             meta: meta dictionary
-            content: content string
+            content: content string, or a function loading it
             src_path: src path of item
             build_path: build path of item
         """
         self.meta = meta
         self.content = content
-        self.src_path = Path(src_path)
-        self.build_path = Path(build_path)
-        self.from_path: Path = Path()
-        self.to_path: Path = Path()
+        self.dated = False
+        self.src_path = intern_path(src_path)
+        self.build_path = intern_path(build_path)
+        self.from_path: Path = intern_path("")
+        self.to_path: Path = intern_path("")
+
+    def __getstate__(self) -> dict[str, Any]:
+        """
+        Get state for pickling.
+
+        Returns:
+            state dictionary
+        """
+        state = {slot: getattr(self, slot) for slot in Item.__slots__}
+        state["_content"] = self.content
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        """
+        Set state when unpickling, re-interning shared paths.
+
+        Args:
+            state: state dictionary
+        """
+        self.dated = False
+        for slot, value in state.items():
+            if slot in ("src_path", "build_path"):
+                value = intern_path(value)
+            setattr(self, slot, value)
+
+    @property
+    def content(self) -> str:
+        """
+        Content, loaded on every access if streamed.
+
+        Returns:
+            content string
+        """
+        content = self._content
+        return content() if callable(content) else content
+
+    @content.setter
+    def content(self, content: str | Callable[[], str]) -> None:
+        """
+        Set content.
+
+        Args:
+            content: content string, or a function loading it
+        """
+        self._content = content
+
+    @property
+    def loader(self) -> Callable[[], str] | None:
+        """
+        Function loading the content, if streamed.
+
+        Returns:
+            loader, None if the content is in memory
+        """
+        return self._content if callable(self._content) else None
+
+    def prepare(self, base: dict[str, Any]) -> None:
+        """
+        Fill the metadata taken from the files of the item, without writing.
+
+        All items are prepared before any item is rendered, so listings show
+        the same metadata in every build, sharded or scheduled.
+
+        Args:
+            base: base variables
+        """
 
     def abstract_process(
         self,
@@ -65,45 +742,156 @@ class Item:
         """
         Process item.
 
+        With stream_render the page is written while Jinja renders it, instead of
+        rendering the whole page into one string first.
+
         Args:
             base: base variables
             template: selected template
         """
-        item_html = template.render(base)
-        path = self.build_path / self.meta["path"]
-        html_file = path / INDEX
+        if base.get("stream_render"):
+            item_html: Iterable[str] = template.generate(base)
+        else:
+            item_html = [template.render(base)]
 
-        makedirs(path, exist_ok=True)
-        with open(html_file, "w") as file:
-            file.write(item_html)
+        sink = base.get("sink") or FileSystemSink()
+        html_file = self.build_path / self.meta["path"] / INDEX
+        chunks = (chunk.encode("utf-8") for chunk in item_html)
+        sink.write(html_file, chunks, base.get("outputs"))
 
-    def _patch_content(self, pattern: str, patch: str) -> None:
+        name = (template.name or "").split(".")[0]
+        if "date_outputs" in base and (
+            self.dated or name in base.get("date_templates", [])
+        ):
+            base["date_outputs"].append(sink.relative(html_file))
+
+        blocks = getattr(template, "blocks", {})
+        if base.get("fragment_payloads") and PAYLOAD_BLOCK in blocks:
+            self._write_payload(base, template, sink)
+
+    def _write_payload(
+        self,
+        base: dict[str, Any],
+        template: Template,
+        sink: Sink,
+    ) -> None:
         """
-        Patch markdown posts contain tags that need replacing.
+        Write the fragment payload of an item, for menu navigation.
+
+        The ajax_content block of the template is rendered on its own with the
+        context of the page, and written next to it as fragment.html, or as
+        fragment.json holding the title and html. Themes render the block in a
+        loop over the menu items, so on its own it gets title, the loop
+        variable, set to the page name, unless the page sets title.
 
         Args:
-            pattern: pattern to search for
-            patch: patch to apply in place of pattern
+            base: base variables
+            template: selected template
+            sink: output sink
         """
-        self.content = self.content.replace(pattern, patch)
+        context = template.new_context({"title": base.get("page_name"), **base})
+        html = "".join(getattr(template, "blocks")[PAYLOAD_BLOCK](context)).strip()
+        if base["fragment_payloads"] == "json":
+            payload = json.dumps(
+                {"title": self.meta["title"], "html": html},
+                separators=(",", ":"),
+                ensure_ascii=False,
+            )
+        else:
+            payload = html
 
-    def copy(self) -> None:
-        """Copy files from to."""
+        payload_file = (
+            self.build_path
+            / self.meta["path"]
+            / (PAYLOAD + "." + base["fragment_payloads"])
+        )
+        sink.write_bytes(payload_file, payload.encode("utf-8"), base.get("outputs"))
+
+    def copy(self, sink: Sink | None = None) -> None:
+        """
+        Copy files from to.
+
+        Args:
+            sink: output sink, the filesystem by default
+
+        Raises:
+            DistutilsFileError
+        """
+        sink = sink or FileSystemSink()
         try:
-            copy_tree(str(self.from_path), str(self.to_path))
+            sink.copy_tree(self.from_path, self.to_path)
         except DistutilsFileError:
             raise DistutilsFileError(
                 "File {from_path} not found.".format(from_path=self.from_path)
             )
 
+    def copy_data(self, base: dict[str, Any], write: bool = True) -> None:
+        """
+        Copy data files, with previews of tabular files if configured.
+
+        With data_previews every text table and NumPy array gets a compact JSON
+        preview next to it, with min and max decimated columns and summary
+        statistics, listed in meta previews by file name so pages can chart the
+        preview instead of the data. With data_raw false, files with a preview
+        are not copied.
+
+        Args:
+            base: base variables
+            write: write the files, else only fill meta previews
+
+        Raises:
+            DistutilsFileError
+        """
+        sink = base.get("sink") or FileSystemSink()
+        points = base.get("data_previews")
+        if not points:
+            if write:
+                self.copy(sink)
+            return
+
+        if not isdir(self.from_path):
+            raise DistutilsFileError(
+                "File {from_path} not found.".format(from_path=self.from_path)
+            )
+
+        points = PREVIEW_POINTS if points is True else points
+        digest = base["sources"].digest if base.get("sources") else file_digest
+        self.meta["previews"] = {}
+        for path, _, files in os.walk(self.from_path):
+            for name in sorted(files):
+                source = Path(path, name)
+                relative = source.relative_to(self.from_path)
+                data = None
+                if previewable(source):
+                    data = preview(
+                        source, points, digest(source), base.get("derivatives")
+                    )
+
+                if data is not None:
+                    target = self.to_path / relative.parent / (name + PREVIEW_SUFFIX)
+                    if write:
+                        sink.write_bytes(target, data, base.get("outputs"))
+                    summary = json.loads(data)
+                    self.meta["previews"][relative.as_posix()] = {
+                        "url": url(target.relative_to(self.build_path)),
+                        "rows": summary["rows"],
+                        "columns": summary["columns"],
+                        "summary": summary["summary"],
+                    }
+
+                if write and (data is None or base.get("data_raw", True)):
+                    sink.copy_file(source, self.to_path / relative)
+
 
 class Post(Item):
     """Post class."""
 
+    __slots__ = ()
+
     def __init__(
         self,
-        meta: defaultdict[str, Any],
-        content: str,
+        meta: Meta,
+        content: str | Callable[[], str],
         src_path: Path,
         build_path: Path,
     ) -> None:
@@ -112,7 +900,7 @@ class Post(Item):
 
         Args:
             meta: meta dictionary
-            content: content string
+            content: content string, or a function loading it
             src_path: src path of item
             build_path: build path of item
         """
@@ -131,7 +919,6 @@ class Post(Item):
             template: available templates dictionary
         """
         base["meta"] = self.meta
-        self._patch_content(base["post_url"], join("/", self.meta["path"]))
         base["article_content"] = self.content
         base["page"] = base["home"]
         base["page_name"] = INDEX.split(".")[0]
@@ -142,112 +929,258 @@ class Post(Item):
 class ImagePost(Post):
     """Image post."""
 
+    __slots__ = ()
+
     def __init__(
         self,
-        meta: defaultdict[str, Any],
-        content: str,
+        meta: Meta,
+        content: str | Callable[[], str],
         src_path: Path,
         build_path: Path,
+        source: Path | None = None,
     ) -> None:
         """
         Initialise post object.
 
         Args:
             meta: meta dictionary
-            content: content string
+            content: content string, or a function loading it
             src_path: src path of item
             build_path: build path of item
+            source: source path of item relative to src path, meta path if None
         """
         super().__init__(meta, content, src_path, build_path)
-        path = Path(*[path for path in self.meta["path"].parts if not path == "posts"])
+        source = source or self.meta["path"]
+        path = Path(*[path for path in source.parts if not path == "posts"])
         self.from_path = self.src_path / "images" / path
         self.to_path = self.build_path / self.meta["path"] / "images"
 
-    def process(
+    def prepare(self, base: dict[str, Any]) -> None:
+        """
+        Fill meta image_paths and thumbnails, without writing.
+
+        Args:
+            base: base variables
+        """
+        self._images(base)
+
+    def process(
+        self,
+        base: dict[str, Any],
+        template: dict[str, Template],
+    ) -> None:
+        """
+        Process all published posts.
+
+        Args:
+            base: base variables, copy
+            template: available templates dictionary
+        """
+        self._images(base, base.get("sink") or FileSystemSink())
+        super().process(base, template)
+
+    def _images(self, base: dict[str, Any], sink: Sink | None = None) -> None:
+        """
+        List the images and, with a sink, copy them and write their thumbnails.
+
+        Images are listed in meta image_paths in the order of their source
+        names. With mangle_image_name an image is copied straight to a name
+        from a hash of its content, so its URL only changes with its bytes.
+
+        Args:
+            base: base variables
+            sink: output sink, None to only fill the metadata
+
+        Raises:
+            DistutilsFileError
+        """
+        self.meta["thumbnail_size"] = base["thumbnail_size"]
+        self.meta["thumbnails"] = []
+        self.meta["image_paths"] = []
+
+        if not isdir(self.from_path):
+            raise DistutilsFileError(
+                "File {from_path} not found.".format(from_path=self.from_path)
+            )
+
+        images = []
+        for entry in scandir(self.from_path):
+            if entry.is_dir():
+                if sink is not None:
+                    sink.copy_tree(entry.path, self.to_path / entry.name)
+            elif "." in entry.name:
+                images.append(Path(entry.path))
+            elif sink is not None:
+                sink.copy_file(entry.path, self.to_path / entry.name)
+
+        images = sorted(images)
+        digest = base["sources"].digest if base.get("sources") else file_digest
+        for from_image in images:
+            name = from_image.name
+            if base["mangle_image_name"]:
+                name = digest(from_image)[:HASH_LENGTH] + from_image.suffix
+
+            if sink is not None:
+                sink.copy_file(from_image, self.to_path / name)
+            self.meta["image_paths"].append(name)
+            self._resize_image(
+                from_image,
+                self.to_path / name,
+                sink,
+                base.get("fingerprint_thumbnails", False),
+                base.get("derivatives"),
+                digest,
+            )
+
+    def _resize_image(
+        self,
+        source: Path,
+        image: Path,
+        sink: Sink | None = None,
+        fingerprinted: bool = False,
+        derivatives: MutableMapping[str, bytes | None] | None = None,
+        digest: Callable[[Path], str] = file_digest,
+    ) -> None:
+        """
+        Resize post images for photo gallery.
+
+        With derivatives, thumbnails are kept by a hash of the source image and
+        the thumbnail settings, so an image shared by sites is resized once.
+        Thumbnails are listed by name, the image itself if it is already small.
+        Without a sink only meta thumbnails is filled, and the image is only
+        resized if the thumbnail is named by its content.
+
+        Args:
+            source: source image path
+            image: output image path
+            sink: output sink, None to not write the thumbnail
+            fingerprinted: name thumbnails by a hash of their content
+            derivatives: thumbnails by content key, None if not small
+            digest: content hash of a file, e.g. from a stat index
+        """
+        if sink is None and not fingerprinted:
+            with Image.open(source) as img:
+                small = self._small(img.size)
+            data = None
+        else:
+            data = self._derivative(source, image.suffix, derivatives, digest)
+            small = data is None
+
+        thumbnail = Path(image.name)
+        if not small:
+            thumbnail = Path(image.stem + "_small" + image.suffix)
+            if fingerprinted and data is not None:
+                thumbnail = Path(
+                    fingerprint(thumbnail, hashlib.sha256(data).hexdigest())
+                )
+            if sink is not None and data is not None:
+                sink.write_bytes(image.parent / thumbnail, data)
+
+        self.meta["thumbnails"].append(thumbnail)
+
+    def _derivative(
         self,
-        base: dict[str, Any],
-        template: dict[str, Template],
-    ) -> None:
+        source: Path,
+        suffix: str,
+        derivatives: MutableMapping[str, bytes | None] | None = None,
+        digest: Callable[[Path], str] = file_digest,
+    ) -> bytes | None:
         """
-        Process all published posts.
+        Thumbnail of an image, kept in derivatives if given.
 
         Args:
-            base: base variables, copy
-            template: available templates dictionary
+            source: source image path
+            suffix: output image suffix, selecting the format
+            derivatives: thumbnails by content key, None if not small
+            digest: content hash of a file, e.g. from a stat index
+
+        Returns:
+            thumbnail image data, None if the image is already small
         """
-        self.copy()
-        self.meta["thumbnail_size"] = base["thumbnail_size"]
-        self.meta["thumbnails"] = []
-        self.meta["image_paths"] = []
+        if derivatives is None:
+            return self._thumbnail(source, suffix)
 
-        images = [to_image for to_image in self.to_path.glob("*.*") if isfile(to_image)]
-
-        if base["mangle_image_name"]:
-            sorted_images = sorted(images)
-            images = [
-                Path(
-                    to_image.parent,
-                    str(i)
-                    + "-"
-                    + hashlib.sha256(bytearray(to_image.stem, "utf-8")).hexdigest()[:7]
-                    + to_image.suffix,
-                )
-                for i, to_image in enumerate(sorted_images)
-            ]
-            for im, im_sha in zip(sorted_images, images):
-                shutil.move(im, im_sha)
+        key = hashlib.sha256(digest(source).encode("utf-8"))
+        key.update(json.dumps([self.meta["thumbnail_size"], suffix]).encode("utf-8"))
+        if key.hexdigest() not in derivatives:
+            derivatives[key.hexdigest()] = self._thumbnail(source, suffix)
+        return derivatives[key.hexdigest()]
 
-        for to_image in images:
-            self.meta["image_paths"].append(to_image.name)
-            self._resize_image(to_image)
+    def _small(self, size: tuple[int, int]) -> bool:
+        """
+        Check if an image needs no thumbnail.
 
-        super().process(base, template)
+        Args:
+            size: image size
 
-    def _resize_image(self, image: Path) -> None:
+        Returns:
+            True if the image fits the thumbnail size
         """
-        Resize post images for photo gallery.
+        return max(size) <= min(self.meta["thumbnail_size"])
 
-        Args:
-            image: image path
+    def _thumbnail(self, source: Path, suffix: str) -> bytes | None:
         """
-        with Image.open(image) as img:
-            if max(img.size) > min(self.meta["thumbnail_size"]):
-                img.thumbnail(
-                    self.meta["thumbnail_size"],
-                    resample=Image.Resampling.LANCZOS,
-                )
+        Thumbnail of an image.
+
+        Args:
+            source: source image path
+            suffix: output image suffix, selecting the format
 
-                image_parent = image.parent
-                image = Path(image.stem + "_small" + image.suffix)
-                img.save(image_parent / image, quality=95)
+        Returns:
+            thumbnail image data, None if the image is already small
+        """
+        with Image.open(source) as img:
+            if self._small(img.size):
+                return None
 
-            self.meta["thumbnails"].append(image)
+            img.thumbnail(
+                self.meta["thumbnail_size"],
+                resample=Image.Resampling.LANCZOS,
+            )
+            data = BytesIO()
+            image_format = Image.registered_extensions().get(suffix.lower(), img.format)
+            img.save(data, format=image_format, quality=95)
+            return data.getvalue()
 
 
 class DataPost(Post):
     """Data post."""
 
+    __slots__ = ()
+
     def __init__(
         self,
-        meta: defaultdict[str, Any],
-        content: str,
+        meta: Meta,
+        content: str | Callable[[], str],
         src_path: Path,
         build_path: Path,
+        source: Path | None = None,
     ) -> None:
         """
         Initialise post object.
 
         Args:
             meta: meta dictionary
-            content: content string
+            content: content string, or a function loading it
             src_path: src path of item
             build_path: build path of item
+            source: source path of item relative to src path, meta path if None
         """
         super().__init__(meta, content, src_path, build_path)
-        path = Path(*[path for path in self.meta["path"].parts if not path == "posts"])
+        source = source or self.meta["path"]
+        path = Path(*[path for path in source.parts if not path == "posts"])
         self.from_path = self.src_path / "data" / path
         self.to_path = self.build_path / self.meta["path"] / "data"
 
+    def prepare(self, base: dict[str, Any]) -> None:
+        """
+        Fill meta previews, without writing.
+
+        Args:
+            base: base variables
+        """
+        self.copy_data(base, write=False)
+
     def process(
         self,
         base: dict[str, Any],
@@ -260,17 +1193,19 @@ class DataPost(Post):
             base: base variables, copy
             template: available templates dictionary
         """
-        self.copy()
+        self.copy_data(base)
         super().process(base, template)
 
 
 class Page(Item):
     """Page class."""
 
+    __slots__ = ()
+
     def __init__(
         self,
-        meta: defaultdict[str, Any],
-        content: str,
+        meta: Meta,
+        content: str | Callable[[], str],
         src_path: Path,
         build_path: Path,
     ) -> None:
@@ -279,7 +1214,7 @@ class Page(Item):
 
         Args:
             meta: meta dictionary
-            content: content string
+            content: content string, or a function loading it
             src_path: src path of item
             build_path: build path of item
         """
@@ -297,41 +1232,101 @@ class Page(Item):
             base: base variables, copy
             template: available templates dictionary
         """
-        base["page_name"] = self.meta["path"].stem
+        base["page_name"] = self.meta["path"].stem or base["home"]
         page_path = Path(
             *[path for path in self.meta["path"].parts if not path == "pages"]
         )
         page_path = Path() if str(page_path) == base["home"] else page_path
         self.meta["path"] = page_path
 
-        self._patch_content(base["build_date_template"], str(base["build_date"]))
-        super().abstract_process(base, template[self.meta["type"]])
+        per_page = base.get("paginate", {}).get(base["page_name"], 0)
+        if per_page and "articles" in base:
+            self._process_listings(base, template, per_page)
+        else:
+            super().abstract_process(base, template[self.meta["type"]])
+
+    def _process_listings(
+        self,
+        base: dict[str, Any],
+        template: dict[str, Template],
+        per_page: int,
+    ) -> None:
+        """
+        Process a listing page as paginated listing pages.
+
+        Older pages of the home page share the URL space of pages, a warning is
+        logged if a page has the name of the paginate_segment.
+
+        Args:
+            base: base variables, copy
+            template: available templates dictionary
+            per_page: articles per page
+        """
+        segment = base.get("paginate_segment", PAGE_SEGMENT)
+        if str(self.meta["path"]) == "." and segment + ".md" in base.get("pages", {}):
+            logger.warning(
+                "Older home pages at /{segment}/<n> share the URL of page "
+                "{segment}, set paginate_segment.".format(segment=segment)
+            )
+
+        base["pages_key"] = pages_key(base.get("pages", {}))
+        for path, articles, paginator in paginate(
+            self.meta["path"], base["articles"], per_page, segment
+        ):
+            meta = Meta(self.meta)
+            meta["path"] = path
+            meta["name"] = base["page_name"]
+            meta["articles"] = articles
+            meta["paginator"] = paginator
+            page = ListingPage(
+                meta, self.loader or self.content, self.src_path, self.build_path
+            )
+            page.dated = self.dated
+            page.process(base.copy(), template)
 
 
 class DataPage(Page):
     """Data page."""
 
+    __slots__ = ()
+
     def __init__(
         self,
-        meta: defaultdict[str, Any],
-        content: str,
+        meta: Meta,
+        content: str | Callable[[], str],
         src_path: Path,
         build_path: Path,
+        source: Path | None = None,
     ) -> None:
         """
         Initialise page object.
 
         Args:
             meta: meta dictionary
-            content: content string
+            content: content string, or a function loading it
             src_path: src path of item
             build_path: build path of item
+            source: source path of item relative to src path, meta path if None
         """
         super().__init__(meta, content, src_path, build_path)
         path = Path(*[path for path in self.meta["path"].parts if not path == "pages"])
-        self.from_path = self.src_path / "data" / path
+        source = source or self.meta["path"]
+        self.from_path = (
+            self.src_path
+            / "data"
+            / Path(*[path for path in source.parts if not path == "pages"])
+        )
         self.to_path = self.build_path / path / "data"
 
+    def prepare(self, base: dict[str, Any]) -> None:
+        """
+        Fill meta previews, without writing.
+
+        Args:
+            base: base variables
+        """
+        self.copy_data(base, write=False)
+
     def process(
         self,
         base: dict[str, Any],
@@ -344,52 +1339,403 @@ class DataPage(Page):
             base: base variables, copy
             template: available templates dictionary
         """
-        self.copy()
+        self.copy_data(base)
         super().process(base, template)
 
 
+class ListingPage(Item):
+    """
+    Generated listing page, such as a tag page or one page of the archive.
+
+    A listing page is not rendered again while its signature is unchanged since
+    the last build and its output exists, sink listeners still get the output.
+    """
+
+    __slots__ = ()
+
+    def signature(self, base: dict[str, Any]) -> str:
+        """
+        Hash everything the listing page is rendered from.
+
+        Besides the articles this covers the menu and the pages, which change
+        without a change of templates or settings, and the taxonomies and posts
+        if the template uses them.
+
+        Args:
+            base: base variables
+
+        Returns:
+            hex digest
+        """
+        data = json.dumps(
+            [
+                base.get("render_key", ""),
+                base["build_date"]
+                if self.meta["type"] in base.get("date_templates", [])
+                else "",
+                str(self.meta["path"]),
+                self.meta["title"],
+                self.meta["paginator"],
+                [article.fingerprint() for article in self.meta["articles"]],
+                base.get("menuitems", {}),
+                base.get("js_menu", []),
+                base.get("pages_key") or pages_key(base.get("pages", {})),
+                [
+                    base.get("globals_keys", {}).get(name, "")
+                    for name in base.get("template_globals", {}).get(
+                        self.meta["type"], []
+                    )
+                ],
+            ]
+        )
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def process(
+        self,
+        base: dict[str, Any],
+        template: dict[str, Template],
+    ) -> None:
+        """
+        Process listing page.
+
+        Args:
+            base: base variables, copy
+            template: available templates dictionary
+        """
+        listings = base.get("listings", {})
+        key = str(self.meta["path"])
+        signature = self.signature(base)
+        html_file = self.build_path / self.meta["path"] / INDEX
+        sink = base.get("sink") or FileSystemSink()
+        if listings.get(key) == signature and sink.exists(html_file):
+            digest = base.get("outputs", {}).get(sink.relative(html_file), "")
+            sink.notify(html_file, partial(sink.read, html_file), digest)
+            return
+
+        base["meta"] = self.meta
+        base["page_name"] = self.meta["name"]
+        base["term"] = self.meta["title"]
+        base["articles"] = self.meta["articles"]
+        base["paginator"] = self.meta["paginator"]
+
+        super().abstract_process(base, template[self.meta["type"]])
+        listings[key] = signature
+
+
 class MySGEN:
     """MySGEN class."""
 
-    def __init__(self, config_file: str = CONFIG_FILE) -> None:
+    def __init__(
+        self,
+        config_file: str = CONFIG_FILE,
+        sink: Sink | None = None,
+        shared: SharedCaches | None = None,
+    ) -> None:
         """
         Initialise MySGEN object.
 
         Args:
             config_file: path to config file
+            sink: output sink, by default the build path or build_archive
+            shared: caches shared with other sites built in the same process
         """
         self.config_file = config_file
+        self.sink = sink
+        self.shared = shared
+        self.precompressor: Precompressor | None = None
+        self.minifier: Minifier | None = None
+        self.assets: Assets | None = None
+        self.feeds: Feeds | None = None
+        self.sitemap: Sitemap | None = None
+        self.articles: list[Meta] = []
+        self.parsed: set[str] = set()
+        self.blocks: BlockCache | None = None
+        self.shard: tuple[int, int] | None = None
         self.base: dict[str, Any] = {}
         self.template: dict[str, Template] = {}
         self.posts: dict[str, Any] = {}
         self.pages: dict[str, Any] = {}
         self.markdown: Any = None
+        self.cache = Cache()
+        self.taxonomies: dict[str, Taxonomy] = {}
+        self.fragments: FragmentCache | None = None
+        self.contents: ContentStore | None = None
+        self.sources = StatIndex({})
+        self.changed: list[str] = []
+
+    def build(
+        self,
+        shard: tuple[int, int] | None = None,
+        publish: Callable[[list[str]], None] | None = None,
+    ) -> None:
+        """
+        Build site.
+
+        With a shard, i of n, all items are parsed and the global indexes are
+        built from all of them, but only the posts, pages and listing pages of
+        the shard are rendered, into the shard directory. The first shard also
+        writes the search index, feeds and assets. merge combines the shards.
 
-    def build(self) -> None:
-        """Build site."""
+        With priority_posts, the home and menu pages and the newest posts are
+        rendered first, see process_scheduled.
+
+        Args:
+            shard: shard index and number of shards, None for a full build
+            publish: early-publish hook, called with the critical outputs
+        """
+        self.shard = shard
         self.set_base_config()
 
         if self.base["s3-bucket"]:
             self.copy_s3()
 
+        self.find_changes()
         self.define_environment()
+        if self.base.get("markdown_compare"):
+            self.compare_backends()
+
+        self.set_build_date()
         self.find_and_parse("posts")
         self.find_and_parse("pages")
+        self.substitute_placeholders()
         self.build_menu()
-        self.process("posts")
-        self.process("pages")
-        self.copy_assets()
+        self.build_taxonomies()
+        self.build_related()
+        self.prepare_items()
+        self.hash_globals()
+        state = self._global_state() if self.shard is not None else ""
+        scheduled = bool(self.base.get("priority_posts"))
+        if scheduled:
+            self.process_scheduled(publish)
+        else:
+            self.process("posts")
+            self.process("pages")
+        self.process_taxonomies()
+        if self.base.get("date_outputs"):
+            logger.info(
+                "Build date {date} shown by {outputs}.".format(
+                    date=self.base["build_date"],
+                    outputs=", ".join(sorted(set(self.base["date_outputs"]))),
+                )
+            )
+
+        if self.shard is None or self.shard[0] == 0:
+            self.build_search()
+            self.build_feeds()
+            if not scheduled:
+                self.copy_assets()
+
+        if self.sitemap is not None:
+            self.sitemap.finish()
+
+        if self.minifier is not None:
+            self.minifier.finish()
+
+        if self.precompressor is not None:
+            self.precompressor.finish()
+
+        self.save_cache()
+
+        if self.sink is not None:
+            self.sink.close()
+
+        if self.shard is not None:
+            date = str(self.base["build_date"])
+            write_manifest(self.base["build_path"], *self.shard, date, state)
+
+    def merge(self, count: int) -> None:
+        """
+        Merge the outputs of a build sharded into count shards into the build path.
+
+        The shard manifests have to agree on the global indexes. The sitemap, if
+        configured, is written from the merged pages.
+
+        Args:
+            count: number of shards
+        """
+        with open(self.config_file, "r") as file:
+            self.base = json.loads(file.read(), object_pairs_hook=OrderedDict)
+
+        self.cache = Cache(self.base.get("cache_path"))
+        sink = self._set_sink()
+        manifests = read_manifests(self.base["build_path"], count)
+        if self.base.get("sitemap"):
+            self.sitemap = Sitemap(
+                sink,
+                self.cache.load("sitemap"),
+                self.base["siteurl"],
+                manifests[0]["build_date"],
+            )
+
+        merge(sink, self.base["build_path"], manifests, self.cache.load("merged"))
+        if self.sitemap is not None:
+            self.sitemap.finish()
+
+        self.cache.save()
+        sink.close()
 
     def set_base_config(self) -> None:
-        """Set base configuration."""
+        """
+        Set base configuration.
+
+        Raises:
+            ValueError: if the shard is not one of the shards
+            NotImplementedError: if a sharded build goes to an archive or memory
+        """
         with open(self.config_file, "r") as file:
             self.base = json.loads(file.read(), object_pairs_hook=OrderedDict)
 
         self.base["tags"] = []
         self.base["categories"] = []
-        self.base["build_date"] = str(
-            datetime(TODAY.year, TODAY.month, TODAY.day).strftime("%Y-%m-%d")
+        self.base["build_date"] = today()
+        if self.shard is not None:
+            index, count = self.shard
+            if not 0 <= index < count:
+                raise ValueError(
+                    "Shard {index} of {count} does not exist.".format(
+                        index=index, count=count
+                    )
+                )
+
+            if (
+                self.base.get("build_archive")
+                if self.sink is None
+                else not isinstance(self.sink, FileSystemSink)
+            ):
+                raise NotImplementedError(
+                    "Sharded builds are written to directories only."
+                )
+
+            for path in ["build_path", "cache_path"]:
+                if self.base.get(path):
+                    self.base[path] = str(shard_path(self.base[path], *self.shard))
+
+        self.cache = Cache(self.base.get("cache_path"))
+        self.sources = StatIndex(self.cache.load("sources"))
+        sink = self._set_sink()
+        sink.sources = self.sources
+        sink.copies = self.cache.load("copies")
+        self.assets = Assets(
+            self.base["theme_path"],
+            self.base["build_path"],
+            self.base.get("fingerprint_assets", False),
+            self.sources.digest,
+        )
+
+        if self.base.get("sitemap") and self.shard is None:
+            self.sitemap = Sitemap(
+                sink,
+                self.cache.load("sitemap"),
+                self.base["siteurl"],
+                self.base["build_date"],
+            )
+
+        minify = self.base.get("minify")
+        if minify:
+            self.minifier = Minifier(
+                sink,
+                self.cache.load("minified"),
+                tuple(KINDS) if minify is True else minify,
+                self.cache.blobs(),
+            )
+
+        precompress = self.base.get("precompress")
+        if precompress:
+            self.precompressor = Precompressor(
+                sink,
+                self.cache.load("precompressed"),
+                FORMATS if precompress is True else precompress,
+                self.base.get("workers"),
+            )
+
+    def find_changes(self) -> list[str]:
+        """
+        Find the content and theme files changed since the last build.
+
+        Files are only hashed when their stat changed, the hashes are used by
+        the parse, copy and image stages through the stat index.
+
+        Returns:
+            changed file paths
+        """
+        self.changed, _ = self.sources.scan(
+            [self.base["src_path"], self.base["theme_path"]]
         )
+        return self.changed
+
+    def set_build_date(self) -> None:
+        """
+        Set the build date to the date the site last changed, if configured.
+
+        With build_date_source content the build date only moves when templates,
+        settings or the source of any post or page changed since the last build,
+        so rebuilding unchanged content on a new day reproduces the same outputs.
+        SOURCE_DATE_EPOCH takes precedence.
+        """
+        if self.base.get("build_date_source") != "content" or os.getenv(
+            "SOURCE_DATE_EPOCH"
+        ):
+            return
+
+        key = hashlib.sha256(self.base["render_key"].encode("utf-8"))
+        src_path = Path(self.base["src_path"])
+        for item_type in ["posts", "pages"]:
+            for item_path in find_sources(Path(src_path, item_type)):
+                key.update(item_path.as_posix().encode("utf-8"))
+                key.update(self.sources.digest(item_path).encode("utf-8"))
+
+        document = self.cache.load("build_date")
+        if document.get("key") != key.hexdigest():
+            document["key"] = key.hexdigest()
+            document["date"] = self.base["build_date"]
+
+        self.base["build_date"] = document["date"]
+        if self.sitemap is not None:
+            self.sitemap.date = document["date"]
+
+    def substitute_placeholders(self) -> None:
+        """
+        Substitute placeholders in the content of all items, in one pass each.
+
+        Fixed tokens are post_url, the URL of a post, build_date_template, the
+        build date, {{siteurl}} and the constant tokens of placeholders.
+        Parameterised tokens are {{asset:path}}, an asset URL, and {{post:slug}},
+        a post URL. Items with the build date in their content are marked dated,
+        so the outputs showing it are reported.
+        """
+        tokens = {
+            self.base["post_url"]: "post_url",
+            self.base["build_date_template"]: "build_date",
+            "{{siteurl}}": "siteurl",
+        }
+        constants = dict(self.base.get("placeholders", {}))
+        tokens.update({token: token for token in constants})
+
+        posts = {}
+        for post in self.posts.values():
+            posts[post.meta["slug"] or post.meta["path"].name] = url(post.meta["path"])
+
+        functions: dict[str, Callable[[str], str | None]] = {"post": posts.get}
+        if self.assets is not None:
+            functions["asset"] = self.assets.url
+
+        placeholders = Placeholders(tokens, functions)
+        values = {
+            "build_date": str(self.base["build_date"]),
+            "siteurl": self.base.get("siteurl", ""),
+            **constants,
+        }
+        for items in [self.posts, self.pages]:
+            for item in items.values():
+                item_values = values
+                if items is self.posts:
+                    item_values = {**values, "post_url": join("/", item.meta["path"])}
+                content, used = placeholders.substitute(item.content, item_values)
+                load = item.loader
+                item.content = (
+                    content if load is None else placeholders.stream(load, item_values)
+                )
+                item.dated = "build_date" in used
 
     def define_environment(self) -> None:
         """Define Jinja environment."""
@@ -398,13 +1744,93 @@ class MySGEN:
             loader=FileSystemLoader(templates_path),  # nosec
             trim_blocks=True,  # nosec
             lstrip_blocks=True,  # nosec
+            bytecode_cache=(
+                self.shared.templates if self.shared else self.cache.templates()
+            ),  # nosec
         )  # nosec
 
-        for file in scandir(templates_path):
+        settings = {k: v for k, v in self.base.items() if k not in UNRENDERED_SETTINGS}
+        key = hashlib.sha256(json.dumps(settings, default=str).encode("utf-8"))
+        date_templates = []
+        template_globals = {}
+        for file in sorted(scandir(templates_path), key=lambda x: x.name):
             if file.is_file() and ".html" in file.name:
-                self.template[file.name.split(".")[0]] = env.get_template(file.name)
+                name = file.name.split(".")[0]
+                self.template[name] = env.get_template(file.name)
+                with open(file.path, "rb") as template_file:
+                    key.update(template_file.read())
+                if uses_variable(env, file.name, "build_date"):
+                    date_templates.append(name)
+                template_globals[name] = [
+                    variable
+                    for variable in LISTING_GLOBALS
+                    if uses_variable(env, file.name, variable)
+                ]
+
+        self.base["render_key"] = key.hexdigest()
+        self.base["date_templates"] = date_templates
+        self.base["template_globals"] = template_globals
+        self.base["date_outputs"] = []
+        self.base["listings"] = self.cache.load("listings")
+        self.base["outputs"] = self.cache.load("outputs")
+        self.base["sink"] = self.sink
+        self.base["sources"] = self.sources
+        if self.shared is not None:
+            self.base["derivatives"] = self.shared.images
+        else:
+            self.base["derivatives"] = self.cache.blobs()
+        self.fragments = FragmentCache(env, self.cache.load("fragments"))
+        env.globals["fragment"] = self.fragments
+        if self.assets is not None:
+            env.globals["asset_url"] = self.assets.url
+        env.globals["fragment_url"] = partial(
+            fragment_url, kind=self.base.get("fragment_payloads") or "html"
+        )
+
+        backend = self.base.get("markdown_backend", MARKDOWN_BACKEND)
+        self.markdown = converter(backend, self.base["markdown_extensions"])
+        if self.base.get("stream_content"):
+            self.contents = ContentStore(self.cache.blobs())
+
+        block_cache = self.base.get("block_cache", BLOCK_CACHE_SIZE)
+        if block_cache:
+            self.blocks = BlockCache(
+                self.cache.load("blocks"),
+                [backend, self.base["markdown_extensions"]],
+                block_cache,
+            )
+
+    def compare_backends(self) -> dict[str, str]:
+        """
+        Diff the HTML of the Markdown backend and markdown_compare for all content.
 
-        self.markdown = markdown.Markdown(extensions=self.base["markdown_extensions"])
+        With markdown_compare true the other backend is compared. Differences
+        are logged as warnings, the build goes on with the configured backend.
+
+        Returns:
+            unified diff by path, of the files that differ
+        """
+        backend = self.base.get("markdown_backend", MARKDOWN_BACKEND)
+        other = self.base["markdown_compare"]
+        if other is True:
+            other = next(name for name in BACKENDS if name != backend)
+
+        paths = sorted(Path(self.base["src_path"]).rglob("*.md"))
+        diffs = compare(paths, self.base["markdown_extensions"], (backend, other))
+        for name, diff in diffs.items():
+            logger.warning(
+                "Markdown backends differ for {name}:\n{diff}".format(
+                    name=name, diff=diff
+                )
+            )
+
+        logger.info(
+            "{count} of {total} Markdown files differ between {backend} and "
+            "{other}.".format(
+                count=len(diffs), total=len(paths), backend=backend, other=other
+            )
+        )
+        return diffs
 
     def build_menu(self) -> None:
         """Build the main menu based on pages."""
@@ -417,16 +1843,138 @@ class MySGEN:
 
         self.base["js_menu"] = list(self.base["menuitems"].keys())
 
+    def build_taxonomies(self) -> None:
+        """Build the inverted taxonomy index of published posts."""
+        self.taxonomies = {name: Taxonomy(name) for name in TAXONOMIES}
+        for post in self.posts.values():
+            if post.meta["status"] != "published":
+                continue
+
+            for name, key in TAXONOMIES.items():
+                terms = post.meta[key]
+                terms = [terms] if isinstance(terms, str) else terms
+                for term in dict.fromkeys(term.strip() for term in terms):
+                    if term:
+                        self.taxonomies[name].add(term, post.meta)
+
+        for name, taxonomy in self.taxonomies.items():
+            taxonomy.sort()
+            self.base[name] = list(taxonomy.terms)
+
+        self.base["taxonomies"] = self.taxonomies
+
+    def build_related(self) -> None:
+        """Set the related posts of published posts as meta related."""
+        count = self.base.get("related_posts")
+        if not count:
+            return
+
+        published = {
+            post.meta["path"].as_posix(): post
+            for post in self.posts.values()
+            if post.meta["status"] == "published"
+        }
+
+        def documents() -> Iterator[tuple[str, str, str, list[str], str]]:
+            for key, post in published.items():
+                meta = post.meta
+                tags = meta["tags"]
+                tags = tags if isinstance(tags, list) else [tags]
+                text = meta["title"] + " " + post.content
+                fingerprint = hashlib.sha256(
+                    json.dumps([text, tags, meta["category"]]).encode("utf-8")
+                ).hexdigest()
+                yield key, fingerprint, text, tags, meta["category"]
+
+        related = RelatedPosts(self.cache.load("related"), count).update(documents())
+        for key, post in published.items():
+            post.meta["related"] = [
+                {
+                    "title": published[other].meta["title"],
+                    "url": url(published[other].meta["path"]),
+                    "date": published[other].meta["date"],
+                    "score": round(score, 4),
+                }
+                for other, score in related[key]
+            ]
+
+    def build_feeds(self) -> None:
+        """Write Atom and or RSS feeds of the newest published posts."""
+        kinds = self.base.get("feeds")
+        if not kinds:
+            return
+
+        size = self.base.get("feed_size", FEED_SIZE)
+        posts = {post.meta["path"]: post for post in self.posts.values()}
+        entries = [
+            (
+                url(meta["path"]),
+                {
+                    "title": meta["title"],
+                    "date": meta["date"],
+                    "content": posts[meta["path"]].content,
+                },
+            )
+            for meta in self.articles[:size]
+        ]
+        self.feeds = Feeds(self.cache.load("feeds"), self.base)
+        self.feeds.write(
+            self.sink or FileSystemSink(),
+            self.base["build_path"],
+            entries,
+            kinds,
+            size,
+        )
+
+    def build_search(self) -> None:
+        """Update and write the client search index of published posts."""
+        if not self.base.get("search"):
+            return
+
+        def documents() -> Iterator[tuple[str, str, dict[str, Any]]]:
+            for post in self.posts.values():
+                if post.meta["status"] != "published":
+                    continue
+
+                meta = post.meta
+                tags = meta["tags"]
+                tags = tags if isinstance(tags, list) else [tags]
+                content = post.content
+                text = " ".join([meta["title"], meta["category"], *tags, content])
+                date = meta["date"]
+                document = {
+                    "title": meta["title"],
+                    "url": url(meta["path"]),
+                    "date": date.strftime("%Y-%m-%d") if date else "",
+                    "text": text,
+                }
+                key = hashlib.sha256(
+                    (meta.fingerprint() + content).encode("utf-8")
+                ).hexdigest()
+                yield meta["path"].as_posix(), key, document
+
+        index = SearchIndex(
+            self.cache.load("search"),
+            self.base.get("search_prefix_length", PREFIX_LENGTH),
+        )
+        index.update(documents())
+        index.write(self.sink or FileSystemSink(), self.base["build_path"])
+
     def find_and_parse(self, item_type: str) -> None:
         """
         Find and parse items.
 
+        Items are found in the item type directory and its subdirectories, such
+        as posts/2024/05/slug.md, and named by their path within it. Images and
+        data of nested items are found at the same path under images and data.
+        A missing or empty item type directory has no items.
+
         Args:
             item_type: type of item to process
 
         Raises:
             NotImplementedError
-            FileNotFoundError
+            ValueError: if two items have the same output path
         """
         if item_type != "posts" and item_type != "pages":
             raise NotImplementedError(
@@ -435,35 +1983,76 @@ class MySGEN:
 
         src_path = Path(self.base["src_path"])
         build_path = Path(self.base["build_path"])
-        all_item_paths = Path(src_path, item_type).glob("*.md")
-        if not all_item_paths:
-            raise FileNotFoundError(
-                "Item {item_type} not found.".format(item_type=item_type)
-            )
-
+        all_item_paths = find_sources(Path(src_path, item_type))
+        outputs: dict[Path, Path] = {}
         for item_path in all_item_paths:
-            item = item_path.parts[-1]
+            item = item_path.relative_to(Path(src_path, item_type)).as_posix()
+            source = item_path.relative_to(src_path).with_suffix("")
             meta, content = self._parse(item_path)
+            if outputs.setdefault(meta["path"], source) != source:
+                raise ValueError(
+                    "Items {first} and {second} have the same output path.".format(
+                        first=outputs[meta["path"]], second=source
+                    )
+                )
 
+            args = (meta, content, src_path, build_path)
             if item_type == "pages":
                 if "data" in meta and meta["data"] is not False:
-                    self.pages[item] = DataPage(meta, content, src_path, build_path)
+                    self.pages[item] = DataPage(*args, source=source)
                 else:
-                    self.pages[item] = Page(meta, content, src_path, build_path)
+                    self.pages[item] = Page(*args)
             else:
                 if "image" in meta and meta["image"] is not False:
-                    self.posts[item] = ImagePost(meta, content, src_path, build_path)
+                    self.posts[item] = ImagePost(*args, source=source)
                 elif "data" in meta and meta["data"] is not False:
-                    self.posts[item] = DataPost(meta, content, src_path, build_path)
+                    self.posts[item] = DataPost(*args, source=source)
                 else:
-                    self.posts[item] = Post(meta, content, src_path, build_path)
+                    self.posts[item] = Post(*args)
+
+    def prepare_items(self) -> None:
+        """
+        Fill the metadata taken from item files, of all published items.
 
-    def process(self, item_type: str) -> None:
+        Image paths, thumbnails and data previews are listed before any item is
+        rendered, also for items of other shards, so every listing shows them.
+        """
+        for items in [self.posts, self.pages]:
+            for item in items.values():
+                if item.meta["status"] == "published":
+                    item.prepare(self.base)
+
+    def hash_globals(self) -> None:
+        """
+        Hash the global variables listing pages may show, besides their articles.
+
+        The taxonomy terms and counts and the metadata of all posts are hashed
+        once per build, the signature of a listing page covers the hashes of
+        the variables its template uses.
+        """
+        values = {
+            "tags": self.base.get("tags", []),
+            "categories": self.base.get("categories", []),
+            "taxonomies": {
+                name: taxonomy.counts() for name, taxonomy in self.taxonomies.items()
+            },
+            "all_posts": [
+                [name, post.meta.fingerprint()]
+                for name, post in sorted(self.posts.items())
+            ],
+        }
+        self.base["globals_keys"] = {
+            name: hashlib.sha256(json.dumps(value).encode("utf-8")).hexdigest()
+            for name, value in values.items()
+        }
+
+    def process(self, item_type: str, names: Iterable[str] | None = None) -> None:
         """
         Process items based on type.
 
         Args:
             item_type: type of item to process
+            names: names of the items to process, None for all
 
         Raises:
             NotImplementedError
@@ -482,6 +2071,7 @@ class MySGEN:
                 key=lambda x: x["date"],
                 reverse=True,  # type: ignore
             )
+            self.articles = posts_metadata
             base["pages"] = self.pages
             base["articles"] = posts_metadata
             base["all_posts"] = self.posts
@@ -490,12 +2080,142 @@ class MySGEN:
                 "Item type {item_type} not implemented.".format(item_type=item_type)
             )
 
-        for _, item_object in data.items():
-            if item_object.meta["status"] == "published":
+        for name in data if names is None else names:
+            item_object = data[name]
+            if item_object.meta["status"] == "published" and self._in_shard(
+                item_type + "/" + name
+            ):
                 item_object.process(base, self.template)
 
+    def process_scheduled(
+        self, publish: Callable[[list[str]], None] | None = None
+    ) -> list[str]:
+        """
+        Process the critical items first, then the long tail.
+
+        The critical items are the home and menu pages and the priority_posts
+        newest posts. They are rendered, with the assets, before any other item,
+        then publish is called with their outputs, so a fresh post can go live
+        while older content is still rendering. The metadata of all items is
+        prepared before, so no critical output is rendered twice.
+
+        Args:
+            publish: early-publish hook, called with the critical outputs
+
+        Returns:
+            critical outputs, relative to the build path
+        """
+        count = self.base["priority_posts"]
+        critical = critical_items(
+            self.posts,
+            self.pages,
+            self.base["home"],
+            self.base["menuitems"],
+            PRIORITY_POSTS if count is True else count,
+        )
+        sink = self.sink or FileSystemSink(self.base["build_path"])
+        outputs: list[str] = []
+
+        def record(path: Path, read: Callable[[], bytes], digest: str = "") -> None:
+            outputs.append(sink.relative(path))
+
+        start = time.perf_counter()
+        sink.listeners.append(record)
+        try:
+            self.process("posts", critical["posts"])
+            self.process("pages", critical["pages"])
+            if self.shard is None or self.shard[0] == 0:
+                self.copy_assets()
+        finally:
+            sink.listeners.remove(record)
+
+        logger.info(
+            "Rendered {count} critical outputs in {seconds:.2f} s.".format(
+                count=len(outputs), seconds=time.perf_counter() - start
+            )
+        )
+        if publish is not None:
+            publish(sorted(set(outputs)))
+
+        self.process("posts", [n for n in self.posts if n not in critical["posts"]])
+        self.process("pages", [n for n in self.pages if n not in critical["pages"]])
+        return outputs
+
+    def process_taxonomies(self) -> None:
+        """
+        Process a paginated listing page per term of the configured taxonomies.
+
+        Signatures of the listing pages are kept per taxonomy, apart from the
+        listing pages of pages, and pruned to the pages of this build.
+        """
+        src_path = Path(self.base["src_path"])
+        build_path = Path(self.base["build_path"])
+        per_page = self.base.get("paginate", {})
+        segment = self.base.get("paginate_segment", PAGE_SEGMENT)
+        listings = self.cache.load("taxonomy_listings")
+        base = {
+            **self.base,
+            "pages": self.pages,
+            "pages_key": pages_key(self.pages),
+        }
+
+        for name, template in self.base.get("taxonomy_templates", {}).items():
+            previous = listings.get(name, {})
+            base["listings"] = previous
+            seen = set()
+            for term, posts in self.taxonomies[name].terms.items():
+                path = Path(name, slugify(term))
+                if not self._in_shard(path.as_posix()):
+                    continue
+
+                for page_path, articles, paginator in paginate(
+                    path, posts, per_page.get(name, 0), segment
+                ):
+                    meta = Meta(
+                        {
+                            "path": page_path,
+                            "type": template,
+                            "title": term,
+                            "name": name,
+                            "articles": articles,
+                            "paginator": paginator,
+                        }
+                    )
+                    page = ListingPage(meta, "", src_path, build_path)
+                    seen.add(str(page_path))
+                    page.process(base.copy(), self.template)
+
+            listings[name] = {key: previous[key] for key in seen if key in previous}
+
+    def save_cache(self) -> None:
+        """Prune and save the build cache."""
+        if self.fragments is not None:
+            self.fragments.prune()
+
+        if self.feeds is not None:
+            self.feeds.prune()
+
+        if self.blocks is not None:
+            self.blocks.prune()
+
+        if self.contents is not None:
+            self.contents.close()
+
+        self.sources.save()
+        if self.parsed:
+            parsed = self.cache.load("parsed")
+            for name in set(parsed) - self.parsed:
+                del parsed[name]
+
+        self.cache.save()
+
     def copy_s3(self) -> None:
-        """Copy files from s3 in one go."""
+        """
+        Copy files from s3 in one go.
+
+        The ETag of each downloaded file is kept in the cache, so files that are
+        unchanged and still on disk are not downloaded again.
+        """
         bucket = self.base["s3-bucket"]
         client = boto3.client(
             "s3",
@@ -504,13 +2224,20 @@ class MySGEN:
             endpoint_url=os.getenv("S3_URL"),
         )
         files = client.list_objects(Bucket=bucket)
+        etags = self.cache.load("s3")
 
         for path in files["Contents"]:
             f = path["Key"]
+            etag = path.get("ETag")
+            if etag is not None and etags.get(f) == etag and os.path.isfile(f):
+                continue
+
             makedirs(join(*f.split("/")[:-1]), exist_ok=True)
             client.download_file(bucket, f, f)
+            if etag is not None:
+                etags[f] = etag
 
-    def _format_metadata(self, meta: defaultdict[str, Any]) -> defaultdict[str, Any]:
+    def _format_metadata(self, meta: Meta) -> Meta:
         """
         Format some metadata fields.
 
@@ -536,48 +2263,162 @@ class MySGEN:
 
             if key == "tags":
                 meta[key] = meta[key].split(",")
-                self.base["tags"].extend(meta[key])
-
-            if key == "category":
-                self.base["categories"].append(meta[key])
 
         return meta
 
-    def _parse(self, item_path: Path) -> tuple[defaultdict[str, Any], str]:
+    def _parse(self, item_path: Path) -> tuple[Meta, str | Callable[[], str]]:
         """
         Parse items.
 
+        The Markdown conversion is cached by a hash of the source from the stat
+        index, so unchanged items are not read or converted again, and code and
+        math blocks by block. With stream_content
+        the HTML is kept in the content store, and a function loading it is
+        returned instead.
+
         Args:
             item_path: path of item to parse
 
         Returns:
             meta: metadata of item
-            content: content of item as string
+            content: content of item as string, or a function loading it
         """
-        with open(item_path, "r") as file:
-            content = self.markdown.convert(file.read())
-            meta = self._format_metadata(defaultdict(lambda: "", self.markdown.Meta))
-            meta["path"] = Path(item_path).relative_to(self.base["src_path"])
-            meta["path"] = meta["path"].with_suffix("")
+        parsed = self.cache.load("parsed")
+        settings = [
+            self.base.get("markdown_backend", MARKDOWN_BACKEND),
+            self.base["markdown_extensions"],
+        ]
+        key = hashlib.sha256(
+            (json.dumps(settings) + self.sources.digest(item_path)).encode("utf-8")
+        ).hexdigest()
+        name = Path(item_path).as_posix()
+        self.parsed.add(name)
+        entry = parsed.get(name, [""])
+        html: str | None = None
+        if entry[0] == key and self.contents is not None and key in self.contents:
+            raw_meta = entry[1]
+        elif entry[0] == key and len(entry) == 3:
+            raw_meta, html = entry[1], entry[2]
+        elif self.shared is not None and key in self.shared.parsed:
+            raw_meta, html = self.shared.parsed[key]
+            self.shared.parsed_hits += 1
+        else:
+            with open(item_path, "r") as file:
+                source = file.read()
+            if self.blocks is not None:
+                html = self.blocks.convert(self.markdown, source)
+            else:
+                html = self.markdown.convert(source)
+            raw_meta = getattr(self.markdown, "Meta", {})
+            if self.shared is not None and self.contents is None:
+                self.shared.parsed[key] = (raw_meta, html)
             self.markdown.reset()
 
+        content: str | Callable[[], str]
+        if self.contents is None:
+            content = html or ""
+            parsed[name] = [key, raw_meta, content]
+        else:
+            if html is not None:
+                self.contents.put(key, html)
+            parsed[name] = [key, raw_meta]
+            content = self.contents.loader(key)
+
+        meta = self._format_metadata(Meta({k: list(v) for k, v in raw_meta.items()}))
+        relative = Path(item_path).relative_to(self.base["src_path"]).with_suffix("")
+        item_type = relative.parts[0]
+        meta["path"] = output_path(
+            self.base.get("output_paths", {}).get(item_type), item_type, relative, meta
+        )
+
         return meta, content
 
-    def copy_assets(self):
-        """Copy assets to output directory."""
-        from_assets = [
-            Path(self.base["theme_path"]) / Path(asset) for asset in ["js", "css"]
-        ]
+    def _set_sink(self) -> Sink:
+        """
+        Set the default output sink, if none is given, and its root.
+
+        Returns:
+            output sink
+        """
+        if self.sink is None:
+            if self.base.get("build_archive"):
+                self.sink = ArchiveSink(self.base["build_archive"])
+            else:
+                self.sink = FileSystemSink()
+
+        self.sink.root = Path(self.base["build_path"])
+        return self.sink
+
+    def _in_shard(self, key: str) -> bool:
+        """
+        Check if an item is rendered by this build.
+
+        Args:
+            key: item key, e.g. posts/post.md or tags/tag1
+
+        Returns:
+            True if not sharded or the item is in the shard
+        """
+        return self.shard is None or shard_of(key, self.shard[1]) == self.shard[0]
+
+    def _global_state(self) -> str:
+        """
+        Hash the global indexes every shard renders with, before processing.
 
-        to_assets = [
-            Path(self.base["build_path"]) / Path(asset) for asset in ["js", "css"]
+        The hash is fed one item at a time, with the hash of its content, so a
+        streamed content is only loaded while it is hashed.
+
+        Returns:
+            hex digest of the settings, menu, items and taxonomies
+        """
+        state = hashlib.sha256()
+        settings = [
+            self.base.get("render_key", ""),
+            self.base.get("menuitems", {}),
+            {name: taxonomy.counts() for name, taxonomy in self.taxonomies.items()},
         ]
+        state.update(json.dumps(settings).encode("utf-8"))
+        for items in [self.posts, self.pages]:
+            for name, item in sorted(items.items()):
+                content = hashlib.sha256(item.content.encode("utf-8")).hexdigest()
+                item_state = [name, item.meta.fingerprint(), content]
+                state.update(json.dumps(item_state).encode("utf-8"))
+
+        return state.hexdigest()
+
+    def copy_assets(self) -> None:
+        """Copy assets to output directory."""
+        if self.assets is not None:
+            self.assets.copy(self.sink or FileSystemSink())
+
+
+def build_sites(config_files: list[str]) -> dict[str, float]:
+    """
+    Build several sites in one process, sharing content addressed caches.
+
+    Sites using the same theme, content or images parse, compile and resize them
+    once. The build time of every site is logged and returned.
+
+    Args:
+        config_files: config file of every site
+
+    Returns:
+        build time in seconds by config file
+    """
+    shared = SharedCaches()
+    timings = {}
+    for config_file in config_files:
+        start = time.perf_counter()
+        MySGEN(config_file, shared=shared).build()
+        timings[config_file] = time.perf_counter() - start
+        logger.info(
+            "Built {site} in {seconds:.2f} s.".format(
+                site=config_file, seconds=timings[config_file]
+            )
+        )
 
-        for from_asset, to_asset in zip(from_assets, to_assets):
-            try:
-                copy_tree(str(from_asset), str(to_asset))
-            except DistutilsFileError:
-                logger.info("File {from_path} not found.".format(from_path=from_asset))
+    logger.info("Shared caches: {stats}.".format(stats=shared.stats()))
+    return timings
 
 
 def build() -> None:
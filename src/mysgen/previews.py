@@ -0,0 +1,282 @@
+"""Downsampled previews and summary statistics of tabular data for mysgen."""
+from __future__ import annotations
+import json
+import hashlib
+import logging
+from typing import Any, Callable, Iterator, MutableMapping
+from pathlib import Path
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+
+
+logger = logging.getLogger(__name__)
+
+
+PREVIEW_POINTS = 1000
+PREVIEW_FORMAT = 1
+PREVIEW_SUFFIX = ".preview.json"
+CHUNK_ROWS = 1 << 16
+DELIMITERS = {".csv": ",", ".tsv": "\t", ".txt": None, ".dat": None}
+
+
+def previewable(path: str | Path) -> bool:
+    """
+    Check if a data file can have a preview.
+
+    Args:
+        path: data file path
+
+    Returns:
+        True for text tables and NumPy arrays
+    """
+    return Path(path).suffix in DELIMITERS or Path(path).suffix == ".npy"
+
+
+def _fields(line: str, delimiter: str | None) -> list[str]:
+    """
+    Fields of a line of a text table.
+
+    Args:
+        line: line of text
+        delimiter: field delimiter, None for whitespace
+
+    Returns:
+        stripped fields
+    """
+    return [field.strip() for field in line.split(delimiter)]
+
+
+def _numeric(fields: list[str]) -> bool:
+    """
+    Check if all fields are numbers.
+
+    Args:
+        fields: fields of a line
+
+    Returns:
+        True if every field parses as a float
+    """
+    try:
+        [float(field) for field in fields]
+    except ValueError:
+        return False
+
+    return True
+
+
+def _text_chunks(
+    path: Path, chunk_rows: int
+) -> tuple[list[str], int, Callable[[], Iterator[Any]]]:
+    """
+    Columns, rows and a chunked reader of a text table.
+
+    The file is read twice, once to count the rows and once in chunks of rows,
+    so only one chunk is in memory. A first line that is not numeric is the
+    header, blank lines are skipped.
+
+    Args:
+        path: text table path
+        chunk_rows: rows per chunk
+
+    Returns:
+        column names, number of rows and a function yielding 2-D chunks
+    """
+    delimiter = DELIMITERS[path.suffix]
+    with open(path, "r") as file:
+        lines = (line for line in file if line.strip())
+        first = next(lines, "")
+        fields = _fields(first, delimiter)
+        header = bool(first) and not _numeric(fields)
+        rows = sum(1 for _ in lines) + (1 if first and not header else 0)
+
+    columns = fields if header else [str(i) for i in range(len(fields))]
+
+    def chunks() -> Iterator[Any]:
+        with open(path, "r") as file:
+            lines = (line for line in file if line.strip())
+            if header:
+                next(lines)
+            while True:
+                chunk = list(islice(lines, chunk_rows))
+                if not chunk:
+                    return
+                yield np.loadtxt(
+                    chunk, delimiter=delimiter, comments=None, ndmin=2, dtype=float
+                )
+
+    return columns, rows, chunks
+
+
+def _array_chunks(
+    path: Path, chunk_rows: int
+) -> tuple[list[str], int, Callable[[], Iterator[Any]]]:
+    """
+    Columns, rows and a chunked reader of a memory mapped NumPy array.
+
+    Args:
+        path: .npy file path
+        chunk_rows: rows per chunk
+
+    Returns:
+        column names, number of rows and a function yielding 2-D chunks
+    """
+    array = np.load(path, mmap_mode="r")
+    array = array.reshape(len(array), -1) if array.ndim != 2 else array
+    columns = [str(i) for i in range(array.shape[1])]
+
+    def chunks() -> Iterator[Any]:
+        for start in range(0, len(array), chunk_rows):
+            yield np.asarray(array[start : start + chunk_rows], dtype=float)
+
+    return columns, len(array), chunks
+
+
+def _round(values: Any) -> list[float | None]:
+    """
+    Values as JSON numbers with 6 significant digits, NaN as null.
+
+    Args:
+        values: 1-D array
+
+    Returns:
+        list of numbers
+    """
+    return [
+        None if value != value else float("{value:.6g}".format(value=value))
+        for value in values.tolist()
+    ]
+
+
+def summarize(
+    path: str | Path, points: int = PREVIEW_POINTS, chunk_rows: int = CHUNK_ROWS
+) -> dict[str, Any]:
+    """
+    Downsample every column of a table and compute its summary statistics.
+
+    Rows are split into points / 2 buckets of consecutive rows and the minimum
+    and maximum of every column is kept per bucket, so peaks survive the
+    decimation. Chunks are reduced into the buckets and the statistics merged
+    as they are read, so memory is bounded by the chunk and the points, not by
+    the table. NaN values are ignored.
+
+    Args:
+        path: text table or .npy file path
+        points: points per column of the preview
+        chunk_rows: rows per chunk
+
+    Returns:
+        rows, columns, first row of every bucket as x, min and max per column
+        and bucket, and count, min, max, mean and std per column
+
+    Raises:
+        ValueError: if the table has no rows or is not numeric
+    """
+    path = Path(path)
+    if path.suffix == ".npy":
+        columns, rows, chunks = _array_chunks(path, chunk_rows)
+    else:
+        columns, rows, chunks = _text_chunks(path, chunk_rows)
+    if not rows or not columns:
+        raise ValueError("Data {path} has no rows.".format(path=path))
+
+    buckets = min(rows, max(1, points // 2))
+    low = np.full((buckets, len(columns)), np.nan)
+    high = np.full((buckets, len(columns)), np.nan)
+    count = np.zeros(len(columns))
+    mean = np.zeros(len(columns))
+    m2 = np.zeros(len(columns))
+    start = 0
+    for chunk in chunks():
+        if chunk.shape[1] != len(columns):
+            raise ValueError(
+                "Data {path} has {found} columns, expected {expected}.".format(
+                    path=path, found=chunk.shape[1], expected=len(columns)
+                )
+            )
+
+        ids = np.arange(start, start + len(chunk)) * buckets // rows
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(ids)) + 1])
+        segments = ids[starts]
+        low[segments] = np.fmin(low[segments], np.fmin.reduceat(chunk, starts))
+        high[segments] = np.fmax(high[segments], np.fmax.reduceat(chunk, starts))
+        start += len(chunk)
+
+        valid = ~np.isnan(chunk)
+        chunk_count = valid.sum(axis=0)
+        chunk_mean = np.where(valid, chunk, 0).sum(axis=0) / np.maximum(chunk_count, 1)
+        chunk_m2 = np.where(valid, chunk - chunk_mean, 0) ** 2
+        total = count + chunk_count
+        delta = chunk_mean - mean
+        weight = chunk_count / np.maximum(total, 1)
+        m2 += chunk_m2.sum(axis=0) + delta**2 * count * weight
+        mean += delta * weight
+        count = total
+
+    with np.errstate(all="ignore"):
+        statistics = {
+            "count": count.astype(int).tolist(),
+            "min": _round(np.fmin.reduce(low)),
+            "max": _round(np.fmax.reduce(high)),
+            "mean": _round(np.where(count > 0, mean, np.nan)),
+            "std": _round(np.where(count > 0, np.sqrt(m2 / count), np.nan)),
+        }
+
+    return {
+        "rows": rows,
+        "columns": columns,
+        "x": ((np.arange(buckets) * rows + buckets - 1) // buckets).tolist(),
+        "min": [_round(low[:, i]) for i in range(len(columns))],
+        "max": [_round(high[:, i]) for i in range(len(columns))],
+        "summary": {
+            name: {key: values[i] for key, values in statistics.items()}
+            for i, name in enumerate(columns)
+        },
+    }
+
+
+def preview(
+    path: str | Path,
+    points: int = PREVIEW_POINTS,
+    digest: str = "",
+    derivatives: MutableMapping[str, bytes | None] | None = None,
+) -> bytes | None:
+    """
+    Preview file of a table, cached by a hash of the source.
+
+    Args:
+        path: text table or .npy file path
+        points: points per column of the preview
+        digest: content hash of the source, no caching if empty
+        derivatives: previews by content key, None for no caching
+
+    Returns:
+        compact JSON preview, None if the file is not a numeric table or NumPy
+        is not installed
+    """
+    if np is None:
+        logger.info("Package numpy not installed, no data previews.")
+        return None
+
+    key = hashlib.sha256(
+        json.dumps([digest, points, PREVIEW_FORMAT]).encode("utf-8")
+    ).hexdigest()
+    if derivatives is not None and digest and key in derivatives:
+        return derivatives[key]
+
+    data: bytes | None
+    try:
+        data = json.dumps(summarize(path, points), separators=(",", ":")).encode(
+            "utf-8"
+        )
+    except ValueError as error:
+        logger.info("No preview of {path}: {error}".format(path=path, error=error))
+        data = None
+
+    if derivatives is not None and digest:
+        derivatives[key] = data
+
+    return data
@@ -0,0 +1,232 @@
+"""Related posts by TF-IDF and taxonomy similarity for mysgen."""
+from __future__ import annotations
+import json
+import hashlib
+import logging
+from typing import Any, Iterable
+from collections import Counter
+from mysgen.search import tokenize
+
+try:
+    import numpy as np
+    from scipy import sparse  # type: ignore
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore
+    sparse = None
+
+
+logger = logging.getLogger(__name__)
+
+
+RELATED_COUNT = 5
+CHUNK_SIZE = 1024
+TAXONOMY_WEIGHT = 3
+
+
+def features(text: str, tags: list[str], category: str) -> dict[str, int]:
+    """
+    Term counts of a post, tags and category count as weighted extra terms.
+
+    Args:
+        text: title and content
+        tags: tags
+        category: category
+
+    Returns:
+        feature counts
+    """
+    counts: Counter[str] = tokenize(text)
+    for tag in tags:
+        if tag.strip():
+            counts["#" + tag.strip().lower()] += TAXONOMY_WEIGHT
+    if category:
+        counts["@" + category.strip().lower()] += TAXONOMY_WEIGHT
+
+    return dict(counts)
+
+
+def vectorize(counts: list[dict[str, int]]) -> Any:
+    """
+    L2 normalised TF-IDF matrix of feature counts.
+
+    Args:
+        counts: feature counts per post
+
+    Returns:
+        sparse matrix, a row per post
+    """
+    vocabulary: dict[str, int] = {}
+    indptr = [0]
+    indices: list[int] = []
+    data: list[int] = []
+    for count in counts:
+        for feature, n in count.items():
+            indices.append(vocabulary.setdefault(feature, len(vocabulary)))
+            data.append(n)
+        indptr.append(len(indices))
+
+    matrix = sparse.csr_matrix(
+        (np.asarray(data, dtype=np.float64), indices, indptr),
+        shape=(len(counts), len(vocabulary)),
+    )
+    df = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    idf = np.log((1 + len(counts)) / (1 + df)) + 1
+    matrix.data = (1 + np.log(matrix.data)) * idf[matrix.indices]
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix)
+
+
+def top_k(
+    matrix: Any, rows: list[int], k: int, chunk_size: int = CHUNK_SIZE
+) -> list[list[tuple[int, float]]]:
+    """
+    Most similar rows of some rows of a normalised matrix.
+
+    Similarities are computed as sparse products, a chunk of rows at a time, and
+    the top k of each chunk are selected with argpartition, so memory stays at
+    chunk size times number of posts.
+
+    Args:
+        matrix: normalised sparse matrix
+        rows: rows to find similar rows of
+        k: number of similar rows
+        chunk_size: rows per chunk
+
+    Returns:
+        row index and similarity of similar rows, most similar first, per row
+    """
+    n = matrix.shape[0]
+    k = min(k, n - 1)
+    result: list[list[tuple[int, float]]] = []
+    if k <= 0:
+        return [[] for _ in rows]
+
+    transposed = matrix.T.tocsc()
+    for start in range(0, len(rows), chunk_size):
+        chunk = np.asarray(rows[start : start + chunk_size])
+        scores = (matrix[chunk] @ transposed).toarray()
+        scores[np.arange(len(chunk)), chunk] = -np.inf
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        for indices, values in zip(best, best_scores):
+            result.append(
+                [(int(i), float(v)) for i, v in zip(indices, values) if v > 0]
+            )
+
+    return result
+
+
+class RelatedPosts:
+    """
+    Top k related posts per post by cosine similarity of TF-IDF vectors.
+
+    Feature counts and results are kept in the build cache. Only posts whose
+    fingerprint changed are tokenised again. The IDF weights depend on every
+    post, so when the document frequencies change all rows are computed again
+    and the result does not depend on the history of the cache. Otherwise full
+    similarity rows are computed for changed posts and for posts whose related
+    posts changed, and the cached related posts of other posts are merged with
+    their similarity to the changed posts only.
+    """
+
+    def __init__(
+        self,
+        cache: dict[str, Any],
+        count: int = RELATED_COUNT,
+        chunk_size: int = CHUNK_SIZE,
+    ) -> None:
+        """
+        Initialise related posts object.
+
+        Args:
+            cache: state of the last build, updated in place
+            count: number of related posts per post
+            chunk_size: rows per similarity chunk
+        """
+        if cache.get("count") != count:
+            cache.clear()
+
+        cache.setdefault("count", count)
+        cache.setdefault("posts", {})
+        cache.setdefault("related", {})
+        self.cache = cache
+        self.count = count
+        self.chunk_size = chunk_size
+
+    def update(
+        self, documents: Iterable[tuple[str, str, str, list[str], str]]
+    ) -> dict[str, list[tuple[str, float]]]:
+        """
+        Update related posts.
+
+        Documents are read once, so they can be generated one at a time.
+
+        Args:
+            documents: key, fingerprint, text, tags and category of every post
+
+        Returns:
+            key and similarity of related posts, most similar first, per post
+        """
+        if np is None:
+            logger.info("Packages numpy and scipy not installed, no related posts.")
+            return {document[0]: [] for document in documents}
+
+        posts = self.cache["posts"]
+        related = self.cache["related"]
+        keys = []
+        changed = set()
+        for key, fingerprint, text, tags, category in documents:
+            keys.append(key)
+            if key not in posts or posts[key][0] != fingerprint:
+                posts[key] = [fingerprint, features(text, tags, category)]
+                changed.add(key)
+
+        removed = set(posts) - set(keys)
+        for key in removed:
+            del posts[key]
+            related.pop(key, None)
+
+        if not changed and not removed:
+            return {key: [(o, s) for o, s in related[key]] for key in keys}
+
+        frequencies: Counter[str] = Counter()
+        for key in keys:
+            frequencies.update(posts[key][1].keys())
+        model = hashlib.sha256(
+            json.dumps([len(keys), sorted(frequencies.items())]).encode("utf-8")
+        ).hexdigest()
+        stale = changed | removed
+        full = [
+            i
+            for i, key in enumerate(keys)
+            if self.cache.get("model") != model
+            or key in changed
+            or key not in related
+            or any(other in stale for other, _ in related[key])
+        ]
+        self.cache["model"] = model
+        matrix = vectorize([posts[key][1] for key in keys])
+        similar = top_k(matrix, full, self.count, self.chunk_size)
+        for i, row in zip(full, similar):
+            related[keys[i]] = [[keys[j], score] for j, score in row]
+
+        changed_rows = [i for i, key in enumerate(keys) if key in changed]
+        merge = sorted(set(range(len(keys))) - set(full))
+        if changed_rows and merge:
+            scores = (matrix[merge] @ matrix[changed_rows].T).toarray()
+            for m, i in enumerate(merge):
+                candidates = {other: score for other, score in related[keys[i]]}
+                for n, j in enumerate(changed_rows):
+                    if scores[m, n] > 0:
+                        candidates[keys[j]] = float(scores[m, n])
+                best = sorted(candidates.items(), key=lambda item: -item[1])
+                related[keys[i]] = [list(item) for item in best[: self.count]]
+
+        logger.info(
+            "Related posts of {count} posts recomputed.".format(count=len(full))
+        )
+        return {key: [(o, s) for o, s in related[key]] for key in keys}
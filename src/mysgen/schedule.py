@@ -0,0 +1,60 @@
+"""Priority scheduling of the items of a build for mysgen."""
+from __future__ import annotations
+import logging
+from typing import Any, Iterable, Mapping
+from datetime import datetime
+
+
+logger = logging.getLogger(__name__)
+
+
+PRIORITY_POSTS = 5
+
+
+def _date(item: Any) -> datetime:
+    """
+    Date of an item, the earliest date if it has none.
+
+    Args:
+        item: post or page
+
+    Returns:
+        item date
+    """
+    date = item.meta["date"]
+    return date if isinstance(date, datetime) else datetime.min
+
+
+def critical_items(
+    posts: Mapping[str, Any],
+    pages: Mapping[str, Any],
+    home: str,
+    menu: Iterable[str],
+    count: int = PRIORITY_POSTS,
+) -> dict[str, list[str]]:
+    """
+    Published items a visitor reaches first, home, menu pages and newest posts.
+
+    Args:
+        posts: posts by name
+        pages: pages by name
+        home: name of the home page
+        menu: names of the menu pages
+        count: number of newest posts
+
+    Returns:
+        names of the critical posts, newest first, and pages, by item type
+    """
+    published = [
+        name for name, post in posts.items() if post.meta["status"] == "published"
+    ]
+    newest = sorted(published, key=lambda name: (_date(posts[name]), name))[::-1]
+    names = set(menu) | {home}
+    return {
+        "posts": newest[:count],
+        "pages": [
+            name
+            for name, page in pages.items()
+            if name.split(".")[0] in names and page.meta["status"] == "published"
+        ],
+    }
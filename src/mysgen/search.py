@@ -0,0 +1,283 @@
+"""Incremental, sharded client-side search index for mysgen."""
+from __future__ import annotations
+import re
+import json
+import hashlib
+import logging
+from typing import Any, Iterable
+from pathlib import Path
+from collections import Counter
+from mysgen.sinks import Sink
+
+
+logger = logging.getLogger(__name__)
+
+
+SEARCH_PATH = "search"
+PREFIX_LENGTH = 2
+DOCS_PER_SHARD = 500
+MIN_TOKEN_LENGTH = 2
+TAGS = re.compile(r"<[^>]+>")
+TOKENS = re.compile(r"\w+")
+
+SEARCH_JS = """\
+// mysgen search, fetches index shards by term prefix
+var mysgenSearch = (function () {
+    var root = "/search/", meta = null, shards = {};
+    function get(path) {
+        if (!(path in shards)) {
+            shards[path] = fetch(root + path).then(function (r) {
+                return r.ok ? r.json() : {};
+            });
+        }
+        return shards[path];
+    }
+    function shard(term) {
+        var prefix = Array.from(term).slice(0, meta.prefix).join("");
+        return /^[a-z0-9]+$/.test(prefix) ? prefix : "_" + Array.from(
+            new TextEncoder().encode(prefix),
+            function (b) { return b.toString(16).padStart(2, "0"); }
+        ).join("");
+    }
+    function postings(term, prefix) {
+        return get("index/" + shard(term) + ".json").then(function (index) {
+            var scores = {};
+            Object.keys(index).forEach(function (key) {
+                if (key === term || (prefix && key.indexOf(term) === 0)) {
+                    index[key].forEach(function (p) {
+                        scores[p[0]] = (scores[p[0]] || 0) + p[1];
+                    });
+                }
+            });
+            return scores;
+        });
+    }
+    return function (query) {
+        var terms = (query.toLowerCase().match(/[\\p{L}\\p{N}_]+/gu) || [])
+            .filter(function (t) { return t.length >= 2; });
+        if (!terms.length) { return Promise.resolve([]); }
+        return get("meta.json").then(function (m) {
+            meta = m;
+            return Promise.all(terms.map(function (t, i) {
+                return postings(t, i === terms.length - 1);
+            }));
+        }).then(function (results) {
+            var ids = Object.keys(results[0]).filter(function (id) {
+                return results.every(function (r) { return id in r; });
+            });
+            var score = function (id) {
+                return results.reduce(function (s, r) { return s + r[id]; }, 0);
+            };
+            ids.sort(function (a, b) { return score(b) - score(a); });
+            return Promise.all(ids.map(function (id) {
+                return get("docs/" + Math.floor(id / meta.docs) + ".json")
+                    .then(function (docs) { return docs[id]; });
+            }));
+        });
+    };
+})();
+"""
+
+
+def tokenize(text: str) -> Counter[str]:
+    """
+    Split text, which may be HTML, into lower case terms.
+
+    Args:
+        text: text or HTML
+
+    Returns:
+        term frequencies
+    """
+    return Counter(
+        token
+        for token in TOKENS.findall(TAGS.sub(" ", text).lower())
+        if len(token) >= MIN_TOKEN_LENGTH
+    )
+
+
+def shard_name(term: str, prefix_length: int = PREFIX_LENGTH) -> str:
+    """
+    Name of the index shard holding a term, its prefix.
+
+    Prefixes that are not plain ASCII letters or digits are hex encoded, so
+    shard names are safe file names and URLs.
+
+    Args:
+        term: term
+        prefix_length: number of characters in a shard prefix
+
+    Returns:
+        shard name
+    """
+    prefix = term[:prefix_length]
+    if re.fullmatch(r"[a-z0-9]+", prefix):
+        return prefix
+
+    return "_" + prefix.encode("utf-8").hex()
+
+
+class SearchIndex:
+    """
+    Inverted index of published posts, written as shards by term prefix.
+
+    A client fetches meta.json, then only the index shards of the prefixes of
+    its query terms, index/<prefix>.json mapping terms to [doc id, frequency]
+    postings, and the document shards of its hits, docs/<n>.json mapping doc
+    ids to title, url and date. Nothing is one large download.
+
+    The index is kept in the build cache. Only posts whose fingerprint changed
+    are tokenised again, and only shards they touch are rewritten.
+    """
+
+    def __init__(
+        self,
+        cache: dict[str, Any],
+        prefix_length: int = PREFIX_LENGTH,
+        docs_per_shard: int = DOCS_PER_SHARD,
+    ) -> None:
+        """
+        Initialise search index object.
+
+        Args:
+            cache: index state of the last build, updated in place
+            prefix_length: number of characters in a shard prefix
+            docs_per_shard: documents per document shard
+        """
+        settings = {"prefix": prefix_length, "docs": docs_per_shard}
+        if cache.get("settings") != settings:
+            cache.clear()
+
+        cache.setdefault("settings", settings)
+        cache.setdefault("next", 0)
+        cache.setdefault("posts", {})
+        cache.setdefault("shards", {})
+        cache.setdefault("docs", {})
+        self.cache = cache
+        self.prefix_length = prefix_length
+        self.docs_per_shard = docs_per_shard
+        self.dirty: set[str] = set()
+
+    def update(self, documents: Iterable[tuple[str, str, dict[str, Any]]]) -> None:
+        """
+        Update the index with the current published posts.
+
+        Args:
+            documents: key, fingerprint and document, with title, url, date and
+                the text to index, of every published post
+        """
+        posts = self.cache["posts"]
+        seen = set()
+        for key, fingerprint, document in documents:
+            seen.add(key)
+            if key in posts and posts[key][0] == fingerprint:
+                continue
+
+            if key in posts:
+                doc_id = posts[key][1]
+                self._remove(doc_id, posts[key][2])
+            else:
+                doc_id = self.cache["next"]
+                self.cache["next"] += 1
+
+            shards = self._add(doc_id, tokenize(document["text"]))
+            posts[key] = [fingerprint, doc_id, shards]
+            self._set_doc(
+                doc_id, [document["title"], document["url"], document["date"]]
+            )
+
+        for key in set(posts) - seen:
+            _, doc_id, shards = posts.pop(key)
+            self._remove(doc_id, shards)
+            self._set_doc(doc_id, None)
+
+    def _add(self, doc_id: int, terms: Counter[str]) -> list[str]:
+        """
+        Add postings of a document.
+
+        Args:
+            doc_id: document id
+            terms: term frequencies of the document
+
+        Returns:
+            names of the touched shards
+        """
+        shards = set()
+        for term, count in sorted(terms.items()):
+            name = shard_name(term, self.prefix_length)
+            shard = self.cache["shards"].setdefault(name, {})
+            shard.setdefault(term, []).append([doc_id, count])
+            shards.add(name)
+
+        self.dirty.update("index/" + name for name in shards)
+        return sorted(shards)
+
+    def _remove(self, doc_id: int, shards: list[str]) -> None:
+        """
+        Remove postings of a document.
+
+        Args:
+            doc_id: document id
+            shards: names of the shards holding its postings
+        """
+        for name in shards:
+            shard = self.cache["shards"].get(name, {})
+            for term in list(shard):
+                shard[term] = [p for p in shard[term] if p[0] != doc_id]
+                if not shard[term]:
+                    del shard[term]
+            self.dirty.add("index/" + name)
+
+    def _set_doc(self, doc_id: int, doc: list[Any] | None) -> None:
+        """
+        Set or remove a document entry.
+
+        Args:
+            doc_id: document id
+            doc: title, url and date, None to remove
+        """
+        name = str(doc_id // self.docs_per_shard)
+        docs = self.cache["docs"].setdefault(name, {})
+        if doc is None:
+            docs.pop(str(doc_id), None)
+        else:
+            docs[str(doc_id)] = doc
+        self.dirty.add("docs/" + name)
+
+    def write(self, sink: Sink, build_path: str | Path) -> int:
+        """
+        Write changed shards, and any shard missing from the output.
+
+        Args:
+            sink: output sink
+            build_path: build directory
+
+        Returns:
+            number of written shards
+        """
+        root = Path(build_path, SEARCH_PATH)
+        files = {"meta.json": self.cache["settings"]}
+        for kind in ["index", "docs"]:
+            key = "shards" if kind == "index" else kind
+            for name, shard in self.cache[key].items():
+                files[kind + "/" + name + ".json"] = shard
+
+        written = 0
+        for name, content in sorted(files.items()):
+            path = root / name
+            if name[:-5] in self.dirty or not sink.exists(path):
+                data = json.dumps(
+                    content, separators=(",", ":"), ensure_ascii=False, sort_keys=True
+                )
+                sink.write_bytes(path, data.encode("utf-8"))
+                written += 1
+
+        script = SEARCH_JS.encode("utf-8")
+        digest = hashlib.sha256(script).hexdigest()
+        if self.cache.get("script") != digest or not sink.exists(root / "search.js"):
+            sink.write_bytes(root / "search.js", script)
+            self.cache["script"] = digest
+
+        self.dirty = set()
+        logger.info("Wrote {count} search index shards.".format(count=written))
+        return written
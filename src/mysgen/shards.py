@@ -0,0 +1,183 @@
+"""Sharded builds across processes or machines, and their merge, for mysgen."""
+from __future__ import annotations
+import os
+import json
+import hashlib
+import logging
+from typing import Any
+from pathlib import Path
+from mysgen.sinks import Sink
+
+
+logger = logging.getLogger(__name__)
+
+
+SHARD_MANIFEST = "shard.json"
+
+
+def shard_of(key: str, count: int) -> int:
+    """
+    Shard of an item, by a hash of its key.
+
+    The hash does not depend on the other items, so an item stays in its shard
+    while the shard count is unchanged, and keeps its cached outputs.
+
+    Args:
+        key: item key, e.g. posts/post.md
+        count: number of shards
+
+    Returns:
+        shard index
+    """
+    return int(hashlib.sha256(key.encode("utf-8")).hexdigest()[:8], 16) % count
+
+
+def shard_path(path: str | Path, index: int, count: int) -> Path:
+    """
+    Directory of a shard, next to the build or cache directory.
+
+    Args:
+        path: build or cache directory
+        index: shard index
+        count: number of shards
+
+    Returns:
+        shard directory, e.g. output-shard-0-of-4
+    """
+    path = Path(path)
+    return path.with_name(
+        "{name}-shard-{index}-of-{count}".format(
+            name=path.name, index=index, count=count
+        )
+    )
+
+
+def write_manifest(
+    path: str | Path, index: int, count: int, build_date: str, state: str
+) -> int:
+    """
+    Write the manifest of a shard, its output files with their size and mtime.
+
+    Args:
+        path: shard build directory
+        index: shard index
+        count: number of shards
+        build_date: build date of the shard
+        state: hash of the global indexes the shard rendered with
+
+    Returns:
+        number of output files
+    """
+    files = {}
+    for root, _, names in os.walk(path):
+        for name in names:
+            output = Path(root, name)
+            key = output.relative_to(path).as_posix()
+            if key != SHARD_MANIFEST:
+                stat = output.stat()
+                files[key] = [stat.st_size, stat.st_mtime_ns]
+
+    manifest = {
+        "shard": [index, count],
+        "build_date": build_date,
+        "state": state,
+        "files": dict(sorted(files.items())),
+    }
+    with open(Path(path, SHARD_MANIFEST), "w") as file:
+        json.dump(manifest, file, separators=(",", ":"))
+
+    return len(files)
+
+
+def read_manifests(build_path: str | Path, count: int) -> list[dict[str, Any]]:
+    """
+    Read and check the manifests of all shards of a build.
+
+    Args:
+        build_path: build directory
+        count: number of shards
+
+    Returns:
+        manifests, by shard index
+
+    Raises:
+        FileNotFoundError: if a shard was not built
+        ValueError: if shards were built from different content or overlap
+    """
+    manifests = []
+    for index in range(count):
+        manifest_file = shard_path(build_path, index, count) / SHARD_MANIFEST
+        try:
+            with open(manifest_file, "r") as file:
+                manifests.append(json.load(file))
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                "Shard {index} of {count} not built, {file} not found.".format(
+                    index=index, count=count, file=manifest_file
+                )
+            )
+
+    if len({(m["state"], m["build_date"]) for m in manifests}) > 1:
+        raise ValueError("Shards were built from different content or settings.")
+
+    owners: dict[str, int] = {}
+    for index, manifest in enumerate(manifests):
+        for name in manifest["files"]:
+            if name in owners:
+                raise ValueError(
+                    "Output {name} written by shards {first} and {second}.".format(
+                        name=name, first=owners[name], second=index
+                    )
+                )
+            owners[name] = index
+
+    return manifests
+
+
+def merge(
+    sink: Sink,
+    build_path: str | Path,
+    manifests: list[dict[str, Any]],
+    cache: dict[str, list[int]],
+) -> int:
+    """
+    Copy the outputs of all shards into the build directory.
+
+    Files whose size and mtime are unchanged since the last merge are not copied
+    again, listeners are still notified of them.
+
+    Args:
+        sink: output sink
+        build_path: build directory
+        manifests: shard manifests, by shard index
+        cache: size and mtime of merged files, updated in place
+
+    Returns:
+        number of copied files
+    """
+    count = len(manifests)
+    copied = 0
+    merged = set()
+    for index, manifest in enumerate(manifests):
+        path = shard_path(build_path, index, count)
+        for name, stat in manifest["files"].items():
+            src = path / name
+            dst = Path(build_path, name)
+            merged.add(name)
+            if cache.get(name) == stat and sink.exists(dst):
+                sink.notify(dst, src.read_bytes)
+                continue
+
+            sink.copy_file(src, dst)
+            cache[name] = stat
+            copied += 1
+
+    for name in set(cache) - merged:
+        del cache[name]
+
+    logger.info(
+        "Merged {count} shards, copied {copied} of {total} files.".format(
+            count=count, copied=copied, total=len(merged)
+        )
+    )
+    return copied
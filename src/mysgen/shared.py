@@ -0,0 +1,76 @@
+"""Content addressed caches shared by the sites of a multi-site build."""
+from __future__ import annotations
+import logging
+from typing import Any
+from jinja2.bccache import Bucket, BytecodeCache
+
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBytecodeCache(BytecodeCache):
+    """
+    Compiled templates in memory.
+
+    Buckets are keyed by template name and file, and checked against a hash of
+    the template source, so sites using the same theme compile it once.
+    """
+
+    def __init__(self) -> None:
+        """Initialise memory bytecode cache object."""
+        self.store: dict[str, bytes] = {}
+        self.hits = 0
+
+    def load_bytecode(self, bucket: Bucket) -> None:
+        """
+        Load compiled code into a bucket, if cached.
+
+        Args:
+            bucket: template bucket
+        """
+        if bucket.key in self.store:
+            bucket.bytecode_from_string(self.store[bucket.key])
+            if bucket.code is not None:
+                self.hits += 1
+
+    def dump_bytecode(self, bucket: Bucket) -> None:
+        """
+        Keep the compiled code of a bucket.
+
+        Args:
+            bucket: template bucket
+        """
+        self.store[bucket.key] = bucket.bytecode_to_string()
+
+
+class SharedCaches:
+    """
+    Caches shared by the sites of a multi-site build, keyed by content.
+
+    Parsed Markdown is keyed by a hash of the backend, extensions and source,
+    compiled templates by template file and source, and image thumbnails by a
+    hash of the source image and thumbnail settings.
+    """
+
+    def __init__(self) -> None:
+        """Initialise shared caches object."""
+        self.parsed: dict[str, tuple[dict[str, list[str]], str]] = {}
+        self.templates = MemoryBytecodeCache()
+        self.images: dict[str, bytes | None] = {}
+        self.parsed_hits = 0
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Sizes and reuse counts of the shared caches.
+
+        Returns:
+            entries, and hits where counted, per cache
+        """
+        return {
+            "parsed": {"entries": len(self.parsed), "hits": self.parsed_hits},
+            "templates": {
+                "entries": len(self.templates.store),
+                "hits": self.templates.hits,
+            },
+            "images": {"entries": len(self.images)},
+        }
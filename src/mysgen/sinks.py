@@ -0,0 +1,564 @@
+"""Output sinks for mysgen, where built files go."""
+from __future__ import annotations
+import os
+import time
+import shutil
+import hashlib
+import tarfile
+import zipfile
+from typing import Any, Callable, Iterable
+from pathlib import Path
+from os import makedirs, remove, replace
+from os.path import isdir, isfile
+from tempfile import SpooledTemporaryFile
+from distutils.dir_util import copy_tree
+from distutils.errors import DistutilsFileError
+from mysgen.changes import StatIndex
+
+
+WRITE_BUFFER = 1 << 16
+SPOOL_SIZE = 1 << 22
+
+
+class Sink:
+    """
+    Output sink base class.
+
+    Paths are given under the build path, root, like the paths items already
+    compute, and are stored relative to it. Output hashes are keyed by the
+    relative path. Listeners are called with every written path, a function
+    reading its content and its sha256 digest if known. The content has to be
+    read before the listener returns. Filters, by file suffix, transform the
+    whole content of an output before it is written. With a stat index of the
+    sources, sinks may skip copies of source files unchanged since they were
+    copied, copies records the source digest, size and mtime of every copied
+    output by relative path.
+    """
+
+    def __init__(self, root: str | Path = "") -> None:
+        """
+        Initialise sink object.
+
+        Args:
+            root: build path
+        """
+        self.root = Path(root)
+        self.listeners: list[Callable[[Path, Callable[[], bytes], str], None]] = []
+        self.filters: dict[str, Callable[[bytes], bytes]] = {}
+        self.sources: StatIndex | None = None
+        self.copies: dict[str, list[Any]] = {}
+
+    def filter(self, path: str | Path, chunks: Iterable[bytes]) -> Iterable[bytes]:
+        """
+        Apply the filter of an output suffix, if any.
+
+        Args:
+            path: output path
+            chunks: output chunks
+
+        Returns:
+            output chunks, joined into one if filtered
+        """
+        function = self.filters.get(Path(path).suffix)
+        if function is None:
+            return chunks
+
+        return [function(b"".join(chunks))]
+
+    def notify(
+        self,
+        path: str | Path,
+        read: Callable[[], bytes],
+        digest: str = "",
+    ) -> None:
+        """
+        Call listeners with a written output.
+
+        Args:
+            path: output path
+            read: function returning the output content
+            digest: sha256 hex digest of the content, empty if unknown
+        """
+        for listener in self.listeners:
+            listener(Path(path), read, digest)
+
+    def relative(self, path: str | Path) -> str:
+        """
+        Path relative to the build path.
+
+        Args:
+            path: path under the build path
+
+        Returns:
+            relative posix path
+        """
+        return Path(os.path.relpath(path, self.root)).as_posix()
+
+    def write(
+        self,
+        path: str | Path,
+        chunks: Iterable[bytes],
+        hashes: dict[str, str] | None = None,
+    ) -> bool:
+        """
+        Write a file chunk by chunk.
+
+        Args:
+            path: output path
+            chunks: output chunks
+            hashes: output hashes of the last build, updated in place
+
+        Raises:
+            NotImplementedError
+        """
+        raise NotImplementedError
+
+    def write_bytes(
+        self,
+        path: str | Path,
+        data: bytes,
+        hashes: dict[str, str] | None = None,
+    ) -> bool:
+        """
+        Write a file in one go.
+
+        Args:
+            path: output path
+            data: file content
+            hashes: output hashes of the last build, updated in place
+
+        Returns:
+            True if the output changed
+        """
+        return self.write(path, [data], hashes)
+
+    def exists(self, path: str | Path) -> bool:
+        """
+        Check if an output exists.
+
+        Args:
+            path: output path
+
+        Raises:
+            NotImplementedError
+        """
+        raise NotImplementedError
+
+    def read(self, path: str | Path) -> bytes:
+        """
+        Read an existing output.
+
+        Args:
+            path: output path
+
+        Raises:
+            NotImplementedError
+        """
+        raise NotImplementedError
+
+    def copy_file(self, src: str | Path, path: str | Path) -> None:
+        """
+        Copy a source file to the output.
+
+        Args:
+            src: source file
+            path: output path
+        """
+        with open(src, "rb") as file:
+            self.write(path, iter(lambda: file.read(WRITE_BUFFER), b""))
+
+    def copy_tree(self, src: str | Path, dst: str | Path) -> list[str]:
+        """
+        Copy a source directory to the output.
+
+        Args:
+            src: source directory
+            dst: output directory
+
+        Returns:
+            copied output paths
+
+        Raises:
+            DistutilsFileError
+        """
+        if not isdir(src):
+            raise DistutilsFileError(
+                "cannot copy tree '{src}': not a directory".format(src=src)
+            )
+
+        copied = []
+        for path, _, files in os.walk(src):
+            for name in sorted(files):
+                to_file = Path(dst, os.path.relpath(path, src), name)
+                self.copy_file(Path(path, name), to_file)
+                copied.append(str(to_file))
+
+        return copied
+
+    def close(self) -> None:
+        """Finish writing outputs."""
+
+
+class FileSystemSink(Sink):
+    """Write outputs to a directory tree."""
+
+    def write(
+        self,
+        path: str | Path,
+        chunks: Iterable[bytes],
+        hashes: dict[str, str] | None = None,
+    ) -> bool:
+        """
+        Write a file chunk by chunk through a buffered file.
+
+        With hashes the output is hashed while it is written. If it matches the
+        hash from the last build the existing file is left untouched, keeping its
+        mtime for uploads and caches.
+
+        Args:
+            path: output path
+            chunks: output chunks
+            hashes: output hashes of the last build, updated in place
+
+        Returns:
+            True if the output changed
+        """
+        path = Path(path)
+        chunks = self.filter(path, chunks)
+        makedirs(path.parent, exist_ok=True)
+        if hashes is None:
+            with open(path, "wb", buffering=WRITE_BUFFER) as file:
+                for chunk in chunks:
+                    file.write(chunk)
+            self.notify(path, path.read_bytes)
+            return True
+
+        digest = hashlib.sha256()
+        tmp_file = path.with_name(path.name + ".tmp")
+        with open(tmp_file, "wb", buffering=WRITE_BUFFER) as file:
+            for chunk in chunks:
+                digest.update(chunk)
+                file.write(chunk)
+
+        key = self.relative(path)
+        changed = hashes.get(key) != digest.hexdigest() or not isfile(path)
+        if changed:
+            replace(tmp_file, path)
+            hashes[key] = digest.hexdigest()
+        else:
+            remove(tmp_file)
+
+        self.notify(path, path.read_bytes, digest.hexdigest())
+        return changed
+
+    def exists(self, path: str | Path) -> bool:
+        """
+        Check if an output exists.
+
+        Args:
+            path: output path
+
+        Returns:
+            True if the file exists
+        """
+        return isfile(path)
+
+    def read(self, path: str | Path) -> bytes:
+        """
+        Read an existing output.
+
+        Args:
+            path: output path
+
+        Returns:
+            file content
+        """
+        return Path(path).read_bytes()
+
+    def copy_file(self, src: str | Path, path: str | Path) -> None:
+        """
+        Copy a source file to the output.
+
+        With a stat index, a file is not copied again while its output is the
+        one recorded in copies, with the same source digest, size and mtime,
+        listeners are still notified.
+
+        Args:
+            src: source file
+            path: output path
+        """
+        if Path(path).suffix in self.filters:
+            super().copy_file(src, path)
+            return
+
+        if self.sources is None:
+            makedirs(Path(path).parent, exist_ok=True)
+            shutil.copy2(src, path)
+            self.notify(path, Path(path).read_bytes)
+            return
+
+        key = self.relative(path)
+        digest = self.sources.digest(src)
+        if isfile(path) and self.copies.get(key) == self._copy_entry(digest, path):
+            self.notify(path, Path(path).read_bytes)
+            return
+
+        makedirs(Path(path).parent, exist_ok=True)
+        shutil.copy2(src, path)
+        self.copies[key] = self._copy_entry(digest, path)
+        self.notify(path, Path(path).read_bytes)
+
+    @staticmethod
+    def _copy_entry(digest: str, path: str | Path) -> list[Any]:
+        """
+        Copies entry of an output.
+
+        Args:
+            digest: sha256 hex digest of the source
+            path: output path
+
+        Returns:
+            source digest, output size and mtime
+        """
+        stat = os.stat(path)
+        return [digest, stat.st_size, stat.st_mtime_ns]
+
+    def copy_tree(self, src: str | Path, dst: str | Path) -> list[str]:
+        """
+        Copy a source directory to the output.
+
+        With filters or a stat index the files are copied one by one.
+
+        Args:
+            src: source directory
+            dst: output directory
+
+        Returns:
+            copied output paths
+        """
+        if self.filters or self.sources is not None:
+            return super().copy_tree(src, dst)
+
+        copied = copy_tree(str(src), str(dst))
+        for path in copied:
+            self.notify(path, Path(path).read_bytes)
+
+        return copied
+
+
+class MemorySink(Sink):
+    """Keep outputs in memory, for tests and serving a build without writing it."""
+
+    def __init__(self, root: str | Path = "") -> None:
+        """
+        Initialise memory sink object.
+
+        Args:
+            root: build path
+        """
+        super().__init__(root)
+        self.files: dict[str, bytes] = {}
+
+    def write(
+        self,
+        path: str | Path,
+        chunks: Iterable[bytes],
+        hashes: dict[str, str] | None = None,
+    ) -> bool:
+        """
+        Write a file.
+
+        Args:
+            path: output path
+            chunks: output chunks
+            hashes: output hashes of the last build, updated in place
+
+        Returns:
+            True if the output changed
+        """
+        key = self.relative(path)
+        data = b"".join(self.filter(path, chunks))
+        if hashes is not None:
+            hashes[key] = hashlib.sha256(data).hexdigest()
+
+        changed = self.files.get(key) != data
+        self.files[key] = data
+        self.notify(path, lambda: data)
+        return changed
+
+    def exists(self, path: str | Path) -> bool:
+        """
+        Check if an output exists.
+
+        Args:
+            path: output path
+
+        Returns:
+            True if the file exists
+        """
+        return self.relative(path) in self.files
+
+    def read(self, path: str | Path) -> bytes:
+        """
+        Read an existing output.
+
+        Args:
+            path: output path
+
+        Returns:
+            file content
+        """
+        return self.files[self.relative(path)]
+
+
+class ArchiveSink(Sink):
+    """
+    Stream outputs into a single tar or zip archive.
+
+    The archive type follows its name, .zip, .tar, .tar.gz, .tgz or .tar.xz. No
+    intermediate directory tree is created, each build writes a new archive.
+    Outputs added to a zip or an uncompressed tar archive can be read back. An
+    output is added once, adding it again with the same content does nothing.
+    """
+
+    def __init__(self, archive: str | Path, root: str | Path = "") -> None:
+        """
+        Initialise archive sink object.
+
+        Args:
+            archive: archive file
+            root: build path
+        """
+        super().__init__(root)
+        self.archive = Path(archive)
+        self.names: dict[str, str] = {}
+        self.offsets: dict[str, int] = {}
+        self.zip: zipfile.ZipFile | None = None
+        self.tar: tarfile.TarFile | None = None
+        self.plain = False
+        makedirs(self.archive.parent, exist_ok=True)
+        name = self.archive.name
+        if name.endswith(".zip"):
+            self.zip = zipfile.ZipFile(self.archive, "w", zipfile.ZIP_DEFLATED)
+        elif name.endswith((".tar.gz", ".tgz")):
+            self.tar = tarfile.open(self.archive, "w:gz")
+        elif name.endswith(".tar.xz"):
+            self.tar = tarfile.open(self.archive, "w:xz")
+        else:
+            self.tar = tarfile.open(self.archive, "w")
+            self.plain = True
+
+    def write(
+        self,
+        path: str | Path,
+        chunks: Iterable[bytes],
+        hashes: dict[str, str] | None = None,
+    ) -> bool:
+        """
+        Add a file to the archive.
+
+        Args:
+            path: output path
+            chunks: output chunks
+            hashes: output hashes of the last build, updated in place
+
+        Returns:
+            True if the output changed since the last build
+
+        Raises:
+            ValueError: if the output was added with other content
+        """
+        key = self.relative(path)
+        chunks = self.filter(path, chunks)
+        digest = hashlib.sha256()
+        with SpooledTemporaryFile(max_size=SPOOL_SIZE) as file:
+            for chunk in chunks:
+                digest.update(chunk)
+                file.write(chunk)
+
+            if key in self.names:
+                if self.names[key] != digest.hexdigest():
+                    raise ValueError(
+                        "Output {key} was already added to {archive}.".format(
+                            key=key, archive=self.archive
+                        )
+                    )
+                return False
+
+            size = file.tell()
+            file.seek(0)
+            if self.zip is not None:
+                with self.zip.open(key, "w") as entry:
+                    shutil.copyfileobj(file, entry, WRITE_BUFFER)
+            elif self.tar is not None:
+                info = tarfile.TarInfo(key)
+                info.size = size
+                info.mtime = int(time.time())
+                self.tar.addfile(info, file)
+                blocks = -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+                if self.plain:
+                    self.offsets[key] = self.tar.offset - blocks
+
+            def read() -> bytes:
+                file.seek(0)
+                return file.read()
+
+            self.notify(path, read, digest.hexdigest())
+
+        self.names[key] = digest.hexdigest()
+        if hashes is None:
+            return True
+
+        changed = hashes.get(key) != digest.hexdigest()
+        hashes[key] = digest.hexdigest()
+        return changed
+
+    def exists(self, path: str | Path) -> bool:
+        """
+        Check if an output was already added to the archive.
+
+        Args:
+            path: output path
+
+        Returns:
+            True if the file was added
+        """
+        return self.relative(path) in self.names
+
+    def read(self, path: str | Path) -> bytes:
+        """
+        Read an output already added to the archive.
+
+        Args:
+            path: output path
+
+        Returns:
+            file content
+
+        Raises:
+            FileNotFoundError: if the file was not added
+            NotImplementedError: for compressed tar archives
+        """
+        key = self.relative(path)
+        if key not in self.names:
+            raise FileNotFoundError(key)
+
+        if self.zip is not None:
+            return self.zip.read(key)
+
+        if self.tar is None or self.tar.fileobj is None or not self.plain:
+            raise NotImplementedError(
+                "Outputs of {archive} cannot be read back.".format(archive=self.archive)
+            )
+
+        self.tar.fileobj.flush()  # type: ignore[attr-defined]
+        with open(self.archive, "rb") as file:
+            file.seek(self.offsets[key])
+            return file.read(self.tar.getmember(key).size)
+
+    def close(self) -> None:
+        """Finish the archive."""
+        if self.zip is not None:
+            self.zip.close()
+        if self.tar is not None:
+            self.tar.close()
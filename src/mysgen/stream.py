@@ -0,0 +1,91 @@
+"""Converted content kept out of memory and loaded per use, for mysgen."""
+from __future__ import annotations
+import logging
+import tempfile
+from typing import Callable, MutableMapping
+from pathlib import Path
+from functools import partial
+from mysgen.cache import Blobs
+
+
+logger = logging.getLogger(__name__)
+
+
+class ContentStore:
+    """
+    Converted HTML of items by parse key, on disk instead of in memory.
+
+    Items hold a loader instead of their content, so only the metadata index
+    stays in memory and the content of an item is read when a stage uses it,
+    and released after. Without blobs of a cache directory, the content is kept
+    in a temporary directory until close.
+    """
+
+    def __init__(self, blobs: MutableMapping[str, bytes | None] | None = None) -> None:
+        """
+        Initialise content store object.
+
+        Args:
+            blobs: binary entries to keep content in, None for a temporary store
+        """
+        self.tmp: tempfile.TemporaryDirectory | None = None
+        if blobs is None:
+            self.tmp = tempfile.TemporaryDirectory(prefix="mysgen-")
+            blobs = Blobs(Path(self.tmp.name), set())
+
+        self.blobs = blobs
+        self.loads = 0
+
+    def __contains__(self, key: str) -> bool:
+        """
+        Check for the content of a parse key.
+
+        Args:
+            key: parse key
+
+        Returns:
+            True if stored
+        """
+        return key in self.blobs
+
+    def put(self, key: str, content: str) -> None:
+        """
+        Store content.
+
+        Args:
+            key: parse key
+            content: converted HTML
+        """
+        self.blobs[key] = content.encode("utf-8")
+
+    def get(self, key: str) -> str:
+        """
+        Load content.
+
+        Args:
+            key: parse key
+
+        Returns:
+            converted HTML
+        """
+        self.loads += 1
+        return (self.blobs[key] or b"").decode("utf-8")
+
+    def loader(self, key: str) -> Callable[[], str]:
+        """
+        Loader of content, to hold instead of the content.
+
+        Args:
+            key: parse key
+
+        Returns:
+            function loading the content
+        """
+        return partial(self.get, key)
+
+    def close(self) -> None:
+        """Remove the temporary store, if any."""
+        logger.info("Loaded streamed content {count} times.".format(count=self.loads))
+        if self.tmp is not None:
+            self.tmp.cleanup()
+            self.tmp = None
@@ -2,7 +2,25 @@
 Integration test of mysgen.
 """
 import os
-from mysgen.mysgen import MySGEN
+import re
+import gzip
+import json
+import sys
+import shutil
+import subprocess
+import warnings
+import pytest
+import tarfile
+import zipfile
+from pathlib import Path
+from xml.etree import ElementTree
+from unittest.mock import patch, MagicMock
+from PIL import Image
+from jinja2 import Environment
+from mysgen.mysgen import ImagePost, MySGEN, build_sites
+from mysgen.cache import Cache
+from mysgen.sinks import MemorySink
+from mysgen.shared import SharedCaches
 
 
 CONFIG_FILE = "tests/fixtures/test_config.json"
@@ -40,3 +58,930 @@ def test_integration_mysgen():
 
         print(true_f)
         assert test == true
+
+
+def write_config(tmp_path, **settings):
+    """
+    Write a test config building a copy of the test content into tmp_path.
+
+    Args:
+        tmp_path: temporary directory
+        settings: settings to override
+
+    Returns:
+        path of the config file
+    """
+    with open(CONFIG_FILE, "r") as file:
+        config = json.load(file)
+
+    shutil.copytree(config["src_path"], tmp_path / "content")
+    config["src_path"] = str(tmp_path / "content")
+    config["build_path"] = str(tmp_path / "output")
+    config["cache_path"] = str(tmp_path / "cache")
+    config.update(settings)
+    config_file = tmp_path / "config.json"
+    with open(config_file, "w") as file:
+        json.dump(config, file)
+
+    return str(config_file)
+
+
+def read(path):
+    """
+    Read a text file.
+
+    Args:
+        path: file path
+
+    Returns:
+        file content
+    """
+    with open(path, "r") as file:
+        return file.read()
+
+
+def test_integration_mysgen_listings(tmp_path):
+    """
+    Integration test of paginated listing pages, rebuilt only when changed.
+    """
+    config_file = write_config(
+        tmp_path,
+        taxonomy_templates={"tags": "taxonomy", "categories": "taxonomy"},
+        paginate={"tags": 2, "archive": 2},
+    )
+    MySGEN(config_file).build()
+
+    output = tmp_path / "output"
+    newest = output / "tags" / "tag1" / "index.html"
+    oldest = output / "tags" / "tag1" / "page" / "1" / "index.html"
+    category = output / "categories" / "category" / "index.html"
+    archive = output / "archive" / "index.html"
+    archive_oldest = output / "archive" / "page" / "1" / "index.html"
+    assert 'data-list-length="1"' in read(newest)
+    assert 'href="/tags/tag1/page/1"' in read(newest)
+    assert 'data-list-length="2"' in read(oldest)
+    assert 'data-list-length="3"' in read(category)
+    assert 'data-list-length="1"' in read(archive)
+    assert 'data-list-length="2"' in read(archive_oldest)
+
+    listings = [newest, oldest, category, archive, archive_oldest]
+    for listing in listings:
+        os.utime(listing, ns=(0, 0))
+    MySGEN(config_file).build()
+
+    assert [os.stat(listing).st_mtime_ns for listing in listings] == [0] * 5
+
+    post = read(tmp_path / "content" / "posts" / "post.md")
+    with open(tmp_path / "content" / "posts" / "newpost.md", "w") as file:
+        file.write(post.replace("2021-01-24", "2021-01-27"))
+    MySGEN(config_file).build()
+
+    assert os.stat(archive).st_mtime_ns != 0
+    assert 'data-list-length="2"' in read(archive)
+    assert os.stat(archive_oldest).st_mtime_ns == 0
+
+
+def test_integration_mysgen_listings_home(tmp_path, caplog):
+    """
+    Integration test of a paginated home page next to taxonomy listings.
+    """
+    config_file = write_config(
+        tmp_path,
+        taxonomy_templates={"tags": "taxonomy"},
+        paginate={"home": 1, "tags": 1},
+    )
+    MySGEN(config_file).build()
+    assert "set paginate_segment" in caplog.text
+    assert (tmp_path / "output/page/1/index.html").is_file()
+    MySGEN(config_file).build()
+
+    listings = Cache(tmp_path / "cache").load("taxonomy_listings")
+    assert set(listings) == {"tags"}
+    assert str(Path("tags/tag1/page/1")) in listings["tags"]
+
+    config_file = write_config(
+        tmp_path / "segment",
+        taxonomy_templates={"tags": "taxonomy"},
+        paginate={"home": 1, "tags": 1},
+        paginate_segment="older",
+    )
+    MySGEN(config_file).build()
+    output = tmp_path / "segment/output"
+    assert (output / "older/1/index.html").is_file()
+    assert (output / "tags/tag1/older/1/index.html").is_file()
+    assert not (output / "page/1").exists()
+
+
+def test_integration_mysgen_listings_menu(tmp_path):
+    """
+    Integration test of taxonomy listing pages rendered again for a new page.
+    """
+    with open(CONFIG_FILE, "r") as file:
+        theme_path = json.load(file)["theme_path"]
+    shutil.copytree(theme_path, tmp_path / "theme")
+    taxonomy = tmp_path / "theme/templates/taxonomy.html"
+    taxonomy.write_text(
+        read(taxonomy).replace(
+            "<h1>", "{% for title in menuitems %}<a>{{ title }}</a>{% endfor %}<h1>"
+        )
+    )
+    config_file = write_config(
+        tmp_path,
+        theme_path=str(tmp_path / "theme"),
+        taxonomy_templates={"tags": "taxonomy"},
+    )
+    MySGEN(config_file).build()
+    tag = tmp_path / "output/tags/tag1/index.html"
+    assert "<a>newpage</a>" not in read(tag)
+
+    page = read(tmp_path / "content/pages/page.md")
+    (tmp_path / "content/pages/newpage.md").write_text(page)
+    MySGEN(config_file).build()
+    assert "<a>newpage</a>" in read(tag)
+
+
+def test_integration_mysgen_listings_globals(tmp_path):
+    """
+    Integration test of listing pages rendered again for a global they show.
+    """
+    with open(CONFIG_FILE, "r") as file:
+        theme_path = json.load(file)["theme_path"]
+    shutil.copytree(theme_path, tmp_path / "theme")
+    taxonomy = tmp_path / "theme/templates/taxonomy.html"
+    taxonomy.write_text(
+        read(taxonomy).replace("<h1>", "<p>{{ tags|join(',') }}</p><h1>")
+    )
+    config_file = write_config(
+        tmp_path,
+        theme_path=str(tmp_path / "theme"),
+        taxonomy_templates={"tags": "taxonomy"},
+    )
+    MySGEN(config_file).build()
+    tag = tmp_path / "output/tags/tag1/index.html"
+    assert "<p>tag1,tag2</p>" in read(tag)
+
+    post = read(tmp_path / "content/posts/post.md")
+    (tmp_path / "content/posts/newpost.md").write_text(
+        post.replace("tags: tag1, tag2", "tags: tag3")
+    )
+    mysgen = MySGEN(config_file)
+    mysgen.build()
+    assert "<p>tag1,tag2,tag3</p>" in read(tag)
+    assert mysgen.base["template_globals"]["taxonomy"] == ["tags"]
+
+
+def test_integration_mysgen_sinks(tmp_path):
+    """
+    Integration test of building into memory and into an archive.
+    """
+    config_file = write_config(tmp_path)
+    MySGEN(config_file).build()
+    output = tmp_path / "output"
+    files = {
+        Path(path, name).relative_to(output).as_posix(): Path(path, name).read_bytes()
+        for path, _, names in os.walk(output)
+        for name in names
+    }
+
+    sink = MemorySink()
+    MySGEN(config_file, sink=sink).build()
+    assert sink.files == files
+
+    shutil.rmtree(output)
+    archive_config = write_config(
+        tmp_path / "archive", build_archive=str(tmp_path / "site.tar.gz")
+    )
+    MySGEN(archive_config).build()
+    assert not (tmp_path / "archive" / "output").exists()
+    with tarfile.open(tmp_path / "site.tar.gz") as archive:
+        assert {
+            name: archive.extractfile(name).read() for name in archive.getnames()
+        } == files
+
+
+@pytest.mark.parametrize("formats", [["gz", "br"], True])
+def test_integration_mysgen_precompress(formats, tmp_path):
+    """
+    Integration test of precompressed outputs.
+    """
+    config_file = write_config(tmp_path, precompress=formats)
+    MySGEN(config_file).build()
+
+    output = tmp_path / "output"
+    for name in ["index.html", "css/foo.css", "js/foo.js", "posts/post/index.html"]:
+        with gzip.open(output / (name + ".gz")) as file:
+            assert file.read() == (output / name).read_bytes()
+        assert (output / (name + ".br")).exists()
+    assert not list(output.glob("posts/imagepost/images/*.gz"))
+
+    os.utime(output / "index.html.gz", ns=(0, 0))
+    MySGEN(config_file).build()
+    assert os.stat(output / "index.html.gz").st_mtime_ns == 0
+
+
+def test_integration_mysgen_minify(tmp_path):
+    """
+    Integration test of minified outputs and the minification cache.
+    """
+    config_file = write_config(tmp_path, minify=True)
+    mysgen = MySGEN(config_file)
+    mysgen.build()
+
+    output = tmp_path / "output"
+    known = Path(known_output)
+    for name in ["index.html", "posts/post/index.html", "archive/index.html"]:
+        assert len((output / name).read_bytes()) < len((known / name).read_bytes())
+    assert "\n  " not in read(output / "index.html")
+    stats = mysgen.minifier.stats
+    assert stats["html"]["out"] < stats["html"]["in"]
+
+    mock_minify = MagicMock()
+    with patch.dict("mysgen.minify.MINIFIERS", html=mock_minify):
+        MySGEN(config_file).build()
+    mock_minify.assert_not_called()
+
+
+def test_integration_mysgen_fingerprint_assets(tmp_path):
+    """
+    Integration test of fingerprinted assets and thumbnails.
+    """
+    config_file = write_config(
+        tmp_path,
+        fingerprint_assets=True,
+        fingerprint_thumbnails=True,
+        thumbnail_size=[8, 8],
+    )
+    mysgen = MySGEN(config_file)
+    mysgen.build()
+
+    output = tmp_path / "output"
+    manifest = json.loads(read(output / "manifest.json"))
+    assert set(manifest) == {"css/foo.css", "js/foo.js"}
+    for name in manifest.values():
+        assert (output / name).exists()
+    assert not (output / "css/foo.css").exists()
+    assert mysgen.assets.url("css/foo.css") == "/" + manifest["css/foo.css"]
+    assert list(output.glob("posts/imagepost/images/*_small.*.*"))
+
+
+@pytest.mark.parametrize("kind", ["html", "json"])
+def test_integration_mysgen_fragment_payloads(tmp_path, kind):
+    """
+    Integration test of fragment payloads for menu navigation.
+    """
+    config_file = write_config(tmp_path, fragment_payloads=kind)
+    MySGEN(config_file).build()
+
+    output = tmp_path / "output"
+    for name, div in [
+        ("", "ajax_content_home"),
+        ("archive/", "ajax_content_archive"),
+        ("page/", "ajax_content_page"),
+    ]:
+        payload = read(output / (name + "fragment." + kind))
+        if kind == "json":
+            payload = json.loads(payload)["html"]
+        assert payload.startswith('<div id="' + div + '"')
+        assert payload in read(output / name / "index.html")
+    assert not (output / ("posts/post/fragment." + kind)).exists()
+
+
+def test_integration_mysgen_search(tmp_path):
+    """
+    Integration test of the client search index.
+    """
+    config_file = write_config(tmp_path, search=True)
+    MySGEN(config_file).build()
+
+    search = tmp_path / "output" / "search"
+    meta = json.loads(read(search / "meta.json"))
+    assert (search / "search.js").exists()
+    docs = {}
+    for shard in search.glob("docs/*.json"):
+        docs.update(json.loads(read(shard)))
+    urls = {doc[1] for doc in docs.values()}
+    assert urls == {"/posts/post", "/posts/imagepost", "/posts/datapost"}
+
+    index = {}
+    for shard in search.glob("index/*.json"):
+        assert len(shard.stem) == meta["prefix"] or shard.stem.startswith("_")
+        index.update(json.loads(read(shard)))
+    assert {docs[str(doc_id)][1] for doc_id, _ in index["post"]} >= {"/posts/post"}
+
+
+def test_integration_mysgen_related(tmp_path):
+    """
+    Integration test of related posts.
+    """
+    config_file = write_config(tmp_path, related_posts=2)
+    mysgen = MySGEN(config_file)
+    mysgen.build()
+
+    for post in mysgen.posts.values():
+        related = post.meta["related"]
+        assert len(related) <= 2
+        assert post.meta["path"].as_posix() not in {r["url"][1:] for r in related}
+        assert all(r["score"] > 0 for r in related)
+
+
+def test_integration_mysgen_feeds(tmp_path):
+    """
+    Integration test of feeds and the sitemap.
+    """
+    config_file = write_config(
+        tmp_path,
+        feeds=["atom", "rss"],
+        sitemap=True,
+        taxonomy_templates={"tags": "taxonomy"},
+        cache_path=str(tmp_path / "cache"),
+    )
+    MySGEN(config_file).build()
+
+    output = tmp_path / "output"
+    atom = "{http://www.w3.org/2005/Atom}"
+    feed = ElementTree.parse(output / "feed.xml").getroot()
+    links = [e.find(atom + "link").get("href") for e in feed.iter(atom + "entry")]
+    assert links == [
+        "https://address.com/posts/datapost",
+        "https://address.com/posts/imagepost",
+        "https://address.com/posts/post",
+    ]
+    rss = ElementTree.parse(output / "rss.xml").getroot()
+    assert len(rss.findall("channel/item")) == 3
+
+    sitemap = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+    urls = ElementTree.parse(output / "sitemap.xml").getroot()
+    locs = {url.find(sitemap + "loc").text for url in urls}
+    assert {"https://address.com/", "https://address.com/posts/post"} <= locs
+
+    MySGEN(config_file).build()
+    urls = ElementTree.parse(output / "sitemap.xml").getroot()
+    assert {url.find(sitemap + "loc").text for url in urls} == locs
+
+
+def test_integration_mysgen_build_date(tmp_path):
+    """
+    Integration test of a build date following content changes only.
+    """
+    config_file = write_config(tmp_path, build_date_source="content")
+    with patch("mysgen.mysgen.today", return_value="2021-01-01"):
+        mysgen = MySGEN(config_file)
+        mysgen.build()
+    render_key = mysgen.base["render_key"]
+    assert mysgen.base["date_templates"] == []
+
+    with patch("mysgen.mysgen.today", return_value="2021-01-02"):
+        mysgen = MySGEN(config_file)
+        mysgen.build()
+    assert mysgen.base["build_date"] == "2021-01-01"
+    assert mysgen.base["render_key"] == render_key
+
+    post = tmp_path / "content" / "posts" / "post.md"
+    post.write_text(read(post) + "\nMore.\n")
+    with patch("mysgen.mysgen.today", return_value="2021-01-03"):
+        mysgen = MySGEN(config_file)
+        mysgen.build()
+    assert mysgen.base["build_date"] == "2021-01-03"
+
+
+def test_integration_mysgen_placeholders(tmp_path):
+    """
+    Integration test of placeholders and the parse cache.
+    """
+    config_file = write_config(
+        tmp_path, placeholders={"{{author}}": "Me"}, fingerprint_assets=True
+    )
+    page = tmp_path / "content" / "pages" / "page.md"
+    page.write_text(
+        read(page) + "\n{{update_date}} {{post:post}} {{asset:css/foo.css}} "
+        "{{siteurl}} {{author}}\n\n{{post_url}}\n"
+    )
+    post = tmp_path / "content" / "posts" / "post.md"
+    post.write_text(read(post) + "\n{{post_url}}\n")
+    mysgen = MySGEN(config_file)
+    mysgen.build()
+
+    content = mysgen.pages["page.md"].content
+    expected = "<p>{date} /posts/post {css} https://address.com Me</p>".format(
+        date=mysgen.base["build_date"], css=mysgen.assets.url("css/foo.css")
+    )
+    assert content.endswith(expected + "\n<p>{{post_url}}</p>")
+    assert expected in read(tmp_path / "output" / "page" / "index.html")
+    assert mysgen.posts["post.md"].content.endswith("<p>/posts/post</p>")
+    assert mysgen.base["date_outputs"] == ["page/index.html"]
+
+    with patch("markdown.Markdown.convert") as mock_convert:
+        MySGEN(config_file).build()
+    mock_convert.assert_not_called()
+
+
+def test_integration_mysgen_block_cache(tmp_path):
+    """
+    Integration test of the block cache, output is the same as without it.
+    """
+    post = "```python\nprint('a')\n```\n\n$$\na = b\n$$\n"
+    outputs = []
+    for block_cache in [0, 100]:
+        path = tmp_path / str(block_cache)
+        path.mkdir()
+        config_file = write_config(path, block_cache=block_cache)
+        post_file = path / "content" / "posts" / "post.md"
+        post_file.write_text(read(post_file) + "\n" + post)
+        mysgen = MySGEN(config_file)
+        mysgen.build()
+        outputs.append(read(path / "output" / "posts" / "post" / "index.html"))
+
+    assert "print" in outputs[1]
+    assert outputs[0] == outputs[1]
+    assert mysgen.blocks is not None
+    assert mysgen.blocks.rendered == 2
+
+
+def test_integration_mysgen_markdown_backend(tmp_path):
+    """
+    Integration test of the markdown-it backend and the backend comparison.
+    """
+    outputs = []
+    for backend in ["markdown", "markdown-it"]:
+        path = tmp_path / backend
+        path.mkdir()
+        config_file = write_config(
+            path, markdown_backend=backend, markdown_compare=True
+        )
+        mysgen = MySGEN(config_file)
+        mysgen.build()
+        assert mysgen.compare_backends() == {}
+
+        post = path / "output" / "posts" / "post" / "index.html"
+        outputs.append(re.sub(r">\s+<", "><", read(post)))
+
+    assert outputs[0] == outputs[1]
+
+
+def test_integration_mysgen_shards(tmp_path):
+    """
+    Integration test of a build sharded over processes, merged into one build.
+    """
+    trees = []
+    for name in ["full", "sharded"]:
+        path = tmp_path / name
+        path.mkdir()
+        config_file = write_config(
+            path,
+            taxonomy_templates={"tags": "taxonomy", "categories": "taxonomy"},
+            cache_path=str(path / "cache"),
+            sitemap=True,
+        )
+        if name == "full":
+            MySGEN(config_file).build()
+        else:
+            script = (
+                "from mysgen.mysgen import MySGEN; MySGEN({config!r}).build(({i}, 2))"
+            )
+            processes = [
+                subprocess.Popen(
+                    [sys.executable, "-c", script.format(config=config_file, i=i)]
+                )
+                for i in range(2)
+            ]
+            assert [process.wait() for process in processes] == [0, 0]
+            manifests = [
+                json.loads(read(path / "output-shard-{i}-of-2/shard.json".format(i=i)))
+                for i in range(2)
+            ]
+            assert all(manifest["files"] for manifest in manifests)
+            assert manifests[0]["state"] == manifests[1]["state"]
+            MySGEN(config_file).merge(2)
+
+        output = path / "output"
+        trees.append(
+            {
+                file.relative_to(output).as_posix(): file.read_bytes()
+                for file in output.rglob("*")
+                if file.is_file()
+            }
+        )
+
+    assert trees[0] == trees[1]
+    assert "sitemap.xml" in trees[1]
+
+    with pytest.raises(FileNotFoundError):
+        MySGEN(config_file).merge(3)
+
+
+def test_integration_mysgen_shards_images(tmp_path):
+    """
+    Integration test of sharded listings showing the images of every post.
+    """
+    with open(CONFIG_FILE, "r") as file:
+        theme_path = json.load(file)["theme_path"]
+    shutil.copytree(theme_path, tmp_path / "theme")
+    kernel = tmp_path / "theme/templates/archive_kernel.html"
+    kernel.write_text(
+        read(kernel).replace(
+            "{{ article.title }}",
+            "{{ article.title }} {{ article.image_paths }} {{ article.thumbnails }}",
+        )
+    )
+    trees = []
+    for count in [1, 4]:
+        path = tmp_path / str(count)
+        path.mkdir()
+        config_file = write_config(
+            path, theme_path=str(tmp_path / "theme"), thumbnail_size=[8, 8]
+        )
+        if count == 1:
+            MySGEN(config_file).build()
+        else:
+            for i in range(count):
+                MySGEN(config_file).build((i, count))
+            MySGEN(config_file).merge(count)
+
+        output = path / "output"
+        trees.append(
+            {
+                file.relative_to(output).as_posix(): file.read_bytes()
+                for file in output.rglob("*")
+                if file.is_file()
+            }
+        )
+
+    assert trees[0] == trees[1]
+    assert b"testimage_small.png" in trees[1]["archive/index.html"]
+
+
+def test_integration_mysgen_sites(tmp_path):
+    """
+    Integration test of building several sites in one process with shared caches.
+    """
+    config_files = []
+    for name in ["a", "b", "single"]:
+        path = tmp_path / name
+        path.mkdir()
+        config_files.append(write_config(path, thumbnail_size=[8, 8]))
+
+    shared = SharedCaches()
+    with patch("mysgen.mysgen.SharedCaches", return_value=shared):
+        timings = build_sites(config_files[:2])
+    MySGEN(config_files[2]).build()
+
+    assert list(timings) == config_files[:2]
+    assert all(seconds > 0 for seconds in timings.values())
+    stats = shared.stats()
+    items = list((tmp_path / "b" / "content").glob("p*s/*.md"))
+    assert stats["parsed"] == {"entries": len(items), "hits": len(items)}
+    assert stats["templates"]["hits"] >= stats["templates"]["entries"] > 0
+    assert stats["images"]["entries"] > 0
+
+    trees = []
+    for name in ["b", "single"]:
+        output = tmp_path / name / "output"
+        trees.append(
+            {
+                file.relative_to(output).as_posix(): file.read_bytes()
+                for file in output.rglob("*")
+                if file.is_file()
+            }
+        )
+    assert trees[0] == trees[1]
+    assert any("_small" in name for name in trees[0])
+
+
+def test_integration_mysgen_cache_archive(tmp_path):
+    """
+    Integration test of a cache carried to a fresh runner in an archive.
+    """
+    config_file = write_config(tmp_path, thumbnail_size=[8, 8])
+    MySGEN(config_file).build()
+    Cache(tmp_path / "cache").export_archive(tmp_path / "cache.tar.gz")
+    shutil.rmtree(tmp_path / "cache")
+
+    config = json.loads(read(config_file))
+    config["build_path"] = str(tmp_path / "fresh")
+    with open(config_file, "w") as file:
+        json.dump(config, file)
+    Cache(tmp_path / "cache").import_archive(tmp_path / "cache.tar.gz")
+    with patch.object(ImagePost, "_thumbnail") as mock_thumbnail, patch.object(
+        Environment, "compile"
+    ) as mock_compile:
+        MySGEN(config_file).build()
+
+    mock_thumbnail.assert_not_called()
+    mock_compile.assert_not_called()
+    trees = []
+    for name in ["output", "fresh"]:
+        output = tmp_path / name
+        trees.append(
+            {
+                file.relative_to(output).as_posix(): file.read_bytes()
+                for file in output.rglob("*")
+                if file.is_file()
+            }
+        )
+    assert trees[0] == trees[1]
+    assert Cache(tmp_path / "cache").gc() == 0
+
+
+def test_integration_mysgen_priority(tmp_path):
+    """
+    Integration test of a build rendering the critical items first.
+    """
+    config_files = []
+    for name, settings in [("full", {}), ("priority", {"priority_posts": 1})]:
+        path = tmp_path / name
+        path.mkdir()
+        config_files.append(write_config(path, thumbnail_size=[8, 8], **settings))
+
+    published = []
+
+    def publish(outputs):
+        output = tmp_path / "priority" / "output"
+        assert not (output / "posts/post/index.html").exists()
+        published.extend(outputs)
+
+    MySGEN(config_files[0]).build()
+    MySGEN(config_files[1]).build(publish=publish)
+
+    assert {
+        "index.html",
+        "archive/index.html",
+        "posts/datapost/index.html",
+        "css/foo.css",
+    } <= set(published)
+    assert "posts/post/index.html" not in published
+    trees = []
+    for name in ["full", "priority"]:
+        output = tmp_path / name / "output"
+        trees.append(
+            {
+                file.relative_to(output).as_posix(): file.read_bytes()
+                for file in output.rglob("*")
+                if file.is_file()
+            }
+        )
+    assert trees[0] == trees[1]
+
+
+def test_integration_mysgen_stream_content(tmp_path):
+    """
+    Integration test of a build streaming content from the content store.
+    """
+    settings = {
+        "search": True,
+        "related_posts": 2,
+        "feeds": ["atom"],
+        "precompress": ["gz"],
+        "thumbnail_size": [8, 8],
+    }
+    config_files = []
+    for name, stream in [("memory", {}), ("stream", {"stream_content": True})]:
+        path = tmp_path / name
+        path.mkdir()
+        config_files.append(write_config(path, **settings, **stream))
+
+    MySGEN(config_files[0]).build()
+    for _ in range(2):
+        mysgen = MySGEN(config_files[1])
+        mysgen.build()
+
+    assert all(
+        item.loader is not None
+        for items in [mysgen.posts, mysgen.pages]
+        for item in items.values()
+    )
+    parsed = json.loads(read(tmp_path / "stream/cache/parsed.json"))
+    assert all(len(entry) == 2 for entry in parsed.values())
+    trees = []
+    for name in ["memory", "stream"]:
+        output = tmp_path / name / "output"
+        trees.append(
+            {
+                file.relative_to(output).as_posix(): file.read_bytes()
+                for file in output.rglob("*")
+                if file.is_file()
+            }
+        )
+    assert trees[0] == trees[1]
+    assert "search/meta.json" in trees[1]
+
+
+def test_integration_mysgen_changes(tmp_path):
+    """
+    Integration test of a warm build finding changes from the stat index.
+    """
+    config_file = write_config(tmp_path, thumbnail_size=[8, 8])
+    mysgen = MySGEN(config_file)
+    mysgen.build()
+    assert len(mysgen.changed) > 0
+
+    output = tmp_path / "output"
+    data = next(file for file in (output / "posts/datapost/data").rglob("*"))
+    mtime = data.stat().st_mtime_ns
+    with patch("mysgen.changes.file_digest") as mock_file_digest, patch(
+        "mysgen.mysgen.open", create=True, wraps=open
+    ) as mock_open:
+        mysgen = MySGEN(config_file)
+        mysgen.build()
+
+    mock_file_digest.assert_not_called()
+    assert not any(
+        str(call.args[0]).endswith(".md") for call in mock_open.call_args_list
+    )
+    assert mysgen.changed == []
+    assert data.stat().st_mtime_ns == mtime
+
+    post = tmp_path / "content/posts/post.md"
+    post.write_text(read(post) + "\nMore text.\n")
+    mysgen = MySGEN(config_file)
+    mysgen.build()
+    assert mysgen.changed == [post.as_posix()]
+
+
+def test_integration_mysgen_changes_draft(tmp_path):
+    """
+    Integration test of data edited while its post is a draft.
+    """
+    config_file = write_config(tmp_path)
+    MySGEN(config_file).build()
+
+    post = tmp_path / "content/posts/datapost.md"
+    published = read(post)
+    post.write_text(published.replace("status: published", "status: draft"))
+    data = tmp_path / "content/data/datapost/data.txt"
+    data.write_text("Edited data.")
+    MySGEN(config_file).build()
+
+    post.write_text(published)
+    MySGEN(config_file).build()
+    assert read(tmp_path / "output/posts/datapost/data/data.txt") == "Edited data."
+
+
+def test_integration_mysgen_no_items(tmp_path):
+    """
+    Integration test of a missing posts directory and an empty pages directory.
+    """
+    config_file = write_config(tmp_path)
+    shutil.rmtree(tmp_path / "content/posts")
+    shutil.rmtree(tmp_path / "content/pages")
+    (tmp_path / "content/pages").mkdir()
+    mysgen = MySGEN(config_file)
+    mysgen.build()
+
+    assert mysgen.posts == {}
+    assert mysgen.pages == {}
+    assert (tmp_path / "output" / "css").is_dir()
+
+
+def test_integration_mysgen_nested_layout(tmp_path):
+    """
+    Integration test of nested sources with flat output paths.
+    """
+    flat = tmp_path / "flat"
+    flat.mkdir()
+    MySGEN(write_config(flat, thumbnail_size=[8, 8])).build()
+
+    nested = tmp_path / "nested"
+    nested.mkdir()
+    config_file = write_config(
+        nested, thumbnail_size=[8, 8], output_paths={"posts": "posts/{name}"}
+    )
+    content = nested / "content"
+    for folder, name in [
+        ("posts", "imagepost.md"),
+        ("posts", "datapost.md"),
+        ("images", "imagepost"),
+        ("data", "datapost"),
+    ]:
+        (content / folder / "2024/05").mkdir(parents=True, exist_ok=True)
+        (content / folder / name).rename(content / folder / "2024/05" / name)
+
+    mysgen = MySGEN(config_file)
+    mysgen.build()
+    assert sorted(mysgen.posts) == [
+        "2024/05/datapost.md",
+        "2024/05/imagepost.md",
+        "post.md",
+    ]
+
+    trees = []
+    for path in [flat, nested]:
+        output = path / "output"
+        trees.append(
+            {
+                file.relative_to(output).as_posix(): file.read_bytes()
+                for file in output.rglob("*")
+                if file.is_file()
+            }
+        )
+    assert trees[0] == trees[1]
+    assert any("_small" in name for name in trees[0])
+    assert "posts/datapost/data/data.txt" in trees[0]
+
+    config_file = write_config(tmp_path, thumbnail_size=[8, 8])
+    shutil.rmtree(tmp_path / "content")
+    shutil.copytree(content, tmp_path / "content")
+    MySGEN(config_file).build()
+    output = tmp_path / "output/posts/2024/05"
+    assert (output / "imagepost/index.html").is_file()
+    assert list((output / "imagepost/images").glob("*_small.*"))
+    assert (output / "datapost/data/data.txt").is_file()
+
+
+def test_integration_mysgen_data_previews(tmp_path):
+    """
+    Integration test of data previews cached by source hash.
+    """
+    config_file = write_config(
+        tmp_path, thumbnail_size=[8, 8], data_previews=100, data_raw=False
+    )
+    rows = "".join("{i},{j}\n".format(i=i, j=(i * 7) % 13) for i in range(5000))
+    (tmp_path / "content/data/datapost/table.csv").write_text("t,v\n" + rows)
+    mysgen = MySGEN(config_file)
+    mysgen.build()
+
+    data = tmp_path / "output/posts/datapost/data"
+    assert sorted(file.name for file in data.iterdir()) == [
+        "data.txt",
+        "table.csv.preview.json",
+    ]
+    preview = json.loads(read(data / "table.csv.preview.json"))
+    assert preview["rows"] == 5000
+    assert len(preview["x"]) == 50
+    assert preview["summary"]["v"]["max"] == 12.0
+    previews = mysgen.posts["datapost.md"].meta["previews"]
+    assert previews["table.csv"]["url"] == "/posts/datapost/data/table.csv.preview.json"
+
+    with patch("mysgen.previews.summarize") as mock_summarize:
+        mysgen = MySGEN(config_file)
+        mysgen.build()
+
+    mock_summarize.assert_not_called()
+    assert mysgen.posts["datapost.md"].meta["previews"] == previews
+
+
+def test_integration_mysgen_mangled_image_names(tmp_path):
+    """
+    Integration test of image names that only change with the image bytes.
+    """
+    config_file = write_config(tmp_path, thumbnail_size=[8, 8], mangle_image_name=True)
+    images = tmp_path / "content/images/imagepost"
+    mysgen = MySGEN(config_file)
+    mysgen.build()
+    names = mysgen.posts["imagepost.md"].meta["image_paths"]
+    assert len(names) == 1
+    assert names[0] != "testimage.png"
+
+    shutil.copy(images / "testimage.png", images / "another.png")
+    with Image.open(images / "another.png") as image:
+        image.rotate(90).save(images / "another.png")
+    mysgen = MySGEN(config_file)
+    mysgen.build()
+    paths = mysgen.posts["imagepost.md"].meta["image_paths"]
+    assert len(paths) == 2
+    assert paths[1] == names[0]
+
+    with Image.open(images / "testimage.png") as image:
+        image.transpose(Image.FLIP_LEFT_RIGHT).save(images / "testimage.png")
+    mysgen = MySGEN(config_file)
+    mysgen.build()
+    assert mysgen.posts["imagepost.md"].meta["image_paths"][0] == paths[0]
+    assert mysgen.posts["imagepost.md"].meta["image_paths"][1] != names[0]
+
+    output = tmp_path / "output/posts/imagepost/images"
+    for name in mysgen.posts["imagepost.md"].meta["image_paths"]:
+        assert (output / name).read_bytes() in {
+            file.read_bytes() for file in images.iterdir()
+        }
+
+
+def test_integration_mysgen_archive_priority(tmp_path):
+    """
+    Integration test of a scheduled archive build adding every output once.
+    """
+    for archive in ["site.zip", "site.tar"]:
+        path = tmp_path / archive.split(".")[1]
+        path.mkdir()
+        config_file = write_config(
+            path,
+            build_archive=str(path / archive),
+            priority_posts=1,
+            paginate={"archive": 1},
+            sitemap=True,
+            precompress=["gz"],
+            thumbnail_size=[8, 8],
+        )
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            MySGEN(config_file).build()
+        if archive.endswith(".zip"):
+            with zipfile.ZipFile(path / archive) as file:
+                sitemap = file.read("sitemap.xml")
+                names = file.namelist()
+        else:
+            with tarfile.open(path / archive) as file:
+                sitemap = file.extractfile("sitemap.xml").read()
+                names = file.getnames()
+
+        assert len(names) == len(set(names))
+
+        assert b"/archive/page/1</loc>" in sitemap
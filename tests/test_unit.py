@@ -3,14 +3,59 @@ Functions to test mysgen.
 """
 import os
 import json
+import shutil
+import pickle
 import pytest
+import tarfile
+import zipfile
+import gzip
 import hashlib
+import markdown
+from io import BytesIO
 from pathlib import Path
 from datetime import datetime
 from collections import OrderedDict
 from distutils.errors import DistutilsFileError
 from unittest.mock import patch, mock_open, MagicMock
-from mysgen.mysgen import MySGEN, Item, Post, ImagePost, DataPost, Page, DataPage, build
+from mysgen.mysgen import (
+    MySGEN,
+    Meta,
+    Item,
+    Placeholders,
+    Post,
+    ImagePost,
+    DataPost,
+    Page,
+    DataPage,
+    FragmentCache,
+    ListingPage,
+    Taxonomy,
+    build,
+    fragment_url,
+    today,
+    uses_variable,
+    paginate,
+    slugify,
+)
+from mysgen.sinks import FileSystemSink, MemorySink, ArchiveSink
+from mysgen.compress import Precompressor, compress
+from mysgen.minify import Minifier, minify_css, minify_html, minify_js
+from mysgen.assets import Assets, fingerprint
+from mysgen.search import SearchIndex, shard_name, tokenize
+from mysgen.related import RelatedPosts, features, top_k, vectorize
+from mysgen.feeds import Feeds, Sitemap, atom_entry, rss_item
+from mysgen.blocks import BlockCache
+from mysgen.shards import merge, read_manifests, shard_of, shard_path, write_manifest
+from mysgen.shared import SharedCaches
+from mysgen.cache import Cache, main as cache_main
+from mysgen.schedule import critical_items
+from mysgen.stream import ContentStore
+from mysgen.changes import StatIndex
+from mysgen.layout import find_sources, output_path, walk
+from mysgen.previews import preview, summarize
+from mysgen.backends import MarkdownItConverter, compare, converter, split_meta
+from jinja2 import DictLoader, Environment
+from PIL import Image
 
 this_dir = os.path.dirname(os.path.realpath(__file__))
 
@@ -61,20 +106,36 @@ class TestUnitMySGEN:
 
     @pytest.mark.parametrize("s3_bucket", [("bucket"), (False), (None)])
     @patch("mysgen.mysgen.MySGEN.copy_s3")
+    @patch("mysgen.mysgen.MySGEN.process_taxonomies")
+    @patch("mysgen.mysgen.MySGEN.build_taxonomies")
     @patch("mysgen.mysgen.MySGEN.process")
     @patch("mysgen.mysgen.MySGEN.build_menu")
     @patch("mysgen.mysgen.MySGEN.find_and_parse")
     @patch("mysgen.mysgen.MySGEN.define_environment")
     @patch("mysgen.mysgen.MySGEN.set_base_config")
     @patch("mysgen.mysgen.MySGEN.copy_assets")
+    @patch("mysgen.mysgen.MySGEN.build_search")
+    @patch("mysgen.mysgen.MySGEN.build_related")
+    @patch("mysgen.mysgen.MySGEN.build_feeds")
+    @patch("mysgen.mysgen.MySGEN.set_build_date")
+    @patch("mysgen.mysgen.MySGEN.substitute_placeholders")
+    @patch("mysgen.mysgen.MySGEN.find_changes")
     def test_unit_mysgen_build(
         self,
+        mock_find_changes,
+        mock_substitute_placeholders,
+        mock_set_build_date,
+        mock_build_feeds,
+        mock_build_related,
+        mock_build_search,
         mock_copy_assets,
         mock_set_base_config,
         mock_define_environment,
         mock_find_and_parse,
         mock_build_menu,
         mock_process,
+        mock_build_taxonomies,
+        mock_process_taxonomies,
         mock_copy_s3,
         s3_bucket,
     ):
@@ -83,15 +144,26 @@ class TestUnitMySGEN:
         """
         mysgen = MySGEN(CONFIG_FILE)
         mysgen.base["s3-bucket"] = s3_bucket
-        mysgen.build()
+        with patch.object(MySGEN, "_global_state") as mock_global_state:
+            mysgen.build()
+
+        mock_global_state.assert_not_called()
 
         mock_set_base_config.assert_called_once()
         if s3_bucket:
             mock_copy_s3.assert_called_once()
+        mock_find_changes.assert_called_once()
         mock_define_environment.assert_called_once()
         assert mock_find_and_parse.call_count == 2
         mock_build_menu.assert_called_once()
+        mock_build_taxonomies.assert_called_once()
         assert mock_process.call_count == 2
+        mock_process_taxonomies.assert_called_once()
+        mock_build_related.assert_called_once()
+        mock_build_search.assert_called_once()
+        mock_build_feeds.assert_called_once()
+        mock_set_build_date.assert_called_once()
+        mock_substitute_placeholders.assert_called_once()
         mock_copy_assets.assert_called_once()
 
     @patch("builtins.open", mock_open(read_data=test_config))
@@ -132,7 +204,7 @@ class TestUnitMySGEN:
         }
 
     @patch("mysgen.mysgen.scandir")
-    @patch("mysgen.mysgen.markdown.Markdown")
+    @patch("mysgen.backends.markdown.Markdown")
     @patch("mysgen.mysgen.Environment")
     @patch("mysgen.mysgen.FileSystemLoader")
     def test_unit_define_environment(
@@ -184,10 +256,10 @@ class TestUnitMySGEN:
     @patch("mysgen.mysgen.Post")
     @patch("mysgen.mysgen.Page")
     @patch("mysgen.mysgen.MySGEN._parse")
-    @patch("mysgen.mysgen.Path.glob")
+    @patch("mysgen.mysgen.find_sources")
     def test_unit_find_and_parse(
         self,
-        mock_glob,
+        mock_find_sources,
         mock_parse,
         mock_page,
         mock_post,
@@ -206,15 +278,15 @@ class TestUnitMySGEN:
             "src_path": Path("content"),
             "build_path": Path("output"),
         }
-        mock_glob.return_value = files
+        mock_find_sources.return_value = files
         if item_type != "posts" and item_type != "pages":
             with pytest.raises(NotImplementedError):
                 mysgen.find_and_parse(item_type)
 
         elif not files:
-            with pytest.raises(FileNotFoundError):
-                mysgen.find_and_parse(item_type)
-            mock_glob.assert_called_once()
+            mysgen.find_and_parse(item_type)
+            assert getattr(mysgen, item_type) == {}
+            mock_find_sources.assert_called_once()
 
         else:
             mock_parse.return_value = (meta, None)
@@ -233,7 +305,7 @@ class TestUnitMySGEN:
                 else:
                     mock_post.assert_called_once()
 
-            mock_glob.assert_called_once()
+            mock_find_sources.assert_called_once()
 
     @pytest.mark.parametrize(
         "item_type, data",
@@ -261,21 +333,76 @@ class TestUnitMySGEN:
 
         if item_type == "posts":
             mysgen.posts = data
-            data["post"].process = MagicMock()
-            mysgen.process(item_type)
+            with patch.object(Post, "process") as mock_process:
+                mysgen.process(item_type)
             if data["post"].meta["status"] == "published":
-                data["post"].process.assert_called_once_with({}, "template")
+                mock_process.assert_called_once_with({}, "template")
         else:
             mysgen.pages = data
-            data["page"].process = MagicMock()
-            mysgen.process(item_type)
+            with patch.object(Page, "process") as mock_process:
+                mysgen.process(item_type)
             if data["page"].meta["status"] == "published":
-                data["page"].process.assert_called_once_with(
+                mock_process.assert_called_once_with(
                     {"pages": data, "articles": "posts_metadata", "all_posts": {}},
                     "template",
                 )
             mock_sorted.assert_called_once()
 
+    def test_unit_build_taxonomies(self):
+        """
+        Test MySGEN build_taxonomies method.
+        """
+        mysgen = MySGEN(CONFIG_FILE)
+        meta = [
+            Meta({"status": "published", "date": datetime(2022, 1, i), "tags": t})
+            for i, t in [(1, ["a", " b"]), (2, ["b", "b"]), (3, ["a"])]
+        ]
+        meta[0]["category"] = "c"
+        mysgen.posts = {str(i): Post(m, "", "src", "build") for i, m in enumerate(meta)}
+        mysgen.posts["draft"] = Post(Meta({"tags": ["d"]}), "", "src", "build")
+        mysgen.build_taxonomies()
+
+        assert mysgen.taxonomies["tags"].posts("a") == [meta[2], meta[0]]
+        assert mysgen.taxonomies["tags"].counts() == {"a": 2, "b": 2}
+        assert mysgen.taxonomies["categories"].counts() == {"c": 1}
+        assert mysgen.base["tags"] == ["a", "b"]
+        assert mysgen.base["categories"] == ["c"]
+        assert mysgen.base["taxonomies"] == mysgen.taxonomies
+
+    @patch("mysgen.sinks.isfile")
+    @patch("mysgen.mysgen.Item.abstract_process")
+    def test_unit_process_taxonomies(self, mock_process, mock_isfile):
+        """
+        Test MySGEN process_taxonomies method, unchanged pages are skipped.
+        """
+        mysgen = MySGEN(CONFIG_FILE)
+        mysgen.base = {
+            "src_path": "src",
+            "build_path": "build",
+            "taxonomy_templates": {"tags": "taxonomy"},
+            "paginate": {"tags": 2},
+        }
+        taxonomy = Taxonomy("tags")
+        for i in range(3):
+            taxonomy.add("A b", Meta({"path": Path("posts", str(i))}))
+        mysgen.taxonomies = {"tags": taxonomy}
+        mysgen.template = {"taxonomy": "template"}
+        mock_isfile.return_value = True
+
+        mysgen.process_taxonomies()
+        assert mock_process.call_count == 2
+        assert set(mysgen.cache.load("taxonomy_listings")["tags"]) == {
+            str(Path("tags/a-b")),
+            str(Path("tags/a-b/page/1")),
+        }
+
+        mysgen.process_taxonomies()
+        assert mock_process.call_count == 2
+
+        taxonomy.terms["A b"].insert(0, Meta({"path": Path("posts/3")}))
+        mysgen.process_taxonomies()
+        assert mock_process.call_count == 3
+
     @patch("mysgen.mysgen.makedirs")
     @patch("mysgen.mysgen.boto3.client")
     def test_unit_copy_s3(self, mock_client, mock_makedirs):
@@ -297,6 +424,29 @@ class TestUnitMySGEN:
         assert mock_makedirs.call_count == 2
         assert mock_client.return_value.download_file.call_count == 2
 
+    @patch("mysgen.mysgen.os.path.isfile", return_value=True)
+    @patch("mysgen.mysgen.makedirs")
+    @patch("mysgen.mysgen.boto3.client")
+    def test_unit_copy_s3_etag(self, mock_client, mock_makedirs, mock_isfile):
+        """
+        Test the copy s3 method skips files with an unchanged ETag.
+        """
+        mysgen = MySGEN()
+        mysgen.base["s3-bucket"] = "bucket"
+        mysgen.cache.load("s3")["1/2/3.file"] = '"a"'
+        mock_client.return_value.list_objects.return_value = {
+            "Contents": [
+                {"Key": "1/2/3.file", "ETag": '"a"'},
+                {"Key": "1/2/4.file", "ETag": '"b"'},
+            ]
+        }
+        mysgen.copy_s3()
+
+        mock_client.return_value.download_file.assert_called_once_with(
+            "bucket", "1/2/4.file", "1/2/4.file"
+        )
+        assert mysgen.cache.load("s3") == {"1/2/3.file": '"a"', "1/2/4.file": '"b"'}
+
     @patch.object(os, "listdir")
     @patch.object(MySGEN, "_parse")
     def test_unit_format_metadata(self, mock_parse_pages, mock_listdir):
@@ -327,33 +477,255 @@ class TestUnitMySGEN:
         assert meta_return == meta_answer
 
     @patch("builtins.open", mock_open(read_data=test_post))
-    @patch("mysgen.mysgen.markdown.Markdown")
+    @patch.object(StatIndex, "digest", return_value="digest")
+    @patch("mysgen.backends.markdown.Markdown")
     @patch("mysgen.mysgen.MySGEN._format_metadata")
-    def test_unit_parse(self, mock_format_metadata, mock_markdown):
+    def test_unit_parse(self, mock_format_metadata, mock_markdown, mock_digest):
         """
         Test the parse pages method.
         """
         mysgen = MySGEN(CONFIG_FILE)
-        mysgen.base = {"src_path": "tests/fixtures/"}
+        mysgen.base = {"src_path": "tests/fixtures/", "markdown_extensions": []}
         mysgen.markdown = mock_markdown
+        mock_markdown.Meta = {"title": ["title"]}
         meta, content = mysgen._parse(Path("tests/fixtures/content/posts/post.md"))
 
         assert meta == mock_format_metadata.return_value
         assert content == mock_markdown.convert.return_value
+        mock_format_metadata.assert_called_once_with({"title": ["title"]})
 
-    @patch("mysgen.mysgen.copy_tree")
-    def test_unit_copy_assets(self, mock_copy_tree):
+        meta, content = mysgen._parse(Path("tests/fixtures/content/posts/post.md"))
+        assert content == mock_markdown.convert.return_value
+        mock_markdown.convert.assert_called_once()
+
+    @patch("mysgen.sinks.FileSystemSink.copy_file")
+    def test_unit_copy_assets(self, mock_copy_file):
         """
         Unit test of MySGEN copy_assets method.
 
         Args:
-            mock_copy_tree: mock of copy_tree
+            mock_copy_file: mock of copy_file
         """
         mysgen = MySGEN("tests/fixtures/test_config.json")
         mysgen.set_base_config()
         mysgen.copy_assets()
 
-        assert mock_copy_tree.call_count == 2
+        assert mock_copy_file.call_count == 2
+
+
+class TestUnitMeta:
+    """
+    Unit tests of Meta class.
+    """
+
+    def test_unit_meta_init(self):
+        """
+        Unit test of Meta init method.
+        """
+        meta = Meta({"title": "title", "custom": "value"})
+
+        assert meta["title"] == "title"
+        assert meta.title == "title"
+        assert meta["custom"] == "value"
+        assert meta.extra == {"custom": "value"}
+        assert meta == {"title": "title", "custom": "value"}
+
+    def test_unit_meta_missing(self):
+        """
+        Unit test of Meta missing keys.
+        """
+        meta = Meta()
+
+        assert meta["date"] == ""
+        assert meta["unknown"] == ""
+        assert "date" not in meta
+        assert "unknown" not in meta
+        assert len(meta) == 0
+        assert meta.get("image", False) is False
+        assert meta.get("unknown") is None
+
+        meta["data"] = ""
+        assert meta.get("data", False) == ""
+        assert "data" in meta
+        del meta["data"]
+        assert "data" not in meta
+        with pytest.raises(KeyError):
+            del meta["data"]
+
+    def test_unit_meta_pickle(self):
+        """
+        Unit test of Meta pickling.
+        """
+        meta = Meta({"date": datetime(2022, 1, 1), "path": Path("posts/post")})
+        meta["custom"] = ["a"]
+
+        assert pickle.loads(pickle.dumps(meta)) == meta
+        assert not hasattr(meta, "__dict__")
+
+
+def test_unit_today(monkeypatch):
+    """
+    Unit test of today function, SOURCE_DATE_EPOCH sets the date.
+    """
+    monkeypatch.setenv("SOURCE_DATE_EPOCH", "86400")
+    assert today() == "1970-01-02"
+
+    monkeypatch.delenv("SOURCE_DATE_EPOCH")
+    assert today() == datetime.now().strftime("%Y-%m-%d")
+
+
+def test_unit_uses_variable():
+    """
+    Unit test of uses_variable function, through extended templates.
+    """
+    env = Environment(
+        loader=DictLoader(
+            {
+                "base.html": "{{ build_date }}{% block content %}{% endblock %}",
+                "page.html": '{% extends "base.html" %}',
+                "plain.html": "{% set build_date = 1 %}{{ build_date }}",
+            }
+        )
+    )
+
+    assert uses_variable(env, "page.html", "build_date")
+    assert not uses_variable(env, "plain.html", "build_date")
+
+
+def test_unit_fragment_url():
+    """
+    Unit test of fragment_url function.
+    """
+    assert fragment_url("") == "/fragment.html"
+    assert fragment_url("archive", "json") == "/archive/fragment.json"
+
+
+@pytest.mark.parametrize(
+    "count, per_page, expected",
+    [
+        (3, 0, [("tags", [2, 1, 0], "", "")]),
+        (2, 2, [("tags", [1, 0], "", "")]),
+        (
+            5,
+            2,
+            [
+                ("tags", [4], "", "/tags/page/2"),
+                ("tags/page/2", [3, 2], "/tags", "/tags/page/1"),
+                ("tags/page/1", [1, 0], "/tags/page/2", ""),
+            ],
+        ),
+    ],
+)
+def test_unit_paginate(count, per_page, expected):
+    """
+    Test paginate function, older pages keep their content.
+    """
+    articles = list(range(count))[::-1]
+    pages = paginate(Path("tags"), articles, per_page)
+
+    assert [
+        (path, chunk, paginator["newer"], paginator["older"])
+        for path, chunk, paginator in pages
+    ] == [(Path(p), c, n, o) for p, c, n, o in expected]
+    assert [paginator["number"] for _, _, paginator in pages] == list(
+        range(1, len(expected) + 1)
+    )
+    if len(pages) > 1:
+        assert paginate(Path(), articles, per_page, "_page")[1][0].parts[0] == "_page"
+
+
+def test_unit_slugify():
+    """
+    Test slugify function.
+    """
+    assert slugify(" Machine learning, AI ") == "machine-learning-ai"
+
+
+class TestUnitFragmentCache:
+    """
+    Unit tests of FragmentCache class.
+    """
+
+    def test_unit_fragment_cache_call(self):
+        """
+        Unit test of FragmentCache call method, fragments are rendered once.
+        """
+        env = MagicMock()
+        env.loader.get_source.return_value = ("source", None, None)
+        env.get_template.return_value.render.return_value = "html"
+        fragments = FragmentCache(env, {})
+        meta = Meta({"title": "a"})
+
+        assert fragments("kernel.html", article=meta) == "html"
+        assert fragments("kernel.html", article=Meta({"title": "a"})) == "html"
+        env.get_template.return_value.render.assert_called_once_with(article=meta)
+
+        fragments("kernel.html", article=Meta({"title": "b"}))
+        assert env.get_template.return_value.render.call_count == 2
+
+    def test_unit_fragment_cache_prune(self):
+        """
+        Unit test of FragmentCache prune method.
+        """
+        document = {"build": 100, "fragments": {"old": ["a", 1], "new": ["b", 100]}}
+        fragments = FragmentCache(MagicMock(), document)
+        fragments.prune()
+
+        assert document["build"] == 101
+        assert document["fragments"] == {"new": ["b", 100]}
+
+
+class TestUnitListingPage:
+    """
+    Unit tests of ListingPage class.
+    """
+
+    @patch("mysgen.mysgen.Item.abstract_process")
+    def test_unit_listing_page_process(self, mock_item_process):
+        """
+        Unit test of ListingPage process method.
+        """
+        meta = Meta(
+            {
+                "path": Path("tags/a"),
+                "type": "taxonomy",
+                "title": "a",
+                "name": "tags",
+                "articles": [Meta({"title": "article"})],
+                "paginator": {"number": 1},
+            }
+        )
+        base = {}
+        template = MagicMock()
+        page = ListingPage(meta, "", "src", "build")
+        page.process(base, template)
+
+        assert base["term"] == "a"
+        assert base["page_name"] == "tags"
+        assert base["articles"] == [{"title": "article"}]
+        assert base["paginator"] == {"number": 1}
+        mock_item_process.assert_called_once_with(base, template["taxonomy"])
+
+    def test_unit_listing_page_signature(self):
+        """
+        Unit test of ListingPage signature method.
+        """
+        article = Meta({"title": "a"})
+        meta = Meta({"path": Path("tags/a"), "articles": [article], "paginator": {}})
+        page = ListingPage(meta, "", "src", "build")
+        base = {"render_key": "key"}
+        signature = page.signature(base)
+
+        assert signature == page.signature(base)
+        assert signature != page.signature({"render_key": "other"})
+        article["title"] = "b"
+        assert signature != page.signature(base)
+        signature = page.signature(base)
+        base["menuitems"] = {"new": "new"}
+        assert signature != page.signature(base)
+        signature = page.signature(base)
+        base["pages"] = {"new.md": Page(Meta({"title": "New"}), "", "src", "build")}
+        assert signature != page.signature(base)
 
 
 class TestUnitItem:
@@ -374,29 +746,60 @@ class TestUnitItem:
         assert item.from_path == Path()
         assert item.to_path == Path()
 
-    @patch("builtins.open", mock_open(read_data=None))
-    @patch("mysgen.mysgen.makedirs")
-    def test_unit_item_abstract_process(self, mock_os_makedirs):
+    def test_unit_item_shared_paths(self):
+        """
+        Unit test of Item path interning and pickling.
+        """
+        item = Item(Meta({"status": "published"}), "content", "src", "build")
+        other = Item(Meta(), "content", Path("src"), Path("build"))
+
+        assert item.src_path is other.src_path
+        assert item.build_path is other.build_path
+        assert not hasattr(item, "__dict__")
+
+        unpickled = pickle.loads(pickle.dumps(item))
+        assert unpickled.meta == item.meta
+        assert unpickled.content == item.content
+        assert unpickled.src_path is item.src_path
+
+    @pytest.mark.parametrize("stream_render", [False, True])
+    def test_unit_item_abstract_process(self, stream_render):
         """
         Unit test of Item abstract_process method.
         """
-        mock_base = MagicMock()
+        sink = MemorySink("build")
+        mock_base = {"stream_render": stream_render, "sink": sink, "outputs": {}}
         mock_template = MagicMock()
-        item = Item(MagicMock(), MagicMock(), MagicMock(), MagicMock())
+        mock_template.generate.return_value = iter(["a", "b"])
+        mock_template.render.return_value = "ab"
+        item = Item(Meta({"path": Path("post")}), "", "src", "build")
         item.abstract_process(mock_base, mock_template)
 
-        mock_os_makedirs.assert_called_once()
+        assert sink.files == {"post/index.html": b"ab"}
+        assert list(mock_base["outputs"]) == ["post/index.html"]
+        if stream_render:
+            mock_template.render.assert_not_called()
+        else:
+            mock_template.generate.assert_not_called()
 
-    def test_unit_item_patch_content(self):
+    def test_unit_placeholders(self):
         """
-        Unit test of Item _patch_content method.
+        Unit test of Placeholders substitute method.
         """
-        item = Item({}, "patch_me", "src", "build")
-        item._patch_content("patch", "PATCHED")
+        placeholders = Placeholders(
+            {"{{post_url}}": "post_url", "{{post_url_x}}": "x", "": "empty"},
+            {"post": {"a": "/posts/a"}.get},
+        )
+        text, used = placeholders.substitute(
+            "{{post_url}}/{{post_url_x}} {{post:a}} {{post:b}} {{other}}",
+            {"post_url": "/url", "x": "X"},
+        )
 
-        assert item.content == "PATCHED_me"
+        assert text == "/url/X /posts/a {{post:b}} {{other}}"
+        assert used == {"post_url", "x", "post"}
+        assert Placeholders({}).substitute("text", {}) == ("text", set())
 
-    @patch("mysgen.mysgen.copy_tree")
+    @patch("mysgen.sinks.copy_tree")
     def test_unit_item_copy(self, mock_copy_tree):
         """
         Unit test of Item _copy method.
@@ -411,6 +814,35 @@ class TestUnitItem:
 
         mock_copy_tree.assert_called_once_with("from", "to")
 
+    def test_unit_item_copy_data(self, tmp_path):
+        """
+        Unit test of Item copy_data method with data previews.
+        """
+        (tmp_path / "src/data/post").mkdir(parents=True)
+        (tmp_path / "src/data/post/table.csv").write_text("a,b\n1,2\n3,4\n")
+        (tmp_path / "src/data/post/notes.txt").write_text("Some notes.\n")
+        post = DataPost(
+            Meta({"path": Path("posts/post")}), "", tmp_path / "src", Path("build")
+        )
+        sink = MemorySink()
+        post.copy_data({"sink": sink, "data_previews": True, "data_raw": False})
+
+        assert sorted(sink.files) == [
+            "build/posts/post/data/notes.txt",
+            "build/posts/post/data/table.csv.preview.json",
+        ]
+        assert post.meta["previews"] == {
+            "table.csv": {
+                "url": "/posts/post/data/table.csv.preview.json",
+                "rows": 2,
+                "columns": ["a", "b"],
+                "summary": {
+                    "a": {"count": 2, "min": 1.0, "max": 3.0, "mean": 2.0, "std": 1.0},
+                    "b": {"count": 2, "min": 2.0, "max": 4.0, "mean": 3.0, "std": 1.0},
+                },
+            }
+        }
+
 
 class TestUnitPost:
     """
@@ -440,10 +872,7 @@ class TestUnitPost:
         ],
     )
     @patch("mysgen.mysgen.Item.abstract_process")
-    @patch("mysgen.mysgen.Item._patch_content")
-    def test_unit_post_process(
-        self, mock_item_patch_content, mock_item_process, meta, content, base, template
-    ):
+    def test_unit_post_process(self, mock_item_process, meta, content, base, template):
         """
         Unit test of Post process method.
         """
@@ -454,7 +883,6 @@ class TestUnitPost:
         assert base["article_content"] == content
         assert base["page"] == base["home"]
         assert base["page_name"] == "index"
-        mock_item_patch_content.assert_called_once()
         mock_item_process.assert_called_once_with(base, template["article"])
 
     def test_unit_post_copy_raises(self):
@@ -488,94 +916,169 @@ class TestUnitImagePost:
         assert post.to_path == Path("build/posts/post/images")
 
     @pytest.mark.parametrize(
-        "isfile, mangle_image_name", [(True, False), (False, False), (True, True)]
+        "images, mangle_image_name",
+        [
+            (["image2.jpg", "image1.jpg"], False),
+            ([], False),
+            (["image2.jpg", "image1.jpg"], True),
+        ],
     )
-    @patch("mysgen.mysgen.shutil.move")
     @patch("mysgen.mysgen.ImagePost._resize_image")
-    @patch("mysgen.mysgen.isfile")
-    @patch("mysgen.mysgen.Path.glob")
-    @patch("mysgen.mysgen.Post.copy")
     @patch("mysgen.mysgen.Post.process")
     def test_unit_imagepost_process(
         self,
         mock_item_process,
-        mock_post_copy,
-        mock_glob,
-        mock_isfile,
         mock_resize_image,
-        mock_move,
-        isfile,
+        images,
         mangle_image_name,
+        tmp_path,
     ):
         """
         Unit test of ImagePost process method.
         """
-        mock_base = {"mangle_image_name": mangle_image_name, "thumbnail_size": 0}
+        sink = MemorySink(tmp_path / "build")
+        mock_base = {
+            "mangle_image_name": mangle_image_name,
+            "thumbnail_size": 0,
+            "sink": sink,
+        }
         mock_template = MagicMock()
         post = ImagePost(
-            {"path": Path("posts/post1.md")}, MagicMock(), MagicMock(), MagicMock()
+            Meta({"path": Path("posts/post1")}), "", tmp_path, tmp_path / "build"
         )
-        mock_glob.return_value = (
-            Path(g) for g in ["path/image2.jpg", "path/image1.jpg"]
-        )
-        mock_isfile.return_value = isfile
+        (tmp_path / "images" / "post1" / "raw").mkdir(parents=True)
+        (tmp_path / "images" / "post1" / "raw" / "file.txt").write_text("raw")
+        (tmp_path / "images" / "post1" / "README").write_text("readme")
+        for image in images:
+            (tmp_path / "images" / "post1" / image).write_text(image)
         post.process(mock_base, mock_template)
 
         assert post.meta["thumbnail_size"] == mock_base["thumbnail_size"]
         assert post.meta["thumbnails"] == []
-        assert mock_isfile.call_count == 2
-        mock_glob.assert_called_once()
-        mock_post_copy.assert_called_once()
-
-        if isfile:
-            assert mock_resize_image.call_count == 2
-            mock_item_process.assert_called_once_with(mock_base, mock_template)
-
-            if mangle_image_name:
-                assert post.meta["image_paths"] == [
-                    "0-"
-                    + hashlib.sha256(bytearray("image1", "utf-8")).hexdigest()[:7]
-                    + ".jpg",
-                    "1-"
-                    + hashlib.sha256(bytearray("image2", "utf-8")).hexdigest()[:7]
-                    + ".jpg",
-                ]
-            else:
-                assert post.meta["image_paths"] == ["image2.jpg", "image1.jpg"]
+        assert sink.files["posts/post1/images/raw/file.txt"] == b"raw"
+        assert sink.files["posts/post1/images/README"] == b"readme"
+        assert mock_resize_image.call_count == len(images)
+        mock_item_process.assert_called_once_with(mock_base, mock_template)
+
+        if mangle_image_name:
+            assert post.meta["image_paths"] == [
+                hashlib.sha256(bytearray(image, "utf-8")).hexdigest()[:10] + ".jpg"
+                for image in sorted(images)
+            ]
         else:
-            assert mock_resize_image.call_count == 0
-            assert post.meta["image_paths"] == []
-            mock_item_process.call_count == 0
+            assert post.meta["image_paths"] == sorted(images)
+
+        for name in post.meta["image_paths"]:
+            assert "posts/post1/images/" + name in sink.files
+
+    def test_unit_imagepost_prepare(self, tmp_path):
+        """
+        Unit test of ImagePost prepare method, filling the metadata only.
+        """
+        (tmp_path / "images" / "post1").mkdir(parents=True)
+        Image.new("RGB", (20, 20)).save(tmp_path / "images" / "post1" / "b.png")
+        Image.new("RGB", (5, 5)).save(tmp_path / "images" / "post1" / "a.png")
+        sink = MemorySink(tmp_path / "build")
+        base = {"mangle_image_name": False, "thumbnail_size": [10, 10], "sink": sink}
+        post = ImagePost(
+            Meta({"path": Path("posts/post1")}), "", tmp_path, tmp_path / "build"
+        )
+        post.prepare(base)
+
+        assert post.meta["image_paths"] == ["a.png", "b.png"]
+        assert post.meta["thumbnails"] == [Path("a.png"), Path("b_small.png")]
+        assert sink.files == {}
+
+        meta = Meta(post.meta)
+        with patch("mysgen.mysgen.Post.process"):
+            post.process(base, MagicMock())
+        assert post.meta == meta
+        assert sorted(sink.files) == [
+            "posts/post1/images/a.png",
+            "posts/post1/images/b.png",
+            "posts/post1/images/b_small.png",
+        ]
+
+    def test_unit_imagepost_process_raises(self, tmp_path):
+        """
+        Unit test of ImagePost process method when the images are missing.
+        """
+        post = ImagePost(Meta({"path": Path("posts/post1")}), "", tmp_path, "build")
+        with pytest.raises(DistutilsFileError):
+            post.process({"thumbnail_size": 0}, MagicMock())
 
     @pytest.mark.parametrize(
-        "path, image_size, thumbnail_size, thumbnails",
+        "image_size, thumbnail_size, thumbnails",
         [
-            (
-                Path("posts/path/images/image1.jpg"),
-                (400, 400),
-                [300, 300],
-                Path("image1_small.jpg"),
-            )
+            ((400, 400), [300, 300], [Path("image1_small.jpg")]),
+            ((200, 200), [300, 300], [Path("image1.jpg")]),
         ],
     )
-    @patch("mysgen.mysgen.Image.open")
     def test_unit_imagepost_resize_image(
         self,
-        mock_image,
-        path,
         image_size,
         thumbnail_size,
         thumbnails,
+        tmp_path,
     ):
         """
         Unit test of ImagePost _resize_image method.
         """
-        meta = {"path": path, "thumbnails": [], "thumbnail_size": thumbnail_size}
+        source = tmp_path / "image1.jpg"
+        Image.new("RGB", image_size).save(source)
+        sink = MemorySink()
+        meta = {"path": Path(), "thumbnails": [], "thumbnail_size": thumbnail_size}
         post = ImagePost(meta, MagicMock(), MagicMock(), MagicMock())
-        mock_image.return_value.__enter__.return_value.size = image_size
-        post._resize_image(path)
+        post._resize_image(source, Path("posts/path/images/image1.jpg"), sink)
 
-        assert post.meta["thumbnails"] == [thumbnails]
+        assert post.meta["thumbnails"] == thumbnails
+        if image_size[0] > thumbnail_size[0]:
+            thumbnail = BytesIO(sink.files["posts/path/images/image1_small.jpg"])
+            with Image.open(thumbnail) as img:
+                assert img.size == tuple(thumbnail_size)
+        else:
+            assert sink.files == {}
+
+    def test_unit_imagepost_resize_image_fingerprinted(self, tmp_path):
+        """
+        Unit test of ImagePost _resize_image method with fingerprinted thumbnails.
+        """
+        source = tmp_path / "image1.png"
+        Image.new("RGB", (20, 20)).save(source)
+        sink = MemorySink()
+        meta = {"path": Path(), "thumbnails": [], "thumbnail_size": [10, 10]}
+        post = ImagePost(meta, MagicMock(), MagicMock(), MagicMock())
+        post._resize_image(source, Path("images/image1.png"), sink, True)
+
+        (name,) = sink.files
+        digest = hashlib.sha256(sink.files[name]).hexdigest()
+        assert name == "images/image1_small." + digest[:10] + ".png"
+        assert post.meta["thumbnails"] == [Path(name).relative_to("images")]
+
+    def test_unit_imagepost_resize_image_derivatives(self, tmp_path):
+        """
+        Unit test of ImagePost _resize_image method with shared derivatives.
+        """
+        source = tmp_path / "image1.png"
+        Image.new("RGB", (20, 20)).save(source)
+        derivatives = {}
+        sinks = []
+        for _ in range(2):
+            sink = MemorySink()
+            meta = {"path": Path(), "thumbnails": [], "thumbnail_size": [10, 10]}
+            post = ImagePost(meta, MagicMock(), MagicMock(), MagicMock())
+            with patch.object(
+                ImagePost, "_thumbnail", wraps=post._thumbnail
+            ) as mock_thumbnail:
+                post._resize_image(
+                    source, Path("images/image1.png"), sink, False, derivatives
+                )
+            sinks.append(sink)
+
+        mock_thumbnail.assert_not_called()
+        assert len(derivatives) == 1
+        assert sinks[0].files == sinks[1].files
+        assert post.meta["thumbnails"] == [Path("image1_small.png")]
 
 
 class TestUnitDataPost:
@@ -597,7 +1100,7 @@ class TestUnitDataPost:
         assert post.from_path == Path("src/data/post")
         assert post.to_path == Path("build/posts/post/data")
 
-    @patch("mysgen.mysgen.DataPost.copy")
+    @patch("mysgen.mysgen.DataPost.copy_data")
     @patch("mysgen.mysgen.Post.process")
     def test_unit_datapost_process(self, mock_post_process, mock_datapost_copy_data):
         """
@@ -636,10 +1139,8 @@ class TestUnitPage:
         ],
     )
     @patch("mysgen.mysgen.Item.abstract_process")
-    @patch("mysgen.mysgen.Page._patch_content")
     def test_unit_page_process(
         self,
-        mock_page_patch_content,
         mock_item_process,
         path,
         expected_path,
@@ -656,18 +1157,34 @@ class TestUnitPage:
             "build_date_template": "build_date",
         }
         mock_template = MagicMock()
-        page = Page(mock_meta, MagicMock(), MagicMock(), MagicMock())
+        page = Page(mock_meta, "updated build_date", MagicMock(), MagicMock())
         page.process(mock_base, mock_template)
 
         assert page.meta["path"] == expected_path
         assert mock_base["page_name"] == expected_page_name
-        mock_page_patch_content.assert_called_once_with(
-            mock_base["build_date_template"], mock_date
-        )
         mock_item_process.assert_called_once_with(
             mock_base, mock_template[page.meta["type"]]
         )
 
+    @patch("mysgen.mysgen.ListingPage.process")
+    @patch("mysgen.mysgen.Item.abstract_process")
+    def test_unit_page_process_paginated(self, mock_item_process, mock_listing_process):
+        """
+        Unit test of Page process method with pagination.
+        """
+        mock_base = {
+            "home": "home",
+            "build_date": "2022-01-01",
+            "build_date_template": "build_date",
+            "paginate": {"archive": 2},
+            "articles": [Meta({"title": str(i)}) for i in range(5)],
+        }
+        page = Page(Meta({"path": Path("pages/archive")}), "", "src", "build")
+        page.process(mock_base, MagicMock())
+
+        mock_item_process.assert_not_called()
+        assert mock_listing_process.call_count == 3
+
 
 class TestUnitDataPage:
     """
@@ -688,7 +1205,7 @@ class TestUnitDataPage:
         assert page.from_path == Path("src/data/page")
         assert page.to_path == Path("build/page/data")
 
-    @patch("mysgen.mysgen.DataPage.copy")
+    @patch("mysgen.mysgen.DataPage.copy_data")
     @patch("mysgen.mysgen.Page.process")
     def test_unit_datapage_process(self, mock_page_process, mock_datapage_copy_data):
         """
@@ -701,3 +1218,1297 @@ class TestUnitDataPage:
 
         mock_page_process.assert_called_once_with(mock_base, mock_template)
         mock_datapage_copy_data.assert_called_once()
+
+
+class TestUnitSinks:
+    """
+    Unit tests of output sinks.
+    """
+
+    def test_unit_filesystem_sink_write(self, tmp_path):
+        """
+        Unit test of FileSystemSink write method, unchanged output is not written.
+        """
+        sink = FileSystemSink(tmp_path)
+        html_file = tmp_path / "post" / "index.html"
+        hashes = {}
+
+        assert sink.write(html_file, [b"a", b"b"])
+        assert html_file.read_text() == "ab"
+
+        assert sink.write(html_file, iter([b"a", b"b"]), hashes)
+        assert list(hashes) == ["post/index.html"]
+        os.utime(html_file, ns=(0, 0))
+        assert not sink.write(html_file, iter([b"a", b"b"]), hashes)
+        assert os.stat(html_file).st_mtime_ns == 0
+        assert os.listdir(tmp_path / "post") == ["index.html"]
+
+        assert sink.write(html_file, iter([b"a", b"c"]), hashes)
+        assert html_file.read_text() == "ac"
+        assert sink.exists(html_file)
+
+    def test_unit_memory_sink(self, tmp_path):
+        """
+        Unit test of MemorySink.
+        """
+        (tmp_path / "css").mkdir()
+        (tmp_path / "css" / "foo.css").write_text("css")
+        sink = MemorySink("build")
+
+        assert sink.write_bytes("build/index.html", b"html")
+        assert not sink.write_bytes("build/index.html", b"html")
+        assert sink.copy_tree(tmp_path / "css", "build/css") == [
+            str(Path("build/css/foo.css"))
+        ]
+        assert sink.files == {"index.html": b"html", "css/foo.css": b"css"}
+        assert sink.exists("build/css/foo.css")
+        with pytest.raises(DistutilsFileError):
+            sink.copy_tree(tmp_path / "js", "build/js")
+
+    @pytest.mark.parametrize("archive", ["site.zip", "site.tar.gz", "site.tar"])
+    def test_unit_archive_sink(self, archive, tmp_path):
+        """
+        Unit test of ArchiveSink.
+        """
+        sink = ArchiveSink(tmp_path / archive, "build")
+        hashes = {}
+        sink.write("build/index.html", iter([b"a", b"b"]), hashes)
+        sink.write_bytes("build/posts/post/index.html", b"post")
+
+        assert not sink.write_bytes("build/index.html", b"ab", hashes)
+        with pytest.raises(ValueError):
+            sink.write_bytes("build/index.html", b"other")
+        assert sink.exists("build/index.html")
+        assert not sink.exists("build/other.html")
+        assert list(hashes) == ["index.html"]
+        with pytest.raises(FileNotFoundError):
+            sink.read("build/other.html")
+        if archive.endswith(".tar.gz"):
+            with pytest.raises(NotImplementedError):
+                sink.read("build/index.html")
+        else:
+            assert sink.read("build/index.html") == b"ab"
+            assert sink.read("build/posts/post/index.html") == b"post"
+            sink.write_bytes("build/long/" + "a" * 120 + ".html", b"long" * 200)
+            assert sink.read("build/long/" + "a" * 120 + ".html") == b"long" * 200
+        sink.close()
+
+        if archive.endswith(".zip"):
+            with zipfile.ZipFile(tmp_path / archive) as file:
+                assert file.read("index.html") == b"ab"
+                assert file.read("posts/post/index.html") == b"post"
+                assert file.namelist().count("index.html") == 1
+        else:
+            with tarfile.open(tmp_path / archive) as file:
+                assert file.extractfile("index.html").read() == b"ab"
+                assert file.extractfile("posts/post/index.html").read() == b"post"
+                assert file.getnames().count("index.html") == 1
+
+
+class TestUnitPrecompressor:
+    """
+    Unit tests of Precompressor class.
+    """
+
+    def test_unit_compress(self):
+        """
+        Unit test of compress function.
+        """
+        data = b"<p>text</p>" * 100
+        variants = compress(data, ("gz", "br"))
+
+        assert gzip.decompress(variants["gz"]) == data
+        assert variants["gz"] == compress(data, ("gz",))["gz"]
+        assert set(variants) == {"gz", "br"}
+
+    def test_unit_precompressor(self):
+        """
+        Unit test of Precompressor, unchanged outputs are not compressed again.
+        """
+        sink = MemorySink("build")
+        hashes = {}
+        precompressor = Precompressor(sink, hashes, ["gz"], workers=2)
+        sink.write_bytes("build/index.html", b"html")
+        sink.write_bytes("build/image.png", b"png")
+        precompressor.finish()
+
+        assert set(sink.files) == {"index.html", "index.html.gz", "image.png"}
+        assert gzip.decompress(sink.files["index.html.gz"]) == b"html"
+        assert list(hashes) == ["index.html"]
+
+        with patch("mysgen.compress.compress") as mock_compress:
+            precompressor = Precompressor(sink, hashes, ["gz"])
+            sink.write_bytes("build/index.html", b"html")
+            assert precompressor.finish() == {"written": 0}
+            mock_compress.assert_not_called()
+
+            precompressor = Precompressor(sink, hashes, ["gz"])
+            mock_compress.return_value = {"gz": b"gz"}
+            sink.write_bytes("build/index.html", b"changed")
+            assert precompressor.finish() == {"written": 1}
+            assert sink.files["index.html.gz"] == b"gz"
+
+    def test_unit_precompressor_backpressure(self):
+        """
+        Unit test of Precompressor, writes wait while too many outputs are pending.
+        """
+        sink = MemorySink("build")
+        precompressor = Precompressor(sink, {}, ["gz"], workers=1, max_pending=2)
+        pending = []
+        for i in range(6):
+            sink.write_bytes("build/{i}/index.html".format(i=i), b"html" * 1000)
+            pending.append(len(precompressor.pending))
+
+        assert max(pending) <= 2
+        assert precompressor.finish() == {"written": 6}
+
+
+class TestUnitMinify:
+    """
+    Unit tests of minification.
+    """
+
+    def test_unit_minify_html(self):
+        """
+        Unit test of minify_html, pre and math blocks are kept.
+        """
+        html = (
+            "<div>\n    <!-- comment -->\n    <p>a   <b>b</b> c</p>\n"
+            "    <pre>  x\n     y</pre>\n"
+            '    <script type="math/tex">  a  b </script>\n'
+            "    <script>\n        f( 1 );\n    </script>\n"
+            "    <style> a { color : red ; } </style>\n</div>"
+        )
+
+        assert minify_html(html) == (
+            "<div>\n<p>a <b>b</b> c</p>\n<pre>  x\n     y</pre>\n"
+            '<script type="math/tex">  a  b </script>\n'
+            "<script>f(1);</script>\n"
+            "<style>a{color :red}</style>\n</div>\n"
+        )
+
+    def test_unit_minify_css(self):
+        """
+        Unit test of minify_css.
+        """
+        css = '/* c */ a > b , c {\n  content: "a  /* b */";\n}\n'
+        css += "/*! keep */\na :hover {}"
+
+        assert minify_css(css) == 'a>b,c{content:"a  /* b */"}/*! keep */ a :hover{}'
+
+    def test_unit_minify_js(self):
+        """
+        Unit test of minify_js, newlines are kept where they can end statements.
+        """
+        js = (
+            "// comment\nvar a = 1 ;\nfunction f ( x ) {\n"
+            "    return /b+\\//g.test( x ) ; // tail\n}\n"
+            "var t = `a\n    b`;\nvar d = a / 2;\na\n++b\n"
+        )
+
+        assert minify_js(js) == (
+            "var a=1;function f(x){return /b+\\//g.test(x);}\n"
+            "var t=`a\n    b`;var d=a / 2;a\n++b"
+        )
+
+    def test_unit_minify_js_slashes(self):
+        """
+        Unit test of minify_js, a slash only looks at the code just before it.
+        """
+        js = "var aN = b / c + d / e; // comment\n" * 1000
+        with patch(
+            "mysgen.minify._regex_allowed", return_value=False
+        ) as mock_regex_allowed:
+            minified = minify_js(js)
+
+        assert minified == "var aN=b / c + d / e;" * 1000
+        assert mock_regex_allowed.call_count == 2000
+        assert max(len(c.args[0]) for c in mock_regex_allowed.call_args_list) < 10
+
+    def test_unit_minifier(self):
+        """
+        Unit test of Minifier, results are cached as blobs and savings counted.
+        """
+        sink = MemorySink("build")
+        cache = {"stale": "x"}
+        blobs = {}
+        minifier = Minifier(sink, cache, ["css"], blobs)
+        sink.write_bytes("build/a.css", b"a {  color: red; }")
+        sink.write_bytes("build/a.html", b"<p>  a</p>")
+
+        assert sink.files == {"a.css": b"a{color:red}", "a.html": b"<p>  a</p>"}
+        assert minifier.finish() == {"css": {"in": 18, "out": 12}, "saved": 6}
+        assert list(cache) == list(blobs)
+        assert list(cache.values()) == [hashlib.sha256(b"a{color:red}").hexdigest()]
+        assert list(blobs.values()) == [b"a{color:red}"]
+        assert sink.filters == {}
+
+        minifier = Minifier(sink, cache, ["css"], blobs)
+        with patch.dict("mysgen.minify.MINIFIERS", css=MagicMock()) as minifiers:
+            sink.write_bytes("build/a.css", b"a {  color: red; }")
+            minifiers["css"].assert_not_called()
+        assert sink.files["a.css"] == b"a{color:red}"
+
+        blobs.clear()
+        minifier = Minifier(sink, cache, ["css"], blobs)
+        sink.write_bytes("build/a.css", b"a {  color: red; }")
+        assert sink.files["a.css"] == b"a{color:red}"
+        assert list(blobs.values()) == [b"a{color:red}"]
+
+
+class TestUnitAssets:
+    """
+    Unit tests of Assets class.
+    """
+
+    def test_unit_fingerprint(self):
+        """
+        Unit test of fingerprint function.
+        """
+        digest = "0123456789abcdef"
+        assert fingerprint("css/foo.css", digest) == "css/foo.0123456789.css"
+
+    def test_unit_assets(self, tmp_path):
+        """
+        Unit test of Assets, only changed assets get new names.
+        """
+        (tmp_path / "css").mkdir()
+        (tmp_path / "js").mkdir()
+        (tmp_path / "css" / "a.css").write_text("a{}")
+        (tmp_path / "js" / "b.js").write_text("b()")
+        assets = Assets(tmp_path, "build", fingerprint=True)
+        sink = MemorySink("build")
+        assets.copy(sink)
+
+        css = assets.url("css/a.css")
+        js = assets.url("js/b.js")
+        assert css.startswith("/css/a.") and css.endswith(".css")
+        assert assets.url("/img/c.png") == "/img/c.png"
+        assert set(sink.files) == {css[1:], js[1:], "manifest.json"}
+        assert json.loads(sink.files["manifest.json"]) == assets.manifest
+
+        (tmp_path / "css" / "a.css").write_text("a{color:red}")
+        assets.scan()
+        assert assets.url("css/a.css") != css
+        assert assets.url("js/b.js") == js
+
+        assert Assets(tmp_path, "build").url("css/a.css") == "/css/a.css"
+
+
+class TestUnitSearchIndex:
+    """
+    Unit tests of the search index.
+    """
+
+    def test_unit_tokenize(self):
+        """
+        Unit test of tokenize function.
+        """
+        assert tokenize("<p class='x'>Hello a hello, Wörld</p>") == {
+            "hello": 2,
+            "wörld": 1,
+        }
+
+    def test_unit_shard_name(self):
+        """
+        Unit test of shard_name function.
+        """
+        assert shard_name("hello") == "he"
+        assert shard_name("wörld") == "_77c3b6"
+        assert shard_name("hello", 3) == "hel"
+
+    def test_unit_search_index(self):
+        """
+        Unit test of SearchIndex, only shards of changed posts are rewritten.
+        """
+        cache = {}
+        sink = MemorySink("build")
+        documents = [
+            ("a", "1", {"title": "A", "url": "/a", "date": "", "text": "alpha beta"}),
+            ("b", "1", {"title": "B", "url": "/b", "date": "", "text": "beta gamma"}),
+        ]
+        index = SearchIndex(cache, docs_per_shard=1)
+        index.update(documents)
+
+        assert index.write(sink, "build") == 6
+        assert json.loads(sink.files["search/index/be.json"]) == {
+            "beta": [[0, 1], [1, 1]]
+        }
+        assert json.loads(sink.files["search/docs/1.json"]) == {"1": ["B", "/b", ""]}
+        assert "search/search.js" in sink.files
+
+        index = SearchIndex(cache, docs_per_shard=1)
+        document = {"title": "B", "url": "/b", "date": "", "text": "beat"}
+        documents[1] = ("b", "2", document)
+        index.update(documents)
+        with patch.object(sink, "write_bytes", wraps=sink.write_bytes) as write:
+            assert index.write(sink, "build") == 3
+        assert sorted(call.args[0].name for call in write.call_args_list) == [
+            "1.json",
+            "be.json",
+            "ga.json",
+        ]
+        assert json.loads(sink.files["search/index/be.json"]) == {
+            "beat": [[1, 1]],
+            "beta": [[0, 1]],
+        }
+
+        index = SearchIndex(cache, docs_per_shard=1)
+        index.update(documents[:1])
+        index.write(sink, "build")
+        assert json.loads(sink.files["search/docs/1.json"]) == {}
+        assert json.loads(sink.files["search/index/be.json"]) == {"beta": [[0, 1]]}
+
+
+class TestUnitRelatedPosts:
+    """
+    Unit tests of related posts.
+    """
+
+    def test_unit_features(self):
+        """
+        Unit test of features function.
+        """
+        assert features("Alpha alpha", ["Tag ", ""], "cat") == {
+            "alpha": 2,
+            "#tag": 3,
+            "@cat": 3,
+        }
+
+    def test_unit_top_k(self):
+        """
+        Unit test of vectorize and top_k functions.
+        """
+        matrix = vectorize([{"a": 1, "b": 1}, {"a": 1}, {"b": 1, "c": 2}, {"d": 1}])
+
+        assert matrix.shape == (4, 4)
+        assert abs(matrix.multiply(matrix).sum(axis=1)).max() == pytest.approx(1)
+        related = top_k(matrix, [0, 1, 3], 2, chunk_size=2)
+        assert [[i for i, _ in row] for row in related] == [[1, 2], [0], []]
+
+    def test_unit_related_posts(self):
+        """
+        Unit test of RelatedPosts, only changed posts are tokenised again.
+        """
+        cache = {}
+        documents = [
+            ("a", "1", "alpha beta", ["x"], ""),
+            ("b", "1", "alpha gamma", ["x"], ""),
+            ("c", "1", "delta", [], ""),
+        ]
+        related = RelatedPosts(cache, 1).update(documents)
+
+        assert [other for other, _ in related["a"]] == ["b"]
+        assert related["c"] == []
+
+        documents[2] = ("c", "2", "alpha beta delta", ["x"], "")
+        with patch("mysgen.related.features", wraps=features) as mock_features:
+            related = RelatedPosts(cache, 1).update(documents)
+        mock_features.assert_called_once_with("alpha beta delta", ["x"], "")
+        assert [other for other, _ in related["a"]] == ["c"]
+        assert [other for other, _ in related["c"]] == ["a"]
+
+        related = RelatedPosts(cache, 1).update(documents[:2])
+        assert [other for other, _ in related["a"]] == ["b"]
+        assert set(cache["posts"]) == {"a", "b"}
+
+    def test_unit_related_posts_history(self):
+        """
+        Unit test of RelatedPosts, warm results equal a cold computation.
+        """
+        words = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta"]
+        documents = [
+            (
+                str(i),
+                "1",
+                " ".join(words[(i * j) % len(words)] for j in range(1, 2 + i % 5)),
+                [words[i % 3]],
+                "",
+            )
+            for i in range(35)
+        ]
+        cache = {}
+        RelatedPosts(cache, 3).update(documents[:30])
+        documents[3] = ("3", "2", "alpha zeta zeta", ["beta"], "")
+        documents[4] = ("4", "2", documents[4][2] + " " + documents[4][2], [], "")
+        for count in [35, 34]:
+            related = RelatedPosts(cache, 3).update(documents[:count])
+            assert related == RelatedPosts({}, 3).update(documents[:count])
+
+        text, tags = documents[5][2], documents[5][3]
+        documents[5] = ("5", "2", text + " " + text, tags, "")
+        with patch("mysgen.related.top_k", wraps=top_k) as mock_top_k:
+            related = RelatedPosts(cache, 3).update(documents[:34])
+        assert len(mock_top_k.call_args.args[1]) < 34
+        assert related == RelatedPosts({}, 3).update(documents[:34])
+
+
+class TestUnitFeeds:
+    """
+    Unit tests of feeds and sitemaps.
+    """
+
+    entry = {
+        "title": "A & B",
+        "link": "https://site/posts/a",
+        "date": datetime(2021, 1, 2),
+        "content": "<p>text</p>",
+    }
+
+    def test_unit_atom_entry(self):
+        """
+        Unit test of atom_entry function.
+        """
+        assert atom_entry(self.entry) == (
+            '<entry><title>A &amp; B</title><link href="https://site/posts/a"/>'
+            "<id>https://site/posts/a</id><updated>2021-01-02T00:00:00Z</updated>"
+            '<content type="html">&lt;p&gt;text&lt;/p&gt;</content></entry>\n'
+        )
+
+    def test_unit_rss_item(self):
+        """
+        Unit test of rss_item function.
+        """
+        assert "<pubDate>Sat, 02 Jan 2021 00:00:00 +0000</pubDate>" in rss_item(
+            self.entry
+        )
+
+    def test_unit_feeds(self):
+        """
+        Unit test of Feeds, entries are cached and pruned.
+        """
+        cache = {"stale": ""}
+        sink = MemorySink("build")
+        base = {"siteurl": "https://site/", "sitename": "Site"}
+        entry = {k: v for k, v in self.entry.items() if k != "link"}
+        feeds = Feeds(cache, base)
+        feeds.write(sink, "build", [("/posts/a", entry)] * 3, ["atom", "rss"], 2)
+        feeds.prune()
+
+        assert set(sink.files) == {"feed.xml", "rss.xml"}
+        assert sink.files["feed.xml"].count(b"<entry>") == 2
+        assert b"<author><name>Site</name></author>" in sink.files["feed.xml"]
+        assert len(cache) == 2
+
+        with patch.dict("mysgen.feeds.ENTRIES", atom=MagicMock()) as entries:
+            Feeds(cache, base).write(sink, "build", [("/posts/a", entry)], ["atom"])
+            entries["atom"].assert_not_called()
+
+        Feeds({}, {**base, "author": "A & B"}).write(sink, "build", [], ["atom"])
+        assert b"<author><name>A &amp; B</name></author>" in sink.files["feed.xml"]
+
+    def test_unit_sitemap(self):
+        """
+        Unit test of Sitemap, lastmod changes with content and shards at the limit.
+        """
+        cache = {}
+        sink = MemorySink("build")
+        sitemap = Sitemap(sink, cache, "https://site", "2021-01-01", limit=2)
+        for page in ["index.html", "a/index.html", "b/index.html"]:
+            sink.write_bytes("build/" + page, page.encode("utf-8"))
+        sink.write_bytes("build/a/fragment.html", b"")
+
+        assert sitemap.finish() == 3
+        assert set(sink.files) >= {"sitemap.xml", "sitemap-1.xml", "sitemap-2.xml"}
+        assert b"<sitemapindex" in sink.files["sitemap.xml"]
+        assert b"<loc>https://site/b</loc>" in sink.files["sitemap-2.xml"]
+
+        sitemap = Sitemap(sink, cache, "https://site", "2021-02-01")
+        sink.write_bytes("build/index.html", b"index.html")
+        sink.write_bytes("build/a/index.html", b"changed")
+        assert sitemap.finish() == 1
+        assert cache == {
+            "/": [hashlib.sha256(b"index.html").hexdigest(), "2021-01-01"],
+            "/a": [hashlib.sha256(b"changed").hexdigest(), "2021-02-01"],
+        }
+        assert sitemap.add not in sink.listeners
+
+
+class TestUnitBlockCache:
+    """
+    Unit tests of the block cache.
+    """
+
+    extensions = ["meta", "fenced_code", "mdx_math"]
+    source = (
+        "Title: post\n\n"
+        "Text with $x$.\n\n"
+        "```python\nprint('a')\n```\n\n"
+        "$$\na = b\n$$\n\n"
+        "- item\n\n    ~~~\n    indented\n    ~~~\n\n"
+        "~~~\nplain\n~~~\n"
+    )
+
+    def markdown(self):
+        """
+        Markdown converter with the test extensions.
+
+        Returns:
+            markdown converter
+        """
+        return markdown.Markdown(extensions=self.extensions)
+
+    def test_unit_block_cache_convert(self):
+        """
+        Unit test of BlockCache convert, same HTML and meta as a plain conversion.
+        """
+        plain = self.markdown()
+        expected = plain.convert(self.source)
+        converter = self.markdown()
+        blocks = BlockCache({}, self.extensions)
+
+        assert blocks.convert(converter, self.source) == expected
+        assert converter.Meta == plain.Meta
+        assert blocks.rendered == 3
+
+    def test_unit_block_cache_reuse(self):
+        """
+        Unit test of BlockCache, blocks are rendered once across posts and builds.
+        """
+        cache = {}
+        converter = self.markdown()
+        blocks = BlockCache(cache, self.extensions)
+        blocks.convert(converter, self.source)
+        blocks.convert(converter, "Other post.\n\n```python\nprint('a')\n```\n")
+        assert blocks.rendered == 3
+
+        blocks = BlockCache(cache, self.extensions)
+        with patch.object(converter, "convert", wraps=converter.convert) as convert:
+            blocks.convert(converter, self.source)
+        assert blocks.rendered == 0
+        convert.assert_called_once()
+        assert cache["build"] == 2
+
+        blocks = BlockCache(cache, ["fenced_code"])
+        blocks.convert(self.markdown(), "```\ncode\n```\n")
+        assert blocks.rendered == 1
+
+    def test_unit_block_cache_prune(self):
+        """
+        Unit test of BlockCache prune, keeps the most recently used blocks.
+        """
+        cache = {}
+        converter = self.markdown()
+        BlockCache(cache, self.extensions).convert(converter, self.source)
+        blocks = BlockCache(cache, self.extensions, size=1)
+        blocks.convert(converter, "```\nnew\n```\n")
+        blocks.prune()
+
+        assert len(cache["blocks"]) == 1
+        assert list(cache["blocks"].values())[0][1] == 2
+
+
+class TestUnitBackends:
+    """
+    Unit tests of Markdown backends.
+    """
+
+    extensions = ["meta", "fenced_code", "mdx_math"]
+    source = (
+        "Title: post\nTags: a,b\n    c\n\n"
+        "Text \\(x<y\\) and \\\\(no\\\\).\n\n"
+        "```python\nprint('<a>')\n```\n\n"
+        "$$\na = b\n$$\n\n"
+        "\\[ c \\]\n\n"
+        "`$$code$$`\n"
+    )
+
+    def test_unit_split_meta(self):
+        """
+        Unit test of split_meta function.
+        """
+        meta, body = split_meta("---\nTitle: a\nTags: b\n    c\n---\ntext\n")
+        assert meta == {"title": ["a"], "tags": ["b", "c"]}
+        assert body == "text\n"
+
+        assert split_meta("text\nTitle: a\n") == ({}, "text\nTitle: a\n")
+
+    def test_unit_markdown_it_converter(self):
+        """
+        Unit test of MarkdownItConverter, same HTML and meta as Python-Markdown.
+        """
+        plain = converter("markdown", self.extensions)
+        md = converter("markdown-it", self.extensions)
+        assert isinstance(md, MarkdownItConverter)
+
+        html = md.convert(self.source)
+        assert html.replace("<p><script", "<p>\n<script").replace(
+            "</script></p>", "</script>\n</p>"
+        ) == plain.convert(self.source)
+        assert md.Meta == plain.Meta
+        assert md.reset().Meta == {}
+
+        html = converter("markdown-it", ["meta"]).convert(self.source)
+        assert "<pre>" not in html
+        assert "<script" not in html
+
+    def test_unit_converter_errors(self):
+        """
+        Unit test of converter function errors.
+        """
+        with pytest.raises(NotImplementedError):
+            converter("unknown", [])
+
+        with pytest.raises(NotImplementedError):
+            converter("markdown-it", ["unknown"])
+
+    def test_unit_compare(self, tmp_path):
+        """
+        Unit test of compare function, only differing files are reported.
+        """
+        same = tmp_path / "same.md"
+        same.write_text(self.source)
+        different = tmp_path / "different.md"
+        different.write_text("Text\n- item\n")
+
+        diffs = compare([same, different], self.extensions, ("markdown", "markdown-it"))
+
+        assert list(diffs) == [different.as_posix()]
+        assert "+<ul>" in diffs[different.as_posix()]
+
+
+class TestUnitShards:
+    """
+    Unit tests of sharded builds.
+    """
+
+    def test_unit_shard_of(self):
+        """
+        Unit test of shard_of function, stable and spread over all shards.
+        """
+        keys = ["posts/post{i}.md".format(i=i) for i in range(100)]
+        shards = [shard_of(key, 4) for key in keys]
+
+        assert shards == [shard_of(key, 4) for key in keys]
+        assert set(shards) == {0, 1, 2, 3}
+
+    def test_unit_shard_path(self):
+        """
+        Unit test of shard_path function.
+        """
+        assert shard_path("site/output", 1, 4) == Path("site/output-shard-1-of-4")
+
+    def test_unit_manifests_and_merge(self, tmp_path):
+        """
+        Unit test of write_manifest, read_manifests and merge functions.
+        """
+        build_path = tmp_path / "output"
+        for index in range(2):
+            path = shard_path(build_path, index, 2)
+            (path / str(index)).mkdir(parents=True)
+            (path / str(index) / "index.html").write_text(str(index))
+            assert write_manifest(path, index, 2, "2021-01-01", "state") == 1
+
+        manifests = read_manifests(build_path, 2)
+        sink = MemorySink(build_path)
+        cache = {}
+        assert merge(sink, build_path, manifests, cache) == 2
+        assert sink.files == {"0/index.html": b"0", "1/index.html": b"1"}
+
+        listener = MagicMock()
+        sink.listeners.append(listener)
+        assert merge(sink, build_path, manifests, cache) == 0
+        assert listener.call_count == 2
+
+        with pytest.raises(FileNotFoundError):
+            read_manifests(build_path, 3)
+
+        path = shard_path(build_path, 1, 2)
+        (path / "0").mkdir()
+        (path / "0" / "index.html").write_text("0")
+        write_manifest(path, 1, 2, "2021-01-01", "state")
+        with pytest.raises(ValueError, match="written by shards 0 and 1"):
+            read_manifests(build_path, 2)
+
+        write_manifest(path, 1, 2, "2021-01-01", "other")
+        with pytest.raises(ValueError, match="different content"):
+            read_manifests(build_path, 2)
+
+    def test_unit_mysgen_global_state(self):
+        """
+        Unit test of MySGEN _global_state method, loading one content at a time.
+        """
+        mysgen = MySGEN(CONFIG_FILE)
+        mysgen.base = {"render_key": "key", "menuitems": {}}
+        loaders = {name: MagicMock(return_value=name) for name in ["a.md", "b.md"]}
+        mysgen.posts = {
+            name: Post(Meta({"title": name}), loader, Path("src"), Path("build"))
+            for name, loader in loaders.items()
+        }
+        state = mysgen._global_state()
+
+        assert state == mysgen._global_state()
+        assert all(loader.call_count == 2 for loader in loaders.values())
+
+        loaders["b.md"].return_value = "changed"
+        assert mysgen._global_state() != state
+
+    def test_unit_mysgen_shard(self):
+        """
+        Unit test of MySGEN sharded configuration.
+        """
+        mysgen = MySGEN("tests/fixtures/test_config.json")
+        mysgen.shard = (1, 2)
+        mysgen.set_base_config()
+        assert mysgen.base["build_path"].endswith("output-shard-1-of-2")
+        assert mysgen._in_shard("posts/post.md") == (shard_of("posts/post.md", 2) == 1)
+
+        mysgen = MySGEN("tests/fixtures/test_config.json")
+        mysgen.shard = (2, 2)
+        with pytest.raises(ValueError):
+            mysgen.set_base_config()
+
+        mysgen = MySGEN("tests/fixtures/test_config.json", MemorySink())
+        mysgen.shard = (0, 2)
+        with pytest.raises(NotImplementedError):
+            mysgen.set_base_config()
+
+
+class TestUnitSharedCaches:
+    """
+    Unit tests of caches shared between sites.
+    """
+
+    def test_unit_shared_templates(self):
+        """
+        Unit test of the shared bytecode cache, a template compiles once.
+        """
+        shared = SharedCaches()
+        loader = DictLoader({"page.html": "{{ title }}"})
+        outputs = []
+        for title in ["a", "b"]:
+            env = Environment(loader=loader, bytecode_cache=shared.templates)
+            with patch.object(env, "compile", wraps=env.compile) as mock_compile:
+                outputs.append(env.get_template("page.html").render(title=title))
+
+        assert outputs == ["a", "b"]
+        mock_compile.assert_not_called()
+        assert shared.stats()["templates"] == {"entries": 1, "hits": 1}
+
+
+class TestUnitCache:
+    """
+    Unit tests of the build cache.
+    """
+
+    def fill(self, path):
+        """
+        A cache with a document, a thumbnail and a compiled template.
+        """
+        cache = Cache(path)
+        cache.load("parsed")["post.md"] = ["key", "<p>a</p>"]
+        cache.blobs()["ab12"] = b"thumbnail"
+        cache.blobs()["cd34"] = None
+        env = Environment(
+            loader=DictLoader({"page.html": "{{ title }}"}),
+            bytecode_cache=cache.templates(),
+        )
+        env.get_template("page.html")
+        cache.save()
+        return cache
+
+    def test_unit_cache_memory(self):
+        """
+        Unit test of an in-memory cache, without binary entries.
+        """
+        cache = Cache()
+        cache.load("a")["b"] = 1
+        cache.save()
+
+        assert cache.load("a") == {"b": 1}
+        assert cache.blobs() is None
+        assert cache.templates() is None
+        for command in [cache.gc, lambda: cache.export_archive("cache.tar.gz")]:
+            with pytest.raises(ValueError, match="disabled"):
+                command()
+        with pytest.raises(ValueError, match="disabled"):
+            cache.import_archive("cache.tar.gz")
+
+    def test_unit_cache_blobs(self, tmp_path):
+        """
+        Unit test of binary cache entries.
+        """
+        cache = self.fill(tmp_path / "cache")
+        blobs = Cache(tmp_path / "cache").blobs()
+
+        assert blobs["ab12"] == b"thumbnail"
+        assert blobs["cd34"] is None
+        assert "ef56" not in blobs
+        assert set(blobs) == {"ab12", "cd34"}
+        assert (tmp_path / "cache/blobs/ab/ab12").is_file()
+        with pytest.raises(KeyError):
+            blobs["ef56"]
+        del blobs["cd34"]
+        assert len(blobs) == 1
+        assert cache.load("references")["blobs"] == ["ab12", "cd34"]
+
+    def test_unit_cache_templates(self, tmp_path):
+        """
+        Unit test of the directory bytecode cache, a template compiles once.
+        """
+        self.fill(tmp_path / "cache")
+        cache = Cache(tmp_path / "cache")
+        env = Environment(
+            loader=DictLoader({"page.html": "{{ title }}"}),
+            bytecode_cache=cache.templates(),
+        )
+        with patch.object(env, "compile", wraps=env.compile) as mock_compile:
+            assert env.get_template("page.html").render(title="a") == "a"
+
+        mock_compile.assert_not_called()
+        assert len(cache.used["templates"]) == 1
+
+    def test_unit_cache_gc(self, tmp_path):
+        """
+        Unit test of the garbage collection of unreferenced entries.
+        """
+        self.fill(tmp_path / "cache")
+        cache = Cache(tmp_path / "cache")
+        cache.blobs()["ab12"]
+        cache.save()
+        (tmp_path / "cache/stray.json.tmp").write_text("{")
+
+        assert cache.gc() == 3
+        assert set(Cache(tmp_path / "cache").files()) == {
+            "parsed.json",
+            "references.json",
+            "blobs/ab/ab12",
+        }
+
+    def test_unit_cache_export_import(self, tmp_path):
+        """
+        Unit test of a cache export and import round trip.
+        """
+        self.fill(tmp_path / "cache")
+        cache = Cache(tmp_path / "cache")
+        (tmp_path / "cache/blobs/ff").mkdir()
+        (tmp_path / "cache/blobs/ff/ff00").write_bytes(b"garbage")
+
+        assert cache.export_archive(tmp_path / "cache.tar.gz") == 5
+        with tarfile.open(tmp_path / "cache.tar.gz") as tar:
+            names = tar.getnames()
+            manifest = json.load(tar.extractfile("cache.json"))
+        assert names[0] == "cache.json"
+        assert "blobs/ff/ff00" not in names
+        assert manifest["format"] == 1
+        assert set(manifest["files"]) == set(names[1:])
+
+        imported = Cache(tmp_path / "new")
+        (tmp_path / "new").mkdir()
+        (tmp_path / "new/old.json").write_text("{}")
+        assert imported.import_archive(tmp_path / "cache.tar.gz") == 5
+        assert imported.load("parsed") == {"post.md": ["key", "<p>a</p>"]}
+        assert imported.blobs()["ab12"] == b"thumbnail"
+        assert not (tmp_path / "new/old.json").exists()
+        assert [p.name for p in tmp_path.iterdir() if p.name.startswith("new")] == [
+            "new"
+        ]
+
+    def test_unit_cache_import_python(self, tmp_path):
+        """
+        Unit test of an import from another Python version, templates are skipped.
+        """
+        self.fill(tmp_path / "cache")
+        Cache(tmp_path / "cache").export_archive(tmp_path / "cache.tar.gz")
+
+        with patch("mysgen.cache.sys.version_info", (2, 7)):
+            Cache(tmp_path / "new").import_archive(tmp_path / "cache.tar.gz")
+
+        assert not (tmp_path / "new/templates").exists()
+        assert (tmp_path / "new/blobs/ab/ab12").is_file()
+
+    def test_unit_cache_import_invalid(self, tmp_path):
+        """
+        Unit test of invalid cache archives, the cache is left unchanged.
+        """
+        self.fill(tmp_path / "cache")
+        archive = tmp_path / "cache.tar.gz"
+
+        def write(manifest, members):
+            with tarfile.open(archive, "w:gz") as tar:
+                for name, data in [("cache.json", json.dumps(manifest).encode())] + (
+                    members
+                ):
+                    info = tarfile.TarInfo(name)
+                    info.size = len(data)
+                    tar.addfile(info, BytesIO(data))
+
+        digest = hashlib.sha256(b"{}").hexdigest()
+        for manifest, members in [
+            ({"format": 0, "files": {}}, []),
+            ({"format": 1, "files": {"a.json": digest}}, [("a.json", b"{ }")]),
+            ({"format": 1, "files": {"../a.json": digest}}, [("../a.json", b"{}")]),
+            ({"format": 1, "files": {}}, [("a.json", b"{}")]),
+            ({"format": 1, "files": {"a.json": digest}}, []),
+        ]:
+            write(manifest, members)
+            with pytest.raises(ValueError):
+                Cache(tmp_path / "cache").import_archive(archive)
+
+        with tarfile.open(archive, "w:gz") as tar:
+            tar.add(tmp_path / "cache/parsed.json", "parsed.json")
+        with pytest.raises(ValueError):
+            Cache(tmp_path / "cache").import_archive(archive)
+
+        assert Cache(tmp_path / "cache").load("parsed") == {
+            "post.md": ["key", "<p>a</p>"]
+        }
+
+    def test_unit_cache_main(self, tmp_path):
+        """
+        Unit test of the cache commands.
+        """
+        self.fill(tmp_path / "cache")
+        archive = str(tmp_path / "cache.tar.gz")
+        cache_main(["export", str(tmp_path / "cache"), archive])
+        cache_main(["import", str(tmp_path / "new"), archive])
+        cache_main(["gc", str(tmp_path / "new")])
+
+        assert Cache(tmp_path / "new").load("parsed") == {
+            "post.md": ["key", "<p>a</p>"]
+        }
+
+
+class TestUnitSchedule:
+    """
+    Unit tests of the priority scheduling of items.
+    """
+
+    def items(self, dates, status="published"):
+        """
+        Items with the given dates.
+        """
+        return {
+            name: Post(
+                Meta({"date": date, "status": status, "path": Path(name)}),
+                "",
+                Path("src"),
+                Path("build"),
+            )
+            for name, date in dates.items()
+        }
+
+    def test_unit_critical_items(self):
+        """
+        Unit test of the critical items, home and menu pages and newest posts.
+        """
+        posts = self.items(
+            {
+                "a.md": datetime(2021, 1, 1),
+                "b.md": datetime(2021, 1, 3),
+                "c.md": datetime(2021, 1, 2),
+                "d.md": "",
+            }
+        )
+        posts.update(self.items({"e.md": datetime(2022, 1, 1)}, "draft"))
+        pages = self.items({"home.md": "", "archive.md": "", "other.md": ""})
+
+        assert critical_items(posts, pages, "home", ["archive"], 2) == {
+            "posts": ["b.md", "c.md"],
+            "pages": ["home.md", "archive.md"],
+        }
+        assert critical_items(posts, pages, "home", [], 10)["posts"] == [
+            "b.md",
+            "c.md",
+            "a.md",
+            "d.md",
+        ]
+
+    @patch.object(MySGEN, "copy_assets")
+    @patch.object(MySGEN, "process")
+    def test_unit_process_scheduled(self, mock_process, mock_copy_assets):
+        """
+        Unit test of processing the critical items first and publishing them.
+        """
+        mysgen = MySGEN(CONFIG_FILE, MemorySink("build"))
+        mysgen.base = {
+            "home": "home",
+            "menuitems": {"home": ""},
+            "priority_posts": True,
+        }
+        mysgen.posts = self.items({"a.md": datetime(2021, 1, 1)})
+        mysgen.pages = self.items({"home.md": "", "other.md": ""})
+        mock_process.side_effect = lambda item_type, names: [
+            mysgen.sink.write_bytes(Path("build", name, "index.html"), b"")
+            for name in names
+        ]
+        published = []
+
+        assert mysgen.process_scheduled(published.extend) == [
+            "a.md/index.html",
+            "home.md/index.html",
+        ]
+        assert published == ["a.md/index.html", "home.md/index.html"]
+        assert [c.args for c in mock_process.call_args_list] == [
+            ("posts", ["a.md"]),
+            ("pages", ["home.md"]),
+            ("posts", []),
+            ("pages", ["other.md"]),
+        ]
+        mock_copy_assets.assert_called_once()
+
+
+class TestUnitContentStore:
+    """
+    Unit tests of streamed content.
+    """
+
+    def test_unit_content_store(self, tmp_path):
+        """
+        Unit test of the content store, in cache blobs and temporary.
+        """
+        blobs = Cache(tmp_path / "cache").blobs()
+        store = ContentStore(blobs)
+        store.put("ab12", "<p>a</p>")
+        store.put("cd34", "")
+
+        assert "ab12" in store
+        assert "ef56" not in store
+        assert store.loader("ab12")() == "<p>a</p>"
+        assert store.get("cd34") == ""
+        assert store.loads == 2
+        store.close()
+        assert "ab12" in blobs
+
+        store = ContentStore()
+        store.put("ab12", "<p>a</p>")
+        tmp = Path(store.tmp.name)
+        assert store.get("ab12") == "<p>a</p>"
+        store.close()
+        assert not tmp.exists()
+
+    def test_unit_item_streamed_content(self):
+        """
+        Unit test of an item holding a loader, content is loaded on access.
+        """
+        load = MagicMock(return_value="<p>a</p>")
+        item = Post(Meta({"path": Path("posts/a")}), load, Path("src"), Path("b"))
+
+        assert item.loader is load
+        assert item.content == "<p>a</p>"
+        assert item.content == "<p>a</p>"
+        assert load.call_count == 2
+        assert pickle.loads(pickle.dumps(item)).content == "<p>a</p>"
+        item.content = "<p>b</p>"
+        assert item.loader is None
+
+    def test_unit_placeholders_stream(self):
+        """
+        Unit test of placeholders substituted whenever streamed content loads.
+        """
+        placeholders = Placeholders({"{{siteurl}}": "siteurl"})
+        values = {"siteurl": "https://a.com"}
+        load = placeholders.stream(lambda: "{{siteurl}}/b", values)
+        values["siteurl"] = "changed"
+
+        assert load() == "https://a.com/b"
+
+
+class TestUnitStatIndex:
+    """
+    Unit tests of the stat index of source files.
+    """
+
+    def test_unit_stat_index(self, tmp_path):
+        """
+        Unit test of hashes reused while the stat of a file is unchanged.
+        """
+        (tmp_path / "a.md").write_text("a")
+        document = {}
+        index = StatIndex(document)
+        digest = index.digest(tmp_path / "a.md")
+        assert digest == hashlib.sha256(b"a").hexdigest()
+        assert index.changed(tmp_path / "a.md")
+        assert index.hashed == 1
+        index.save()
+
+        index = StatIndex(document)
+        with patch("mysgen.changes.file_digest") as mock_file_digest:
+            assert index.digest(tmp_path / "a.md") == digest
+        mock_file_digest.assert_not_called()
+        assert not index.changed(tmp_path / "a.md")
+
+        (tmp_path / "a.md").write_text("b")
+        index = StatIndex(document)
+        assert index.changed(tmp_path / "a.md")
+        assert index.hashed == 1
+
+    def test_unit_stat_index_racy(self, tmp_path):
+        """
+        Unit test of files modified after the index time, always hashed.
+        """
+        (tmp_path / "a.md").write_text("a")
+        document = {}
+        index = StatIndex(document)
+        index.start = 0
+        index.digest(tmp_path / "a.md")
+        index.save()
+
+        index = StatIndex(document)
+        assert not index.changed(tmp_path / "a.md")
+        assert index.hashed == 1
+
+    def test_unit_stat_index_scan(self, tmp_path):
+        """
+        Unit test of the changed and removed files of a tree.
+        """
+        for name in ["a", "b", "c"]:
+            (tmp_path / (name + ".md")).write_text(name)
+        document = {}
+        index = StatIndex(document)
+        changed, removed = index.scan([tmp_path])
+        assert len(changed) == 3
+        assert removed == []
+        index.save()
+
+        (tmp_path / "a.md").write_text("changed")
+        (tmp_path / "b.md").unlink()
+        index = StatIndex(document)
+        changed, removed = index.scan([tmp_path])
+        assert changed == [(tmp_path / "a.md").as_posix()]
+        assert removed == [(tmp_path / "b.md").as_posix()]
+        index.save()
+        assert set(document["files"]) == {
+            (tmp_path / "a.md").as_posix(),
+            (tmp_path / "c.md").as_posix(),
+        }
+
+    def test_unit_filesystemsink_copy_unchanged(self, tmp_path):
+        """
+        Unit test of copies skipped for sources unchanged since the last build.
+        """
+        (tmp_path / "src").mkdir()
+        (tmp_path / "src/a.txt").write_text("a")
+        document = {}
+        recorded = {}
+        copies = []
+
+        def copy(build):
+            sink = FileSystemSink(tmp_path / build)
+            sink.sources = StatIndex(document)
+            sink.copies = recorded
+            sink.listeners.append(lambda path, read, digest: copies.append(path))
+            with patch("mysgen.sinks.shutil.copy2", wraps=shutil.copy2) as mock_copy:
+                sink.copy_tree(tmp_path / "src", tmp_path / build)
+            sink.sources.save()
+            return mock_copy.call_count
+
+        assert copy("build") == 1
+        assert copy("build") == 0
+        assert len(copies) == 2
+        assert (tmp_path / "build/a.txt").read_text() == "a"
+
+        shutil.copytree(tmp_path / "build", tmp_path / "old")
+        (tmp_path / "src/a.txt").write_text("b")
+        index = StatIndex(document)
+        index.changed(tmp_path / "src/a.txt")
+        index.save()
+        assert copy("build") == 1
+        assert (tmp_path / "build/a.txt").read_text() == "b"
+        assert copy("old") == 1
+        assert (tmp_path / "old/a.txt").read_text() == "b"
+
+
+class TestUnitLayout:
+    """
+    Unit tests of nested source layouts.
+    """
+
+    def test_unit_walk(self, tmp_path):
+        """
+        Unit test of the sorted walk of nested directories.
+        """
+        for name in ["b.md", "a/2.md", "a/1.md", ".hidden/c.md", "d.txt", "a/.e.md"]:
+            (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+            (tmp_path / name).write_text(name)
+        (tmp_path / "link").symlink_to(tmp_path / "a")
+
+        paths = [Path(entry.path).relative_to(tmp_path) for entry in walk(tmp_path)]
+        assert paths == [Path("b.md"), Path("d.txt"), Path("a/1.md"), Path("a/2.md")]
+        assert find_sources(tmp_path / "a") == [
+            tmp_path / "a/1.md",
+            tmp_path / "a/2.md",
+        ]
+        assert find_sources(tmp_path / "missing") == []
+
+    @pytest.mark.parametrize(
+        "template, source, expected",
+        [
+            (None, "posts/2024/05/slug", "posts/2024/05/slug"),
+            ("posts/{name}", "posts/2024/05/slug", "posts/slug"),
+            ("{type}/{dir}/{name}", "posts/slug", "posts/slug"),
+            ("{dir}/{name}", "posts/slug", "slug"),
+            ("{type}/{year}/{month}/{day}/{slug}", "posts/a/b", "posts/2024/05/06/s"),
+        ],
+    )
+    def test_unit_output_path(self, template, source, expected):
+        """
+        Unit test of output paths from templates.
+        """
+        meta = Meta({"date": datetime(2024, 5, 6), "slug": "s"})
+        assert output_path(template, "posts", Path(source), meta) == Path(expected)
+
+    def test_unit_output_path_unknown(self):
+        """
+        Unit test of an output path template with an unknown field.
+        """
+        with pytest.raises(ValueError):
+            output_path("{unknown}", "posts", Path("posts/a"), Meta())
+
+
+class TestUnitPreviews:
+    """
+    Unit tests of data previews.
+    """
+
+    def test_unit_summarize(self, tmp_path):
+        """
+        Unit test of decimation and statistics of text tables and arrays.
+        """
+        np = pytest.importorskip("numpy")
+        values = np.random.default_rng(0).normal(size=(1001, 2))
+        values[500, 0] = 50.0
+        values[7, 1] = np.nan
+        np.savetxt(tmp_path / "a.csv", values, delimiter=",", header="x,y", comments="")
+        np.save(tmp_path / "a.npy", values)
+
+        for name, columns in [("a.csv", ["x", "y"]), ("a.npy", ["0", "1"])]:
+            result = summarize(tmp_path / name, 20, chunk_rows=64)
+            assert result["rows"] == 1001
+            assert result["columns"] == columns
+            assert len(result["x"]) == len(result["min"][0]) == 10
+            assert result["x"][0] == 0
+            assert max(result["max"][0]) == 50.0
+            summary = result["summary"][columns[1]]
+            assert summary["count"] == 1000
+            assert summary["mean"] == pytest.approx(np.nanmean(values[:, 1]), 1e-5)
+            assert summary["std"] == pytest.approx(np.nanstd(values[:, 1]), 1e-5)
+            assert summary["min"] == pytest.approx(np.nanmin(values[:, 1]), 1e-5)
+
+    def test_unit_summarize_invalid(self, tmp_path):
+        """
+        Unit test of files that are not numeric tables.
+        """
+        (tmp_path / "empty.txt").write_text("")
+        (tmp_path / "text.txt").write_text("Some\nwords here\n")
+        for name in ["empty.txt", "text.txt"]:
+            with pytest.raises(ValueError):
+                summarize(tmp_path / name)
+
+            assert preview(tmp_path / name) is None
+
+    def test_unit_preview_cache(self, tmp_path):
+        """
+        Unit test of previews cached by source hash.
+        """
+        (tmp_path / "a.tsv").write_text("1\t2\n3\t4\n")
+        derivatives = {}
+        with patch("mysgen.previews.summarize", wraps=summarize) as mock_summarize:
+            first = preview(tmp_path / "a.tsv", 10, "digest", derivatives)
+            second = preview(tmp_path / "a.tsv", 10, "digest", derivatives)
+            preview(tmp_path / "a.tsv", 20, "digest", derivatives)
+
+        assert first == second
+        assert json.loads(first)["min"] == [[1.0, 3.0], [2.0, 4.0]]
+        assert mock_summarize.call_count == 2
+        assert len(derivatives) == 2